@@ -1,140 +1,402 @@
 import os
-import subprocess, traceback
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, flash
+import traceback
+import uuid
+import hashlib
+import threading
+import time
+from flask import Blueprint, Flask, render_template, request, redirect, url_for, send_file, send_from_directory, flash, jsonify, abort, Response, stream_with_context
 from werkzeug.utils import secure_filename
-import ffmpeg
-import requests
-from datetime import datetime, timedelta
+from werkzeug.exceptions import RequestEntityTooLarge
+from datetime import datetime
 import json
 from config import Config
-from gtts import gTTS
 import shutil
-from PIL import Image
+import metrics
+from jobs import JobQueue, DONE, FAILED, QUEUED, current_job
+from governor import BATCH, DRAFT, FINAL, ResourceGovernor, encode_slots, estimate_wait, physical_memory
+from spool import SpoolQueue
+from janitor import DiskJanitor
+from batch import REEL_ID_PREFIX, BatchRun, ManifestError, active_reels, load_manifest
+from progress import RenderCancelled, RenderProgress, run_with_progress
+from disk_cache import DiskCache, file_digest, link_or_copy
+from uploads import receive_upload, FilePolicy, UploadRejected
+# The media (ffmpeg, PIL) and TTS (gTTS, requests) stacks are imported inside the
+# functions that use them: importing this module stays cheap for every worker and CLI
 
 
-app = Flask(__name__)
-app.config.from_object(Config)
-app.secret_key = 'your_secret_key_here'  # Required for flash messages
+bp = Blueprint('reels', __name__)
 
-# Ensure upload and output directories exist
-os.makedirs(app.config['UPLOAD_AUDIO_FOLDER'], exist_ok=True)
-os.makedirs(app.config['UPLOAD_TEXT_FOLDER'], exist_ok=True)
-os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
+# Set up by create_app(); worker threads reach them as module globals
+app = None
+image_cache = None  # Preprocessed images, shared by all reels and keyed by source content
+segment_cache = None  # Encoded per-image video segments, keyed by image, length, fades and encoder settings
+tts_cache = None  # Synthesized speech, keyed by text, provider and voice parameters
+beat_cache = None  # Beat analyses of audio files, keyed by audio content
+governor = None  # Caps concurrent encodes by cores and memory; drafts get free slots first
+render_queue = None  # Renders run here instead of inside the POST handlers, or in worker.py processes
+janitor = None  # Deletes reels nobody looked at recently and keeps all of them within a disk budget
 
-def validate_file_extension(filename, allowed_extensions):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
+# Batch runs started through the API, by batch ID
+batches = {}
 
-@app.route('/')
+gTTS = None  # gtts.gTTS, imported on first use
+
+def create_app(config_object=Config, start_janitor=True):
+    """Build the Flask app and the render services its handlers and workers share.
+
+    Folders are created here rather than at import, and the janitor's first
+    sweep runs on its own thread, so startup never walks the reel folders.
+    """
+    global app, image_cache, segment_cache, tts_cache, beat_cache, governor, render_queue, janitor
+    flask_app = Flask(__name__)
+    flask_app.config.from_object(config_object)
+    flask_app.secret_key = 'your_secret_key_here'  # Required for flash messages
+    flask_app.register_blueprint(bp)
+    config = flask_app.config
+
+    # Ensure upload and output directories exist
+    os.makedirs(config['UPLOAD_AUDIO_FOLDER'], exist_ok=True)
+    os.makedirs(config['UPLOAD_TEXT_FOLDER'], exist_ok=True)
+    os.makedirs(config['OUTPUT_FOLDER'], exist_ok=True)
+
+    image_cache = DiskCache(config['IMAGE_CACHE_FOLDER'],
+                            max_bytes=config['IMAGE_CACHE_MAX_BYTES'],
+                            suffix='.jpg')
+    segment_cache = DiskCache(config['SEGMENT_CACHE_FOLDER'],
+                              max_bytes=config['SEGMENT_CACHE_MAX_BYTES'],
+                              suffix='.mp4')
+    tts_cache = DiskCache(config['TTS_CACHE_FOLDER'],
+                          max_bytes=config['TTS_CACHE_MAX_BYTES'],
+                          max_age_seconds=config['TTS_CACHE_MAX_AGE_DAYS'] * 24 * 3600,
+                          suffix='.mp3')
+    beat_cache = DiskCache(config['BEAT_CACHE_FOLDER'],
+                           max_bytes=config['BEAT_CACHE_MAX_BYTES'],
+                           suffix='.json')
+
+    governor = ResourceGovernor(
+        config['MAX_CONCURRENT_ENCODES'] or encode_slots(os.cpu_count() or 1, config['ENCODE_THREADS'],
+                                                         physical_memory(), config['ENCODE_MEMORY_BYTES']),
+        threads_per_encode=min(config['ENCODE_THREADS'], os.cpu_count() or 1),
+    )
+
+    # Spool mode: worker.py processes on any host sharing the spool, upload and output folders render
+    if config['RENDER_MODE'] == 'spool':
+        render_queue = SpoolQueue(config['SPOOL_FOLDER'],
+                                  lease_seconds=config['SPOOL_LEASE_SECONDS'],
+                                  max_attempts=config['SPOOL_MAX_ATTEMPTS'],
+                                  retention_hours=config['JOB_RETENTION_HOURS'])
+    else:
+        render_queue = JobQueue(max_workers=config['RENDER_WORKERS'],
+                                retention_hours=config['JOB_RETENTION_HOURS'])
+
+    if janitor is not None:
+        janitor.stop()
+    janitor = DiskJanitor(
+        output_folder=config['OUTPUT_FOLDER'],
+        upload_folders=[config['UPLOAD_AUDIO_FOLDER'], config['UPLOAD_TEXT_FOLDER'],
+                        config['RENDITION_FOLDER']],  # Every folder holding one subfolder per reel
+        stage_folder=config['STAGE_FOLDER'],
+        scratch_folders=[os.path.join(config['OUTPUT_FOLDER'], 'work'),
+                         os.path.join(config['OUTPUT_FOLDER'], 'cleaned_images')],  # Left over from older versions
+        max_bytes=config['REEL_DISK_BUDGET_BYTES'],
+        max_age_seconds=config['REEL_MAX_AGE_HOURS'] * 3600,
+        interval_seconds=config['JANITOR_INTERVAL_SECONDS'],
+        in_flight_fn=in_flight_reels,
+        caches=[image_cache, segment_cache, tts_cache, beat_cache],
+        grace_seconds=config['JANITOR_GRACE_SECONDS'],
+        max_age_by_prefix={REEL_ID_PREFIX: config['BATCH_REEL_MAX_AGE_HOURS'] * 3600},
+    )
+    if start_janitor and config['JANITOR_ENABLED']:
+        janitor.start()
+
+    app = flask_app
+    return flask_app
+
+def in_flight_reels():
+    """Reels with a queued or running job, or being rendered by a batch"""
+    return render_queue.in_flight_reels() | active_reels(app.config['BATCH_MARKER_FOLDER'])
+
+# Read from the live objects whenever /metrics is scraped
+metrics.Callback('reel_cache_requests_total', 'Shared cache lookups by cache and result', 'counter',
+                 lambda: {(name, result): cache.stats()[result]
+                          for name, cache in (('images', image_cache), ('segments', segment_cache), ('tts', tts_cache),
+                                              ('beats', beat_cache))
+                          for result in ('hits', 'misses')},
+                 ['cache', 'result'])
+metrics.Callback('reel_jobs_in_flight', 'Reels with a queued or running render', 'gauge',
+                 lambda: {(): len(in_flight_reels())})
+metrics.Callback('reel_encode_slots_active', 'Renders holding an encode slot', 'gauge',
+                 lambda: {(): governor.stats()['active']})
+metrics.Callback('reel_encode_slots_waiting', 'Renders waiting for an encode slot, by priority', 'gauge',
+                 lambda: {(name,): count for name, count in governor.stats()['waiting'].items()},
+                 ['priority'])
+metrics.Callback('reel_janitor_reclaimed_bytes_total', 'Bytes deleted by the disk janitor', 'counter',
+                 lambda: {(): janitor.bytes_reclaimed})
+
+AUDIO_EXTENSIONS = ['mp3', 'wav', 'ogg', 'm4a']
+IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif']
+
+def audio_save_name(filename):
+    """Save audio as audio.<ext>, keeping the (sanitized) extension"""
+    audio_filename = secure_filename(filename)
+    audio_ext = audio_filename.rsplit('.', 1)[1].lower() if '.' in audio_filename else ''
+    return f"audio.{audio_ext}" if audio_ext else "audio"
+
+def image_save_name(index, filename):
+    img_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    return f"image_{index}.{img_ext}" if img_ext else f"image_{index}"
+
+def receive_reel_upload(policies):
+    """Stream the request body to disk; returns (upload, None) or (None, error message)"""
+    started = time.perf_counter()
+    try:
+        upload = receive_upload(request.stream, request.content_type, policies)
+    except UploadRejected as e:
+        print(f"❌ Upload rejected: {e}")
+        metrics.failures.inc(stage='upload')
+        return None, str(e)
+    except RequestEntityTooLarge:
+        metrics.failures.inc(stage='upload')
+        limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+        return None, f'Upload is larger than the {limit_mb}MB limit'
+    metrics.upload_seconds.observe(time.perf_counter() - started, kind=request.endpoint)
+    metrics.upload_bytes.inc(upload.bytes_received, kind=request.endpoint)
+    print(f"📦 Received {upload.bytes_received / (1024 * 1024):.1f}MB")
+    return upload, None
+
+def new_reel_id():
+    """Timestamped reel ID with a random suffix so concurrent uploads never share a folder"""
+    return f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+def wants_json():
+    return request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html
+
+def queued_response(job):
+    """Answer a render submission: 202 + job info for API clients, preview redirect for browsers"""
+    if wants_json():
+        payload = job.to_dict()
+        payload['status_url'] = url_for('reels.job_status', job_id=job.job_id)
+        payload['preview_url'] = url_for('reels.preview', reel_id=job.reel_id)
+        return jsonify(payload), 202
+    flash('Reel queued for rendering', 'success')
+    return redirect(url_for('reels.preview', reel_id=job.reel_id))
+
+def run_render_job(reel_id, config, draft=False, speech_ready=False):
+    """Worker-side body of a render job: synthesize speech for text reels, then render.
+
+    A draft job queues the final-quality render of the same reel once the
+    draft is out.
+    """
+    # Published on the job so /jobs/<job_id> and the progress stream can report it
+    progress = RenderProgress(sum(config['durations']))
+    job = current_job()
+    if job is not None:
+        job.progress = progress
+
+    if config['type'] == 'text_input' and not speech_ready:
+        progress.set_phase('speech')
+        print("\n=== Generating audio ===")
+        generate_audio_from_text(config['text'], config['audio_path'])
+        print("Audio generated at:", config['audio_path'])
+        if not os.path.exists(config['audio_path']):
+            raise RuntimeError("Audio file was not created")
+    resolve_auto_durations(reel_id, config, progress)
+
+    progress.set_phase('waiting')
+    with governor.slot(DRAFT if draft else FINAL):
+        print("\n=== Generating reel ===")
+        output_path = os.path.normpath(generate_reel(reel_id, config, draft=draft, progress=progress))
+    print("Generated output path:", output_path)
+    if not os.path.exists(output_path):
+        raise RuntimeError("Output video was not created")
+    if draft:
+        job = queue_render(reel_id, config, speech_ready=True)
+        print(f"📝 Draft ready, final render queued as job {job.job_id}")
+    return output_path
+
+def run_renditions_job(reel_id, config):
+    """Worker-side body of a renditions job"""
+    progress = RenderProgress(sum(config['durations']))
+    job = current_job()
+    if job is not None:
+        job.progress = progress
+    progress.set_phase('waiting')
+    with governor.slot(BATCH):
+        return generate_renditions(reel_id, config, progress=progress)
+
+def run_spooled_job(reel_id, kind, payload):
+    """Entry point of worker.py processes for a job taken from the spool"""
+    if kind == 'renditions':
+        return run_renditions_job(reel_id, payload['config'])
+    return run_render_job(reel_id, payload['config'], draft=payload['draft'], speech_ready=payload['speech_ready'])
+
+def queue_render(reel_id, config, draft=False, speech_ready=False, kind='render'):
+    """Hand a render job to the in-process pool, or spool it for the worker processes"""
+    if isinstance(render_queue, SpoolQueue):
+        priority = BATCH if kind == 'renditions' else DRAFT if draft else FINAL
+        return render_queue.submit(reel_id, {'config': config, 'draft': draft, 'speech_ready': speech_ready},
+                                   kind=kind, priority=priority)
+    if kind == 'renditions':
+        return render_queue.submit(reel_id, run_renditions_job, reel_id, config, kind=kind)
+    return render_queue.submit(reel_id, run_render_job, reel_id, config,
+                               draft=draft, speech_ready=speech_ready, kind=kind)
+
+def submit_render(reel_id, config):
+    """Queue the render of a new reel, as a draft followed by the final render if requested"""
+    if config.get('draft_first') and config['profile'] != app.config['DRAFT_PROFILE']:
+        return queue_render(reel_id, config, draft=True, kind='draft')
+    return queue_render(reel_id, config)
+
+def admission_retry_after():
+    """Seconds a client should wait before submitting, or None while a new render would start in time.
+
+    The wait is estimated from the jobs queued or running and how long
+    recent renders took: encode slot hold times here, or whole jobs when
+    worker processes render from the spool (one job at a time each).
+    """
+    jobs = render_queue.jobs()
+    ahead = [job for job in jobs if not job.finished]
+    if isinstance(render_queue, SpoolQueue):
+        if not any(job.state == QUEUED for job in ahead):
+            return None  # Every job was claimed, so a worker is free or about to be
+        capacity = max(1, len(ahead) - sum(1 for job in ahead if job.state == QUEUED))
+        finished = sorted((job for job in jobs if job.state == DONE and job.started_at),
+                          key=lambda job: job.finished_at)[-20:]
+        recent = [(job.finished_at - job.started_at).total_seconds() for job in finished]
+    else:
+        capacity = governor.slots
+        recent = governor.recent_seconds()
+    wait = estimate_wait(len(ahead), capacity, recent, app.config['DEFAULT_RENDER_SECONDS'])
+    if wait <= app.config['MAX_QUEUE_WAIT_SECONDS']:
+        return None
+    return int(wait) + 1
+
+def busy_response():
+    """503 with Retry-After when a new render could not start within MAX_QUEUE_WAIT_SECONDS, else None"""
+    retry_after = admission_retry_after()
+    if retry_after is None:
+        return None
+    print(f"🚦 Render queue saturated, asking the client to retry in {retry_after}s")
+    metrics.failures.inc(stage='admission')
+    message = f'The renderer is busy, please try again in {retry_after} seconds'
+    headers = {'Retry-After': str(retry_after)}
+    if wants_json():
+        return jsonify({'error': message, 'retry_after': retry_after}), 503, headers
+    return message, 503, headers
+
+def read_profile_choice(form):
+    """Render profile and draft-first flag from a submitted form; profile is None if unknown"""
+    profile = form.get('profile') or app.config['DEFAULT_RENDER_PROFILE']
+    if profile not in app.config['RENDER_PROFILES']:
+        profile = None
+    # The form sends a hidden "0" before the checkbox, so the last value wins
+    values = form.getlist('draft')
+    draft_first = values[-1].lower() in ('1', 'true', 'on', 'yes') if values else app.config['DRAFT_FIRST']
+    return profile, draft_first
+
+def read_duration_mode(form):
+    """'auto' when the form asks for beat-synced durations (typed durations become relative weights)"""
+    values = form.getlist('duration_mode')
+    return 'auto' if values and values[-1] == 'auto' else 'manual'
+
+def render_form(template):
+    return render_template(template,
+                           profiles=app.config['RENDER_PROFILES'],
+                           default_profile=app.config['DEFAULT_RENDER_PROFILE'],
+                           draft_profile=app.config['DRAFT_PROFILE'],
+                           draft_first=app.config['DRAFT_FIRST'])
+
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/audio-input', methods=['GET', 'POST'])
+@bp.route('/audio-input', methods=['GET', 'POST'])
 def audio_input():
     if request.method == 'POST':
+        busy = busy_response()
+        if busy is not None:
+            return busy
         try:
-            # Debug: Print form data
-            print("\n=== Received form data ===")
-            print("Audio file:", request.files.get('audio').filename if 'audio' in request.files else None)
-            print("Durations:", request.form.getlist('durations'))
-            print("Files:", [f.filename for f in request.files.getlist('images') if f.filename])
-
-            # Validate inputs
-            if 'audio' not in request.files:
-                flash('No audio file uploaded', 'error')
-                return redirect(request.url)
-                
-            audio_file = request.files['audio']
-            if audio_file.filename == '':
-                flash('No selected audio file', 'error')
-                return redirect(request.url)
-                
-            if not validate_file_extension(audio_file.filename, ['mp3', 'wav', 'ogg', 'm4a']):  # Added m4a support
-                flash('Invalid audio file type', 'error')
-                return redirect(request.url)
-                
-            if 'images' not in request.files:
-                flash('No images uploaded', 'error')
-                return redirect(request.url)
-                
-            images = request.files.getlist('images')
-            if not any(img.filename != '' for img in images):
-                flash('No selected images', 'error')
-                return redirect(request.url)
-
             # Create unique folder for this reel
-            reel_id = datetime.now().strftime("%Y%m%d%H%M%S")
+            reel_id = new_reel_id()
             reel_folder = os.path.join(app.config['UPLOAD_AUDIO_FOLDER'], reel_id)
             images_folder = os.path.join(reel_folder, 'images')
             os.makedirs(images_folder, exist_ok=True)
             print("\n=== Created directories ===")
             print("Reel folder:", reel_folder)
             print("Images folder:", images_folder)
-            
-            # Save audio file with proper extension handling
-            audio_filename = secure_filename(audio_file.filename)
-            audio_ext = audio_filename.rsplit('.', 1)[1].lower() if '.' in audio_filename else ''
-            audio_save_name = f"audio.{audio_ext}" if audio_ext else "audio"
-            audio_path = os.path.join(reel_folder, audio_save_name)
-            
-            print("\n=== Saving audio ===")
-            try:
-                audio_file.save(audio_path)
-                print("Audio saved at:", audio_path)
-                if not os.path.exists(audio_path):
-                    raise RuntimeError("Audio file was not created")
-            except Exception as e:
-                print("Failed to save audio:", str(e))
-                raise
-            
-            # Save images with validation
-            image_paths = []
-            print("\n=== Processing images ===")
-            for i, image in enumerate(images):
-                if image.filename == '':
-                    continue
-                    
-                if not validate_file_extension(image.filename, ['jpg', 'jpeg', 'png', 'gif', 'JPG']):  # Added uppercase JPG
-                    print(f"Skipping invalid file: {image.filename}")
-                    continue
-                
-                img_ext = image.filename.rsplit('.', 1)[1].lower() if '.' in image.filename else ''
-                img_save_name = f"image_{i}.{img_ext}" if img_ext else f"image_{i}"
-                img_path = os.path.join(images_folder, img_save_name)
-                
-                image.save(img_path)
-                print(f"Saved image: {img_path}")
-                
-                # Store path with forward slashes for consistency
-                stored_path = img_path.replace('\\', '/')
-                if not os.path.exists(img_path):
-                    raise RuntimeError(f"Failed to save image: {img_path}")
-                image_paths.append(stored_path)
-                
-            if not image_paths:
-                flash('No valid images uploaded', 'error')
+
+            def reject(message):
+                shutil.rmtree(reel_folder, ignore_errors=True)
+                flash(message, 'error')
                 return redirect(request.url)
+
+            # Stream the body to disk, validating every file as its first chunks arrive
+            print("\n=== Receiving upload ===")
+            upload, error = receive_reel_upload({
+                'audio': FilePolicy('audio', AUDIO_EXTENSIONS, app.config['MAX_AUDIO_UPLOAD_BYTES'],
+                                    lambda i, filename: os.path.join(reel_folder, audio_save_name(filename))),
+                'images': FilePolicy('image', IMAGE_EXTENSIONS, app.config['MAX_IMAGE_UPLOAD_BYTES'],
+                                     lambda i, filename: os.path.join(images_folder, image_save_name(i, filename)),
+                                     skip_invalid_extension=True,
+                                     max_pixels=app.config['MAX_IMAGE_PIXELS']),
+            })
+            if error:
+                return reject(error)
+
+            # Debug: Print form data
+            print("\n=== Received form data ===")
+            print("Audio file:", [f.filename for f in upload.files.getlist('audio')])
+            print("Durations:", upload.form.getlist('durations'))
+            print("Files:", [f.filename for f in upload.files.getlist('images')])
+
+            # Validate inputs
+            if 'audio' not in upload.seen:
+                return reject('No audio file uploaded')
+            if 'audio' not in upload.files:
+                return reject('No selected audio file')
+            audio_path = upload.files['audio'].path
+            print("Audio saved at:", audio_path)
+
+            if 'images' not in upload.seen:
+                return reject('No images uploaded')
+            if not any(name != '' for name in upload.seen['images']):
+                return reject('No selected images')
+
+            # Store paths with forward slashes for consistency
+            saved_images = upload.files.getlist('images')
+            image_paths = [saved.path.replace('\\', '/') for saved in saved_images]
+            if not image_paths:
+                return reject('No valid images uploaded')
             
             # Validate durations
-            durations = request.form.getlist('durations')
+            durations = upload.form.getlist('durations')
             if len(durations) != len(image_paths):
-                flash('Number of durations does not match number of images', 'error')
-                return redirect(request.url)
+                return reject('Number of durations does not match number of images')
             
             try:
                 durations = [float(d) for d in durations]
                 if any(d <= 0 for d in durations):
                     raise ValueError("Durations must be positive")
             except ValueError:
-                flash('Invalid duration values', 'error')
-                return redirect(request.url)
+                return reject('Invalid duration values')
+
+            profile, draft_first = read_profile_choice(upload.form)
+            if profile is None:
+                return reject('Unknown render profile')
             
             # Store paths with forward slashes in config
             config = {
                 'image_paths': image_paths,
+                'image_sha256': [saved.sha256 for saved in saved_images],
                 'audio_path': audio_path.replace('\\', '/'),
                 'durations': durations,
-                'type': 'audio_input'
+                'type': 'audio_input',
+                'profile': profile,
+                'draft_first': draft_first
             }
+            if read_duration_mode(upload.form) == 'auto':
+                config.update(duration_mode='auto', duration_weights=durations)
             
             config_path = os.path.join(reel_folder, 'config.json')
             with open(config_path, 'w') as f:
@@ -143,23 +405,9 @@ def audio_input():
             print("Config path:", config_path)
             print("Config content:", json.dumps(config, indent=2))
             
-            # Generate reel
-            print("\n=== Generating reel ===")
-            try:
-                output_path = generate_reel(reel_id, config)
-                output_path = os.path.normpath(output_path)  # Normalize path
-                print("Generated output path:", output_path)
-                
-                if not os.path.exists(output_path):
-                    raise RuntimeError("Output video was not created")
-                
-                print("Reel successfully generated!")
-                flash('Reel successfully created!', 'success')
-                return redirect(url_for('preview', reel_id=reel_id))
-            except Exception as e:
-                print("Reel generation failed:", str(e))
-                print(traceback.format_exc())
-                raise
+            # Hand the render to the worker pool and answer immediately
+            job = submit_render(reel_id, config)
+            return queued_response(job)
             
         except Exception as e:
             print("\n=== ERROR ===")
@@ -167,94 +415,88 @@ def audio_input():
             flash(f'Error: {str(e)}', 'error')
             return redirect(request.url)
     
-    return render_template('audio_input.html')
+    return render_form('audio_input.html')
 
-@app.route('/text-input', methods=['GET', 'POST'])
+@bp.route('/text-input', methods=['GET', 'POST'])
 def text_input():
     if request.method == 'POST':
+        busy = busy_response()
+        if busy is not None:
+            return busy
         try:
+            # Create unique folder for this reel
+            reel_id = new_reel_id()
+            reel_folder = os.path.join(app.config['UPLOAD_TEXT_FOLDER'], reel_id)
+            images_folder = os.path.join(reel_folder, 'images')
+            os.makedirs(images_folder, exist_ok=True)
+
+            def reject(message):
+                shutil.rmtree(reel_folder, ignore_errors=True)
+                flash(message, 'error')
+                return redirect(request.url)
+
+            # Stream the body to disk, validating every image as its first chunks arrive
+            upload, error = receive_reel_upload({
+                'images': FilePolicy('image', IMAGE_EXTENSIONS, app.config['MAX_IMAGE_UPLOAD_BYTES'],
+                                     lambda i, filename: os.path.join(images_folder, f"{i}_{secure_filename(filename)}"),
+                                     skip_invalid_extension=True,
+                                     max_pixels=app.config['MAX_IMAGE_PIXELS']),
+            })
+            if error:
+                return reject(error)
+
             # Debug: Print form data
             print("\n=== Received form data ===")
-            print("Text:", request.form.get('text'))
-            print("Durations:", request.form.getlist('durations'))
-            print("Files:", [f.filename for f in request.files.getlist('images') if f.filename])
+            print("Text:", upload.form.get('text'))
+            print("Durations:", upload.form.getlist('durations'))
+            print("Files:", [f.filename for f in upload.files.getlist('images')])
 
             # Validate text input
-            text = request.form.get('text', '').strip()
+            text = upload.form.get('text', '').strip()
             if not text:
-                flash('No text provided', 'error')
-                return redirect(request.url)
+                return reject('No text provided')
                 
-            if 'images' not in request.files:
-                flash('No images uploaded', 'error')
-                return redirect(request.url)
-                
-            images = request.files.getlist('images')
-            if not any(img.filename != '' for img in images):
-                flash('No selected images', 'error')
-                return redirect(request.url)
-
-            # Create unique folder for this reel
-            reel_id = datetime.now().strftime("%Y%m%d%H%M%S")
-            reel_folder = os.path.join(app.config['UPLOAD_TEXT_FOLDER'], reel_id)
-            os.makedirs(reel_folder, exist_ok=True)
-            os.makedirs(os.path.join(reel_folder, 'images'), exist_ok=True)
+            if 'images' not in upload.seen:
+                return reject('No images uploaded')
+            if not any(name != '' for name in upload.seen['images']):
+                return reject('No selected images')
             
-            # Generate audio from text
+            # Audio is synthesized by the render job, not in the request
             audio_path = os.path.join(reel_folder, 'generated_audio.mp3')
-            print("\n=== Generating audio ===")
-            try:
-                generate_audio_from_text(text, audio_path)
-                print("Audio generated at:", audio_path)
-                if not os.path.exists(audio_path):
-                    raise RuntimeError("Audio file was not created")
-            except Exception as e:
-                print("Audio generation failed:", str(e))
-                raise
             
-            # Save images with validation
-            image_paths = []
-            print("\n=== Processing images ===")
-            for i, image in enumerate(images):
-                if image.filename == '':
-                    continue
-                if not validate_file_extension(image.filename, ['jpg', 'jpeg', 'png', 'gif']):
-                    print(f"Skipping invalid file: {image.filename}")
-                    continue
-                
-                img_filename = secure_filename(image.filename)
-                img_path = os.path.join(reel_folder, 'images', f"{i}_{img_filename}")
-                image.save(img_path)
-                print(f"Saved image: {img_path}")
-                if not os.path.exists(img_path):
-                    raise RuntimeError(f"Failed to save image: {img_path}")
-                image_paths.append(img_path)
-                
+            saved_images = upload.files.getlist('images')
+            image_paths = [saved.path for saved in saved_images]
             if not image_paths:
-                flash('No valid images uploaded', 'error')
-                return redirect(request.url)
+                return reject('No valid images uploaded')
             
             # Validate durations
-            durations = request.form.getlist('durations')
+            durations = upload.form.getlist('durations')
             if len(durations) != len(image_paths):
-                flash('Number of durations does not match number of images', 'error')
-                return redirect(request.url)
+                return reject('Number of durations does not match number of images')
             
             try:
                 durations = [float(d) for d in durations]
                 if any(d <= 0 for d in durations):
                     raise ValueError("Durations must be positive")
             except ValueError:
-                flash('Invalid duration values', 'error')
-                return redirect(request.url)
+                return reject('Invalid duration values')
+
+            profile, draft_first = read_profile_choice(upload.form)
+            if profile is None:
+                return reject('Unknown render profile')
             
             config = {
                 'image_paths': image_paths,
+                'image_sha256': [saved.sha256 for saved in saved_images],
                 'audio_path': audio_path,
                 'durations': durations,
                 'type': 'text_input',
-                'text': text
+                'text': text,
+                'profile': profile,
+                'draft_first': draft_first
             }
+            if read_duration_mode(upload.form) == 'auto':
+                config.update(duration_mode='auto', duration_weights=durations)
             
             config_path = os.path.join(reel_folder, 'config.json')
             with open(config_path, 'w') as f:
@@ -262,21 +504,9 @@ def text_input():
             print("\n=== Saved config ===")
             print("Config path:", config_path)
             
-            # Generate reel
-            print("\n=== Generating reel ===")
-            try:
-                output_path = generate_reel(reel_id, config)
-                print("Expected output path:", output_path)
-                
-                if not os.path.exists(output_path):
-                    raise RuntimeError("Output video was not created")
-                
-                print("Reel successfully generated!")
-                flash('Reel successfully created!', 'success')
-                return redirect(url_for('preview', reel_id=reel_id))
-            except Exception as e:
-                print("Reel generation failed:", str(e))
-                raise
+            # Hand TTS and the render to the worker pool and answer immediately
+            job = submit_render(reel_id, config)
+            return queued_response(job)
             
         except Exception as e:
             print("\n=== ERROR ===")
@@ -284,18 +514,98 @@ def text_input():
             flash(f'Error: {str(e)}', 'error')
             return redirect(request.url)
     
-    return render_template('text_input.html')
+    return render_form('text_input.html')
+
+@bp.route('/jobs')
+def list_jobs():
+    return jsonify([job.to_dict() for job in render_queue.jobs()])
+
+@bp.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = render_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@bp.route('/reels/<reel_id>/progress')
+def reel_progress(reel_id):
+    """Server-Sent Events stream of the reel's render progress.
+
+    Follows the reel's latest job (a draft hands over to its final render)
+    and ends once that job has finished.
+    """
+    if render_queue.latest_for_reel(reel_id) is None:
+        return jsonify({'error': 'No render for this reel'}), 404
+
+    def events():
+        last, last_sent = None, time.monotonic()
+        while True:
+            job = render_queue.latest_for_reel(reel_id)
+            if job is None:
+                return
+            payload = job.to_dict()
+            if payload != last:
+                yield f"event: progress\ndata: {json.dumps(payload)}\n\n"
+                last, last_sent = payload, time.monotonic()
+                if job.finished:
+                    yield f"event: end\ndata: {json.dumps({'state': job.state})}\n\n"
+                    return
+            elif time.monotonic() - last_sent > 15:
+                yield ": keep-alive\n\n"  # Keeps proxies from closing an idle stream
+                last_sent = time.monotonic()
+            time.sleep(app.config['PROGRESS_INTERVAL_SECONDS'])
+
+    return Response(stream_with_context(events()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/janitor-stats')
+def janitor_stats():
+    return jsonify(janitor.stats())
+
+@bp.route('/cache-stats')
+def cache_stats():
+    return jsonify({'tts': tts_cache.stats(), 'segments': segment_cache.stats()})
 
-@app.route('/preview/<reel_id>')
+@bp.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render_latest(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/preview/<reel_id>')
 def preview(reel_id):
-    # Verify the reel exists
     output_path = os.path.join(app.config['OUTPUT_FOLDER'], f"{reel_id}.mp4")
+
+    # Wait briefly on the render job, then fall back to a polling progress page
+    job = render_queue.latest_for_reel(reel_id)
+    if job is not None and job.kind == 'renditions':
+        job = None  # The reel itself is finished; renditions are fetched separately
+    if job is not None and not job.finished:
+        job.wait(timeout=app.config['PREVIEW_WAIT_SECONDS'])
+    draft_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename(reel_id, draft=True))
+    if job is not None and not job.finished and job.kind == 'render' and os.path.exists(draft_path):
+        # The draft is out and the final render is running: show the draft meanwhile
+        return render_template('preview.html',
+                             reel_id=reel_id,
+                             video_url=media_url(reel_id, draft=True),
+                             download_url=url_for('reels.download', reel_id=reel_id, draft=1),
+                             status_url=url_for('reels.job_status', job_id=job.job_id))
+    if job is not None and not job.finished:
+        return render_template('rendering.html',
+                             reel_id=reel_id,
+                             job=job,
+                             status_url=url_for('reels.job_status', job_id=job.job_id),
+                             progress_url=url_for('reels.reel_progress', reel_id=reel_id))
+    if job is not None and job.state == FAILED:
+        flash(f'Error: {job.error}', 'error')
+        return redirect(url_for('reels.index'))
+
+    # No job known (e.g. after a restart): verify the reel exists
     if not os.path.exists(output_path):
         flash('Reel not found', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('reels.index'))
     
-    # Create a URL-accessible path for the video
-    video_url = url_for('download', reel_id=reel_id)
+    # Stream from the media endpoint; the download button gets the attachment
+    video_url = media_url(reel_id)
 
     paths_to_update = [
         os.path.join(app.config['OUTPUT_FOLDER'], f"{reel_id}.mp4"),
@@ -309,279 +619,865 @@ def preview(reel_id):
     
     return render_template('preview.html', 
                          reel_id=reel_id,
-                         video_url=video_url)
+                         video_url=video_url,
+                         download_url=url_for('reels.download', reel_id=reel_id))
 
-@app.route('/download/<reel_id>')
+@bp.route('/download/<reel_id>')
 def download(reel_id):
-    output_path = os.path.join(app.config['OUTPUT_FOLDER'], f"{reel_id}.mp4")
+    filename = output_filename(reel_id, draft=request.args.get('draft') == '1')
+    output_path = os.path.join(app.config['OUTPUT_FOLDER'], filename)
     if not os.path.exists(output_path):
         flash('Reel not found', 'error')
-        return redirect(url_for('index'))
+        return redirect(url_for('reels.index'))
     
     os.utime(output_path, None)
     return send_from_directory(
-        app.config['OUTPUT_FOLDER'],
-        f"{reel_id}.mp4",
-        as_attachment=True
+        os.path.abspath(app.config['OUTPUT_FOLDER']),
+        filename,
+        as_attachment=True,
+        etag=media_version(output_path)
+    )
+
+def media_version(path):
+    """Identity of a rendered file. Renders publish a new file (os.replace), so inode
+    and size change with the content, while preview/download touching the mtime does not"""
+    st = os.stat(path)
+    return f"{st.st_ino:x}-{st.st_size:x}"
+
+def media_url(reel_id, draft=False):
+    """Streaming URL pinned to the current render, so it can be cached as immutable"""
+    output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename(reel_id, draft=draft))
+    return url_for('reels.media', reel_id=reel_id, v=media_version(output_path), draft=1 if draft else None)
+
+@bp.route('/media/<reel_id>.mp4')
+def media(reel_id):
+    """Inline MP4 for the <video> tag: byte ranges (206), ETag/Last-Modified
+    revalidation and, for versioned URLs, year-long immutable caching"""
+    filename = output_filename(reel_id, draft=request.args.get('draft') == '1')
+    if secure_filename(filename) != filename:
+        abort(404)
+    output_path = os.path.abspath(os.path.join(app.config['OUTPUT_FOLDER'], filename))
+    if not os.path.exists(output_path):
+        abort(404)
+
+    version = media_version(output_path)
+    pinned = request.args.get('v') == version
+    # send_file answers Range and If-None-Match/If-Modified-Since itself, and hands
+    # the file to the server's sendfile (wsgi.file_wrapper, or X-Sendfile with USE_X_SENDFILE)
+    response = send_file(output_path,
+                         mimetype='video/mp4',
+                         conditional=True,
+                         etag=version,
+                         max_age=app.config['MEDIA_MAX_AGE'] if pinned else 0)
+    response.accept_ranges = 'bytes'
+    if pinned:
+        response.cache_control.immutable = True
+    return response
+
+def find_reel(reel_id):
+    """Upload folder and saved config of a reel, or (None, None) if it does not exist"""
+    if secure_filename(reel_id) != reel_id:
+        return None, None
+    for folder in (app.config['UPLOAD_AUDIO_FOLDER'], app.config['UPLOAD_TEXT_FOLDER']):
+        config_path = os.path.join(folder, reel_id, 'config.json')
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                return os.path.join(folder, reel_id), json.load(f)
+    return None, None
+
+@bp.route('/reels/<reel_id>/audio', methods=['POST'])
+def replace_audio(reel_id):
+    """Swap the soundtrack of a rendered reel: a new audio file, or new text for text reels.
+
+    The video stream of the last render is reused, so the job only encodes
+    the new audio track and remuxes.
+    """
+    def reject(message, status=400):
+        if wants_json():
+            return jsonify({'error': message}), status
+        flash(message, 'error')
+        return redirect(url_for('reels.preview', reel_id=reel_id))
+
+    reel_folder, config = find_reel(reel_id)
+    if reel_folder is None:
+        return reject('Reel not found', 404)
+    if reel_id in in_flight_reels():
+        return reject('Reel is still rendering', 409)
+    busy = busy_response()
+    if busy is not None:
+        return busy
+
+    if config['type'] == 'text_input':
+        text = request.form.get('text', '').strip()
+        if not text:
+            return reject('No text provided')
+        config['text'] = text
+    else:
+        # Received next to the current audio and only swapped in once it is complete
+        upload, error = receive_reel_upload({
+            'audio': FilePolicy('audio', AUDIO_EXTENSIONS, app.config['MAX_AUDIO_UPLOAD_BYTES'],
+                                lambda i, filename: os.path.join(reel_folder, f"incoming_{audio_save_name(filename)}")),
+        })
+        if error:
+            return reject(error)
+        if 'audio' not in upload.files:
+            return reject('No selected audio file')
+        incoming_path = upload.files['audio'].path
+        audio_path = os.path.join(reel_folder, os.path.basename(incoming_path)[len('incoming_'):])
+        if os.path.exists(config['audio_path']) and os.path.normpath(config['audio_path']) != os.path.normpath(audio_path):
+            os.remove(config['audio_path'])
+        os.replace(incoming_path, audio_path)
+        config['audio_path'] = audio_path.replace('\\', '/')
+
+    with open(os.path.join(reel_folder, 'config.json'), 'w') as f:
+        json.dump(config, f, indent=4)
+    print(f"\n=== Replacing audio of {reel_id} ===")
+
+    job = queue_render(reel_id, config, kind='audio')
+    return queued_response(job)
+
+_speech_locks = {}
+_speech_locks_guard = threading.Lock()
+
+@bp.route('/reels/<reel_id>/renditions', methods=['GET', 'POST'])
+def renditions(reel_id):
+    """POST queues the MP4 renditions and HLS ladder of a rendered reel; GET lists them"""
+    reel_folder, config = find_reel(reel_id)
+    if reel_folder is None:
+        return jsonify({'error': 'Reel not found'}), 404
+
+    if request.method == 'POST':
+        if not os.path.exists(os.path.join(app.config['OUTPUT_FOLDER'], output_filename(reel_id))):
+            return jsonify({'error': 'Reel has not been rendered yet'}), 409
+        if reel_id in in_flight_reels():
+            return jsonify({'error': 'Reel is still rendering'}), 409
+        busy = busy_response()
+        if busy is not None:
+            return busy
+        job = queue_render(reel_id, config, kind='renditions')
+        payload = job.to_dict()
+        payload['status_url'] = url_for('reels.job_status', job_id=job.job_id)
+        payload['renditions_url'] = url_for('reels.renditions', reel_id=reel_id)
+        return jsonify(payload), 202
+
+    from render import rendition_ladder
+    folder = os.path.join(app.config['RENDITION_FOLDER'], reel_id)
+    ladder = rendition_ladder(reel_profile(config), app.config['RENDITIONS'])
+    listing = []
+    for rung in ladder:
+        path = os.path.join(folder, f"{rung['name']}.mp4")
+        if os.path.exists(path):
+            listing.append({
+                'name': rung['name'],
+                'width': rung['width'],
+                'height': rung['height'],
+                'bytes': os.path.getsize(path),
+                'media_url': url_for('reels.rendition_media', reel_id=reel_id, name=rung['name'], v=media_version(path)),
+                'download_url': url_for('reels.download_rendition', reel_id=reel_id, name=rung['name']),
+            })
+    master_path = os.path.join(folder, 'hls', 'master.m3u8')
+    return jsonify({
+        'reel_id': reel_id,
+        'renditions': listing,
+        'hls_url': url_for('reels.rendition_hls', reel_id=reel_id, filename='master.m3u8') if os.path.exists(master_path) else None,
+    })
+
+def rendition_path(reel_id, filename):
+    """Absolute path of a file in a reel's rendition folder; 404 for anything outside it"""
+    if secure_filename(reel_id) != reel_id:
+        abort(404)
+    folder = os.path.abspath(os.path.join(app.config['RENDITION_FOLDER'], reel_id))
+    path = os.path.abspath(os.path.join(folder, filename))
+    if os.path.commonpath([folder, path]) != folder or not os.path.isfile(path):
+        abort(404)
+    return path
+
+@bp.route('/renditions/<reel_id>/<name>.mp4')
+def rendition_media(reel_id, name):
+    """Inline MP4 of one rendition, served like media()"""
+    path = rendition_path(reel_id, f"{secure_filename(name)}.mp4")
+    version = media_version(path)
+    pinned = request.args.get('v') == version
+    response = send_file(path,
+                         mimetype='video/mp4',
+                         conditional=True,
+                         etag=version,
+                         max_age=app.config['MEDIA_MAX_AGE'] if pinned else 0)
+    response.accept_ranges = 'bytes'
+    if pinned:
+        response.cache_control.immutable = True
+    return response
+
+@bp.route('/download/<reel_id>/<name>')
+def download_rendition(reel_id, name):
+    path = rendition_path(reel_id, f"{secure_filename(name)}.mp4")
+    os.utime(path, None)
+    return send_file(path,
+                     as_attachment=True,
+                     download_name=f"{reel_id}_{secure_filename(name)}.mp4",
+                     etag=media_version(path))
+
+@bp.route('/hls/<reel_id>/<path:filename>')
+def rendition_hls(reel_id, filename):
+    """Master playlist, variant playlists and segments of the HLS ladder"""
+    path = rendition_path(reel_id, os.path.join('hls', filename))
+    if path.endswith('.m3u8'):
+        # Playlists are rewritten by a new renditions job; segment names carry the run's ID (render.py)
+        return send_file(path, mimetype='application/vnd.apple.mpegurl', conditional=True, max_age=0)
+    return send_file(path, mimetype='video/mp2t', conditional=True, max_age=app.config['MEDIA_MAX_AGE'])
+
+def speech_lock(text):
+    """Lock per script, so batch reels with the same text synthesize it once and share the cached audio"""
+    with _speech_locks_guard:
+        return _speech_locks.setdefault(hashlib.sha256(text.encode('utf-8')).hexdigest(), threading.Lock())
+
+def warm_batch_images(specs):
+    """Hash each distinct image of a batch once and preprocess each distinct image once per
+    output size, so the reels that share an image all hit the image cache"""
+    from imaging import preprocess_images
+    digests = {}
+    for spec in specs:
+        for path in spec['images']:
+            if path not in digests and os.path.exists(path):
+                digests[path] = file_digest(path)
+        spec['image_sha256'] = [digests.get(path) for path in spec['images']]
+
+    # The same canvas and decode bounds render_video_stage asks for, so the reels hit these variants
+    by_size = {}
+    for spec in specs:
+        profile = reel_profile({'profile': spec['profile']})
+        resolution = (profile['width'], profile['height'])
+        canvas = None if app.config['RENDER_PATH'] == 'filtergraph' else resolution
+        for path, digest in zip(spec['images'], spec['image_sha256']):
+            if digest is not None:
+                by_size.setdefault((canvas, resolution), {}).setdefault(digest, path)
+
+    warm_folder = os.path.join(app.config['OUTPUT_FOLDER'], 'work', f"batch_{uuid.uuid4().hex}")
+    try:
+        for (canvas, resolution), images in by_size.items():
+            # Manifest images skip upload validation: the pixel guard and memory ceiling apply here
+            preprocess_images(list(images.values()), warm_folder,
+                              cache=image_cache,
+                              digests=list(images.keys()),
+                              workers=app.config['PREPROCESS_WORKERS'],
+                              canvas=canvas,
+                              bounds=resolution,
+                              max_pixels=app.config['MAX_IMAGE_PIXELS'],
+                              memory_limit=app.config['PREPROCESS_MEMORY_BYTES'])
+        print(f"🖼️ Batch shares {len(digests)} distinct images across {len(specs)} reels")
+    finally:
+        shutil.rmtree(warm_folder, ignore_errors=True)
+
+def render_batch_reel(spec, on_reel_id):
+    """Render one manifest entry: lay it out like an upload, synthesize speech if needed, render"""
+    reel_id = REEL_ID_PREFIX + new_reel_id()
+    on_reel_id(reel_id)
+    upload_folder = app.config['UPLOAD_TEXT_FOLDER'] if spec['text'] else app.config['UPLOAD_AUDIO_FOLDER']
+    reel_folder = os.path.join(upload_folder, reel_id)
+    images_folder = os.path.join(reel_folder, 'images')
+    os.makedirs(images_folder, exist_ok=True)
+
+    # Inputs are hardlinked in, so the reel keeps working if the catalog files change
+    image_paths = []
+    for idx, src in enumerate(spec['images']):
+        if src.rsplit('.', 1)[-1].lower() not in IMAGE_EXTENSIONS:
+            raise ValueError(f"Invalid image file type: {src}")
+        dest = os.path.join(images_folder, image_save_name(idx, os.path.basename(src)))
+        link_or_copy(src, dest)
+        image_paths.append(dest)
+
+    config = {
+        'image_paths': image_paths,
+        'image_sha256': spec.get('image_sha256') or [file_digest(path) for path in image_paths],
+        'durations': spec['durations'],
+        'profile': spec['profile'] or app.config['DEFAULT_RENDER_PROFILE'],
+        'draft_first': False,
+    }
+    if spec.get('duration_mode') == 'auto':
+        config.update(duration_mode='auto', duration_weights=spec['durations'])
+    if spec['text']:
+        config.update(type='text_input', text=spec['text'],
+                      audio_path=os.path.join(reel_folder, 'generated_audio.mp3'))
+    else:
+        if spec['audio'].rsplit('.', 1)[-1].lower() not in AUDIO_EXTENSIONS:
+            raise ValueError(f"Invalid audio file type: {spec['audio']}")
+        config.update(type='audio_input',
+                      audio_path=os.path.join(reel_folder, audio_save_name(os.path.basename(spec['audio']))))
+        link_or_copy(spec['audio'], config['audio_path'])
+
+    with open(os.path.join(reel_folder, 'config.json'), 'w') as f:
+        json.dump(config, f, indent=4)
+
+    if spec['text']:
+        with speech_lock(spec['text']):
+            generate_audio_from_text(spec['text'], config['audio_path'])
+    resolve_auto_durations(reel_id, config)
+    with governor.slot(BATCH):
+        return os.path.abspath(generate_reel(reel_id, config))
+
+def new_batch_run(specs, parallelism=None, report_path=None):
+    """Batch of manifest reels wired to the render pipeline; call run() or start() on it"""
+    run = BatchRun(specs,
+                   parallelism=parallelism or app.config['BATCH_PARALLELISM'],
+                   render_reel=render_batch_reel,
+                   warm=warm_batch_images,
+                   marker_folder=app.config['BATCH_MARKER_FOLDER'])
+    run.report_path = report_path or os.path.join(app.config['BATCH_REPORT_FOLDER'], f"{run.batch_id}.json")
+    batches[run.batch_id] = run
+    return run
+
+@bp.route('/batch', methods=['POST'])
+def start_batch():
+    """Render a JSON manifest in the background; paths are relative to BATCH_INPUT_ROOT"""
+    input_root = app.config['BATCH_INPUT_ROOT']
+    if not input_root:
+        return jsonify({'error': 'Batch API is disabled (BATCH_INPUT_ROOT is not set)'}), 403
+    data = request.get_json(silent=True)
+    try:
+        specs = load_manifest(data, base_dir=input_root, input_root=input_root,
+                              profiles=app.config['RENDER_PROFILES'])
+        parallelism = int(data.get('parallelism') or app.config['BATCH_PARALLELISM'])
+    except ManifestError as e:
+        return jsonify({'error': str(e)}), 400
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid parallelism'}), 400
+
+    run = new_batch_run(specs, parallelism=max(1, min(parallelism, app.config['BATCH_PARALLELISM']))).start()
+    payload = run.to_dict()
+    payload['status_url'] = url_for('reels.batch_status', batch_id=run.batch_id)
+    return jsonify(payload), 202
+
+@bp.route('/batch/<batch_id>')
+def batch_status(batch_id):
+    run = batches.get(batch_id)
+    if run is not None:
+        return jsonify(run.to_dict())
+    # Finished batches from before a restart still have their report on disk
+    report_path = os.path.join(app.config['BATCH_REPORT_FOLDER'], f"{secure_filename(batch_id)}.json")
+    if os.path.exists(report_path):
+        return send_file(os.path.abspath(report_path), mimetype='application/json')
+    return jsonify({'error': 'Batch not found'}), 404
+
+ELEVENLABS_VOICE_SETTINGS = {
+    "stability": 0.5,
+    "similarity_boost": 0.5
+}
+GTTS_LANG = 'en'
+
+def tts_cache_key(text, provider, voice_id=None, voice_settings=None, lang=None):
+    """Everything that changes the synthesized audio goes into the key"""
+    payload = json.dumps({
+        'text': text,
+        'provider': provider,
+        'voice_id': voice_id,
+        'voice_settings': voice_settings,
+        'lang': lang,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def synthesize_cached(key, write_fn, output_path, provider):
+    """Serve audio from the TTS cache, or create it with write_fn(path) and cache it"""
+    if tts_cache.materialize(key, output_path):
+        print(f"♻️ TTS cache hit ({provider})")
+        metrics.tts_requests.inc(provider=provider, outcome='cache_hit')
+        return
+    try:
+        with metrics.tts_seconds.time(provider=provider):
+            cached_path = tts_cache.store(key, write_fn)
+    except Exception:
+        metrics.tts_requests.inc(provider=provider, outcome='error')
+        raise
+    metrics.tts_requests.inc(provider=provider, outcome='ok')
+    link_or_copy(cached_path, output_path)
+
+def synthesize_gtts(text, output_path):
+    global gTTS
+    if gTTS is None:
+        from gtts import gTTS
+    def write_gtts(path):
+        gTTS(text=text, lang=GTTS_LANG).save(path)
+    synthesize_cached(tts_cache_key(text, 'gtts', lang=GTTS_LANG), write_gtts, output_path, 'gtts')
+
+def elevenlabs_client():
+    from tts import ElevenLabsClient, get_session
+    return ElevenLabsClient(
+        app.config['ELEVENLABS_API_KEY'],
+        app.config['ELEVENLABS_VOICE_ID'],
+        ELEVENLABS_VOICE_SETTINGS,
+        base_url=app.config['ELEVENLABS_API_URL'],
+        timeout=app.config['ELEVENLABS_TIMEOUT'],
+        session=get_session(pool_size=app.config['TTS_CONCURRENCY'])
     )
 
+def synthesize_elevenlabs(client, text, output_path):
+    key = tts_cache_key(text, 'elevenlabs', voice_id=client.voice_id,
+                        voice_settings=client.voice_settings)
+    synthesize_cached(key, lambda path: client.synthesize(text, path), output_path, 'elevenlabs')
+
 def generate_audio_from_text(text, output_path):
-    """Generate audio from text using ElevenLabs API with gTTS fallback"""
+    """Generate audio from text using ElevenLabs API with gTTS fallback, reusing cached audio"""
+    from tts import ElevenLabsError, split_text, synthesize_chunks
     try:
         # Try ElevenLabs first if configured
         if app.config.get('ELEVENLABS_API_KEY') and app.config.get('ELEVENLABS_VOICE_ID'):
-            headers = {
-                "xi-api-key": app.config['ELEVENLABS_API_KEY'],
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "text": text,
-                "voice_settings": {
-                    "stability": 0.5,
-                    "similarity_boost": 0.5
-                }
-            }
-            
-            response = requests.post(
-                f"https://api.elevenlabs.io/v1/text-to-speech/{app.config['ELEVENLABS_VOICE_ID']}",
-                headers=headers,
-                json=data,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                with open(output_path, 'wb') as f:
-                    f.write(response.content)
+            client = elevenlabs_client()
+            chunks = [text]
+            if app.config['TTS_MODE'] == 'chunked':
+                chunks = split_text(text, max_chars=app.config['TTS_CHUNK_CHARS'])
+
+            if len(chunks) > 1:
+                key = tts_cache_key(text, 'elevenlabs', voice_id=client.voice_id,
+                                    voice_settings=client.voice_settings)
+                if tts_cache.materialize(key, output_path):
+                    print("♻️ TTS cache hit (elevenlabs)")
+                    metrics.tts_requests.inc(provider='elevenlabs', outcome='cache_hit')
+                    return
+
+                # Sentence chunks in parallel over the shared session; a failed
+                # chunk falls back to gTTS on its own
+                providers = synthesize_chunks(
+                    chunks, output_path,
+                    lambda chunk, path: synthesize_elevenlabs(client, chunk, path),
+                    fallback=synthesize_gtts,
+                    workers=app.config['TTS_CONCURRENCY']
+                )
+                metrics.tts_fallbacks.inc(providers.count('fallback'))
+                if 'fallback' not in providers:
+                    tts_cache.store_file(key, output_path)
+                return
+
+            try:
+                synthesize_elevenlabs(client, text, output_path)
                 return
+            except ElevenLabsError as e:
+                print(f"⚠️ {e}, falling back to gTTS")
+                metrics.tts_fallbacks.inc()
         
         # Fallback to gTTS
-        tts = gTTS(text=text, lang='en')
-        tts.save(output_path)
+        synthesize_gtts(text, output_path)
         
     except Exception as e:
         # If ElevenLabs fails, use gTTS
-        tts = gTTS(text=text, lang='en')
-        tts.save(output_path)
+        metrics.failures.inc(stage='speech')
+        metrics.tts_fallbacks.inc()
+        synthesize_gtts(text, output_path)
         raise Exception(f"Audio generation issue: {str(e)}")
+    finally:
+        tts_cache.evict()
     
+def beat_analysis(audio_path):
+    """Beats of an audio file (see beats.analyze), cached by the file's content"""
+    from beats import ANALYSIS_VERSION, analyze
+    key = hashlib.sha256(json.dumps({
+        'audio': file_digest(audio_path),
+        'version': ANALYSIS_VERSION,
+        'sample_rate': app.config['BEAT_SAMPLE_RATE'],
+    }, sort_keys=True).encode('utf-8')).hexdigest()
+    cached_path = beat_cache.lookup(key)
+    if cached_path is not None:
+        try:
+            with open(cached_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            pass  # Evicted or replaced meanwhile: analyze again
+
+    analysis = analyze(audio_path, sample_rate=app.config['BEAT_SAMPLE_RATE'],
+                       block_seconds=app.config['BEAT_BLOCK_SECONDS'])
+    print(f"🥁 Analyzed {analysis['duration']:.1f}s of audio in {analysis['analysis_seconds']:.2f}s: "
+          f"{len(analysis['beats'])} beats at {analysis['tempo'] or '?'} BPM")
+
+    def write_analysis(path):
+        with open(path, 'w') as f:
+            json.dump(analysis, f)
+    beat_cache.store(key, write_analysis)
+    beat_cache.evict()
+    return analysis
+
+def resolve_auto_durations(reel_id, config, progress=None):
+    """For 'auto' reels, spread the images over the whole audio with every cut on a beat.
+
+    The durations the user typed are kept as relative weights; the result
+    replaces config['durations'] and is saved with the reel, so previews,
+    re-renders and renditions use the same cuts.
+    """
+    if config.get('duration_mode') != 'auto':
+        return
+    from beats import beat_durations
+    analysis = beat_analysis(config['audio_path'])
+    durations = beat_durations(analysis, config['duration_weights'], get_audio_duration(config['audio_path']),
+                               min_seconds=app.config['BEAT_MIN_SHOT_SECONDS'])
+    print(f"🥁 Beat-synced durations: {durations}")
+    if progress is not None:
+        progress.total_seconds = sum(durations)
+    if durations == config['durations']:
+        return
+    config['durations'] = durations
+    reel_folder, _ = find_reel(reel_id)
+    if reel_folder is not None:
+        tmp_path = os.path.join(reel_folder, f"config.json.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(config, f, indent=4)
+        os.replace(tmp_path, os.path.join(reel_folder, 'config.json'))
+
 def get_audio_duration(audio_path):
-    """More robust duration detection with FFprobe"""
+    """Audio duration, read in-process (ffprobe only as a fallback) and memoized per file"""
+    from probe import probe_audio
     try:
-        cmd = [
-            'ffprobe', '-v', 'error',
-            '-show_entries', 'format=duration',
-            '-of', 'default=noprint_wrappers=1:nokey=1',
-            audio_path
-        ]
-        result = subprocess.run(cmd, check=True, 
-                              stdout=subprocess.PIPE, 
-                              stderr=subprocess.PIPE,
-                              text=True)
-        return float(result.stdout.strip())
+        return probe_audio(audio_path)['duration']
     except Exception as e:
         raise RuntimeError(f"Failed to get audio duration: {str(e)}")
     
-def generate_reel(reel_id, config):
-    """Generate video reel with bulletproof image handling and FFmpeg processing"""
-    output_path = os.path.join(app.config['OUTPUT_FOLDER'], f"{reel_id}.mp4")
-    cleaned_folder = os.path.join(app.config['OUTPUT_FOLDER'], "cleaned_images")
-    os.makedirs(cleaned_folder, exist_ok=True)
+def video_stage_key(config, render_path, resolution, fps, video_encoder):
+    """Everything the video-only stream depends on; audio is deliberately left out"""
+    from imaging import CLEAN_VARIANT
+    payload = json.dumps({
+        'images': config.get('image_sha256') or [file_digest(path) for path in config['image_paths']],
+        'durations': config['durations'],
+        'render_path': render_path,
+        'clean_variant': CLEAN_VARIANT,
+        'resolution': list(resolution),
+        'fps': fps,
+        'encoder': video_encoder,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def audio_stage_key(config, total_duration, audio_bitrate):
+    payload = json.dumps({
+        'audio': file_digest(config['audio_path']),
+        'duration': total_duration,
+        'bitrate': audio_bitrate,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
+def load_stage_manifest(stage_folder):
     try:
-        print("\n=== Validating and preprocessing images ===")
-        cleaned_image_paths = []
-        
-        for idx, img_path in enumerate(config['image_paths']):
-            if not os.path.exists(img_path):
-                raise FileNotFoundError(f"Image not found: {img_path}")
-            
-            try:
-                # First verify the file is readable and valid
-                try:
-                    with open(img_path, 'rb') as f:
-                        Image.open(f).verify()  # Verify without keeping file open
-                except Exception as verify_error:
-                    raise RuntimeError(f"Image verification failed: {verify_error}")
-                
-                # Now process with explicit file handling
-                with open(img_path, 'rb') as f:
-                    try:
-                        img = Image.open(f)
-                        # Force load image data into memory immediately
-                        img.load()
-                        
-                        if img is None:
-                            raise RuntimeError("Image.open() returned None - corrupt file?")
-                            
-                        # Convert to RGB if needed
-                        if img.mode != 'RGB':
-                            img = img.convert('RGB')
-                        
-                        # Process dimensions
-                        w, h = img.size
-                        w = (w + 1) // 2 * 2
-                        h = (h + 1) // 2 * 2
-                        
-                        # Create new image in memory to avoid file pointer issues
-                        processed_img = Image.new('RGB', (w, h))
-                        processed_img.paste(img.resize((w, h)))
-                        
-                        cleaned_path = os.path.join(cleaned_folder, f"img_{idx}.jpg")
-                        processed_img.save(cleaned_path, quality=95, subsampling=0)
-                        cleaned_image_paths.append(cleaned_path)
-                        print(f"✅ Processed image {idx+1}: {w}x{h}")
-                        
-                    except Exception as img_error:
-                        raise RuntimeError(f"Image processing failed: {img_error}")
-                        
-            except Exception as e:
-                print(f"❌ Failed to process image {img_path}: {str(e)}")
-                if 'NoneType' in str(e):
-                    print("ℹ️ Tip: This usually indicates a corrupt image file or unsupported format")
-                raise RuntimeError(f"Image processing error: {str(e)}")
+        with open(os.path.join(stage_folder, 'stages.json')) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_stage_manifest(stage_folder, manifest):
+    tmp_path = os.path.join(stage_folder, f"stages.json.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, os.path.join(stage_folder, 'stages.json'))
+
+def render_video_stage(config, work_folder, video_path, render_path, resolution, fps, video_encoder, progress):
+    """Preprocess the images and encode the video-only stream of the reel"""
+    import ffmpeg
+    from imaging import preprocess_images
+    from render import build_concat_video, build_filtergraph_video, build_segment_video, encode_segments, plan_segments
+    target_width, target_height = resolution
+
+    progress.set_phase('preprocessing')
+    print("\n=== Validating and preprocessing images ===")
+    processed = preprocess_images(config['image_paths'], work_folder,
+                                  cache=image_cache,
+                                  digests=config.get('image_sha256'),
+                                  workers=app.config['PREPROCESS_WORKERS'],
+                                  canvas=None if render_path == 'filtergraph' else resolution,
+                                  bounds=resolution,
+                                  max_pixels=app.config['MAX_IMAGE_PIXELS'],
+                                  memory_limit=app.config['PREPROCESS_MEMORY_BYTES'])
+    cleaned_image_paths = [item['cleaned_path'] for item in processed]
+    cache_hits = sum(1 for item in processed if item['cache_hit'])
+    print(f"🖼️ Preprocessed {len(processed)} images in "
+          f"{sum(item['timings']['total_ms'] for item in processed):.0f}ms of worker time "
+          f"({cache_hits} from cache)")
+    if cache_hits < len(processed):
+        image_cache.evict()
+
+    if render_path == 'segments':
+        # Segments encoded in parallel, then joined without re-encoding
+        segments = plan_segments(cleaned_image_paths, config['durations'], fps,
+                                 app.config['SEGMENT_MAX_SECONDS'],
+                                 image_keys=[item['cache_key'] for item in processed])
+        # The segment encodes share the threads of one encode slot
+        workers = max(1, min(app.config['SEGMENT_WORKERS'], governor.threads))
+        segment_encoder = dict(video_encoder, tune='stillimage', threads=max(1, governor.threads // workers))
+        print(f"\n=== Encoding {len(segments)} segments on {workers} workers ===")
+        progress.set_phase('video')
+        segment_paths = encode_segments(segments, work_folder, fps, segment_encoder, workers,
+                                        cache=segment_cache,
+                                        resolution=resolution,
+                                        progress=progress)
+        video = build_segment_video(segment_paths, os.path.join(work_folder, 'segments.ffconcat'))
+        video_args = {'vcodec': 'copy'}
+    elif render_path == 'concat':
+        # Stills were composited onto the frame during preprocessing
+        video = build_concat_video(cleaned_image_paths, config['durations'],
+                                   os.path.join(work_folder, 'stills.ffconcat'), fps)
+        video_args = dict(video_encoder, tune='stillimage', threads=governor.threads)
+    else:
+        video = build_filtergraph_video(cleaned_image_paths, config['durations'],
+                                        target_width, target_height, fps)
+        video_args = dict(video_encoder, threads=governor.threads)
+
+    ffmpeg_cmd = (
+        ffmpeg.output(video, video_path, an=None, **video_args)
+        .global_args('-loglevel', 'error')
+        .overwrite_output()
+    )
+    print("\n=== FFmpeg Command (video) ===")
+    print(" ".join(ffmpeg_cmd.compile()))
+    if render_path == 'segments':
+        with metrics.ffmpeg_seconds.time(step='concat'):
+            ffmpeg_cmd.run()  # Stream copy of the finished segments
+    else:
+        progress.set_phase('video')
+        run_with_progress(ffmpeg_cmd, lambda report: progress.update('video', report), step='video')
+
+def output_filename(reel_id, draft=False):
+    return f"{reel_id}_draft.mp4" if draft else f"{reel_id}.mp4"
+
+def reel_profile(config, draft=False):
+    """Render profile of a reel: its chosen profile, or the draft version of it"""
+    profiles = app.config['RENDER_PROFILES']
+    profile = profiles[config.get('profile') or app.config['DEFAULT_RENDER_PROFILE']]
+    if draft:
+        from render import draft_profile
+        profile = draft_profile(profile, profiles[app.config['DRAFT_PROFILE']])
+    return profile
+
+def record_render(reel_id, profile_name, draft, progress, started, output_path=None, error=None):
+    """Feed a finished render into the metrics and log one JSON timing line for it"""
+    kind = 'draft' if draft else 'final'
+    outcome = 'failed' if error else 'ok'
+    total_seconds = time.perf_counter() - started
+    output_seconds = progress.total_seconds
+    size = os.path.getsize(output_path) if output_path and os.path.exists(output_path) else None
+
+    metrics.renders.inc(kind=kind, outcome=outcome)
+    for phase, seconds in progress.phase_seconds.items():
+        metrics.phase_seconds.observe(seconds, phase=phase)
+    if error:
+        metrics.failures.inc(stage=progress.phase)
+    else:
+        metrics.render_seconds.observe(total_seconds, kind=kind, profile=profile_name)
+        metrics.output_bytes.observe(size or 0, profile=profile_name)
+
+    metrics.log_event('reel_timing', reel_id=reel_id, kind=kind, profile=profile_name, outcome=outcome,
+                      failed_phase=progress.phase if error else None, error=error,
+                      total_seconds=round(total_seconds, 3),
+                      phases={phase: round(seconds, 3) for phase, seconds in progress.phase_seconds.items()},
+                      output_bytes=size, output_seconds=output_seconds,
+                      speed=round(output_seconds / total_seconds, 2) if not error and total_seconds else None)
+
+def generate_reel(reel_id, config, draft=False, progress=None):
+    """Generate video reel with bulletproof image handling and FFmpeg processing.
+
+    Resolution, frame rate and encoder settings come from the reel's render
+    profile; a draft uses the fast draft settings at the same aspect ratio.
+    Video and audio are rendered as separate stages kept in
+    outputs/stages/<reel_id>/<profile>; a stage whose inputs did not change
+    since the last render is reused, so swapping only the audio costs an
+    audio encode plus a stream-copy remux. Scratch files and stage outputs
+    are named per run and published with os.replace, so two runs of the same
+    reel never write over each other. FFmpeg progress reports are fed to
+    progress (a RenderProgress); timings go to the metrics module.
+    """
+    import ffmpeg
+    from render import build_audio
+    started = time.perf_counter()
+    profile_name = config.get('profile') or app.config['DEFAULT_RENDER_PROFILE']
+    stage_name = f"{profile_name}_draft" if draft else profile_name
+    profile = reel_profile(config, draft=draft)
+    output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename(reel_id, draft=draft))
+    run_id = uuid.uuid4().hex
+    # Per-run scratch space: cleaned images are hardlinked here from the shared cache
+    work_folder = os.path.join(app.config['OUTPUT_FOLDER'], "work", f"{reel_id}_{stage_name}_{run_id}")
+    stage_folder = os.path.join(app.config['STAGE_FOLDER'], reel_id, stage_name)
+    video_stage_path = os.path.join(stage_folder, 'video.mp4')
+    audio_stage_path = os.path.join(stage_folder, 'audio.m4a')
+    video_tmp_path = os.path.join(stage_folder, f"video.{run_id}.tmp.mp4")
+    audio_tmp_path = os.path.join(stage_folder, f"audio.{run_id}.tmp.m4a")
+    mux_path = f"{output_path}.{run_id}.tmp.mp4"
+    progress = progress or RenderProgress(sum(config['durations']))
+    TARGET_WIDTH, TARGET_HEIGHT = profile['width'], profile['height']
+    FPS = profile['fps']
+    AUDIO_BITRATE = profile['audio_bitrate']
+    render_path = app.config['RENDER_PATH']
+    video_encoder = {
+        'vcodec': 'libx264',
+        'preset': profile['preset'],
+        'pix_fmt': 'yuv420p',
+        'crf': profile['crf'],
+    }
+    print(f"\n🎞️ Rendering {stage_name}: {TARGET_WIDTH}x{TARGET_HEIGHT} @ {FPS}fps, "
+          f"{profile['preset']} crf {profile['crf']}, {AUDIO_BITRATE} audio")
+
+    try:
+        os.makedirs(stage_folder, exist_ok=True)
+        manifest = load_stage_manifest(stage_folder)
 
         # Audio processing (unchanged)
         if not os.path.exists(config['audio_path']):
             raise FileNotFoundError(f"Audio file not found: {config['audio_path']}")
 
-        audio_duration = get_audio_duration(config['audio_path'])
-        total_image_duration = sum(config['durations'])
-        print(f"\nAudio duration: {audio_duration:.2f}s | Total image duration: {total_image_duration:.2f}s")
-
-        if audio_duration < total_image_duration:
-            loops = int(total_image_duration / audio_duration) + 1
-            audio_input = ffmpeg.input(config['audio_path'], stream_loop=loops)
-            audio = audio_input.filter('atrim', duration=total_image_duration)
-            print(f"🔁 Looped audio {loops}x to match duration")
-        elif audio_duration > total_image_duration + 1.0:
-            audio_input = ffmpeg.input(config['audio_path'])
-            audio = audio_input.filter('atrim', duration=total_image_duration).filter('afade', t='out', st=total_image_duration - 1, d=1)
-            print(f"✂️ Trimmed audio from {audio_duration:.2f}s to {total_image_duration:.2f}s")
+        video_key = video_stage_key(config, render_path, (TARGET_WIDTH, TARGET_HEIGHT), FPS, video_encoder)
+        if manifest.get('video') == video_key and os.path.exists(video_stage_path):
+            print("\n♻️ Images and durations unchanged, reusing the encoded video stream")
+            progress.complete('video', sum(config['durations']))
         else:
-            audio = ffmpeg.input(config['audio_path'])
-            print("✅ Audio duration matches perfectly")
-
-        TARGET_WIDTH, TARGET_HEIGHT = 1920, 1080
-        video_streams = []
-
-        for idx, (img_path, duration) in enumerate(zip(cleaned_image_paths, config['durations'])):
-            try:
-                print(f"\nProcessing cleaned image {idx+1}: {os.path.basename(img_path)} ({duration}s)")
-                
-                # Modified input with explicit duration
-                stream = ffmpeg.input(img_path, framerate=24, loop=1, t=duration)
-                
-                # Simplified scaling and padding
-                stream = stream.filter('scale', 
-                                    TARGET_WIDTH, TARGET_HEIGHT, 
-                                    force_original_aspect_ratio='decrease')
-                stream = stream.filter('pad',
-                                    TARGET_WIDTH, TARGET_HEIGHT,
-                                    '(ow-iw)/2', '(oh-ih)/2',
-                                    color='black')
-                
-                # Ensure even dimensions
-                stream = stream.filter('scale', 'ceil(iw/2)*2', 'ceil(ih/2)*2')
-                stream = stream.filter('setsar', '1')
-                
-                # Fade effects
-                if duration >= 1.0:
-                    if idx == 0:
-                        stream = stream.filter('fade', t='in', st=0, d=0.5)
-                    if idx == len(cleaned_image_paths) - 1:
-                        stream = stream.filter('fade', t='out', st=duration - 0.5, d=0.5)
-                else:
-                    print(f"⚠️ Skipping fade: duration too short ({duration}s)")
-                
-                stream = stream.filter('format', 'yuv420p')
-                video_streams.append(stream)
+            manifest.pop('video', None)
+            render_video_stage(config, work_folder, video_tmp_path, render_path,
+                               (TARGET_WIDTH, TARGET_HEIGHT), FPS, video_encoder, progress)
+            progress.check()
+            os.replace(video_tmp_path, video_stage_path)
+            manifest['video'] = video_key
 
-            except Exception as e:
-                print(f"❌ Error processing image {img_path}: {e}")
-                raise
+        total_image_duration = sum(config['durations'])
+        audio_key = audio_stage_key(config, total_image_duration, AUDIO_BITRATE)
+        if manifest.get('audio') == audio_key and os.path.exists(audio_stage_path):
+            print("♻️ Audio unchanged, reusing the encoded audio track")
+        else:
+            manifest.pop('audio', None)
+            progress.set_phase('audio')
+            audio_duration = get_audio_duration(config['audio_path'])
+            print(f"\nAudio duration: {audio_duration:.2f}s | Total image duration: {total_image_duration:.2f}s")
+            audio = build_audio(config['audio_path'], audio_duration, total_image_duration)
+            audio_cmd = (
+                ffmpeg.output(audio, audio_tmp_path, vn=None, acodec='aac', **{'b:a': AUDIO_BITRATE})
+                .global_args('-loglevel', 'error')
+                .overwrite_output()
+            )
+            print("\n=== FFmpeg Command (audio) ===")
+            print(" ".join(audio_cmd.compile()))
+            with metrics.ffmpeg_seconds.time(step='audio'):
+                audio_cmd.run()
+            progress.check()
+            os.replace(audio_tmp_path, audio_stage_path)
+            manifest['audio'] = audio_key
 
-        video = ffmpeg.concat(*video_streams, v=1, a=0)
+        save_stage_manifest(stage_folder, manifest)
 
-        ffmpeg_cmd = (
+        progress.set_phase('mux')
+        # Both streams are final: the mux is a stream copy. The reel is published
+        # with os.replace so players never see a half-written file.
+        mux_cmd = (
             ffmpeg.output(
-                video, audio, output_path,
-                vcodec='libx264',
-                acodec='aac',
-                preset='fast',
-                movflags='+faststart',
-                pix_fmt='yuv420p',
-                crf=23,
-                **{'b:a': '192k'}
+                ffmpeg.input(video_stage_path).video,
+                ffmpeg.input(audio_stage_path).audio,
+                mux_path,
+                c='copy',
+                movflags='+faststart'
             )
             .global_args('-loglevel', 'error')
             .overwrite_output()
         )
-
-        print("\n=== FFmpeg Command ===")
-        print(" ".join(ffmpeg_cmd.compile()))
-
-        ffmpeg_cmd.run()
+        print("\n=== FFmpeg Command (mux) ===")
+        print(" ".join(mux_cmd.compile()))
+        with metrics.ffmpeg_seconds.time(step='mux'):
+            mux_cmd.run()
+        progress.check()
+        os.replace(mux_path, output_path)
 
         if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
             raise RuntimeError("Output file was not created or is empty")
 
+        progress.set_phase('done')
+        record_render(reel_id, profile_name, draft, progress, started, output_path=output_path)
         print(f"\n🎉 Successfully generated: {output_path}")
         return output_path
 
     except ffmpeg.Error as e:
         print("❌ FFmpeg stderr:\n", e.stderr.decode('utf8', errors='ignore') if e.stderr else "No stderr")
+        record_render(reel_id, profile_name, draft, progress, started, error='ffmpeg')
         raise RuntimeError("FFmpeg processing failed.")
+    except RenderCancelled:
+        # Another run owns the reel now: leave its output alone
+        record_render(reel_id, profile_name, draft, progress, started, error='cancelled')
+        raise
     except Exception as e:
+        record_render(reel_id, profile_name, draft, progress, started, error=str(e))
         if os.path.exists(output_path):
             os.remove(output_path)
         raise RuntimeError(f"Reel generation error: {str(e)}")
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+        for tmp_path in (video_tmp_path, audio_tmp_path, mux_path):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
     
-def cleanup_old_files(hours=1):
-    """Clean both output files AND uploaded folders older than X hours"""
-    cutoff = datetime.now() - timedelta(hours=hours)
-    
-    # 1. Clean OUTPUT_FOLDER (*.mp4 files)
-    output_folder = app.config['OUTPUT_FOLDER']
-    if os.path.exists(output_folder):
-        for filename in os.listdir(output_folder):
-            if filename.endswith('.mp4'):
-                file_path = os.path.join(output_folder, filename)
-                try:
-                    if datetime.fromtimestamp(os.path.getmtime(file_path)) < cutoff:
-                        os.remove(file_path)
-                        print(f"🧹 Deleted output: {file_path}")
-                except Exception as e:
-                    print(f"❌ Error deleting output {file_path}: {e}")
-
-    # 2. Clean UPLOAD_AUDIO_FOLDER (individual reel folders)
-    audio_folder = app.config['UPLOAD_AUDIO_FOLDER']
-    if os.path.exists(audio_folder):
-        for reel_id in os.listdir(audio_folder):
-            reel_path = os.path.join(audio_folder, reel_id)
-            try:
-                if datetime.fromtimestamp(os.path.getmtime(reel_path)) < cutoff:
-                    shutil.rmtree(reel_path)
-                    print(f"🧹 Deleted audio reel: {reel_path}")
-            except Exception as e:
-                print(f"❌ Error deleting audio reel {reel_path}: {e}")
-
-    # 3. Clean UPLOAD_TEXT_FOLDER (individual reel folders)
-    text_folder = app.config['UPLOAD_TEXT_FOLDER']
-    if os.path.exists(text_folder):
-        for reel_id in os.listdir(text_folder):
-            reel_path = os.path.join(text_folder, reel_id)
-            try:
-                if datetime.fromtimestamp(os.path.getmtime(reel_path)) < cutoff:
-                    shutil.rmtree(reel_path)
-                    print(f"🧹 Deleted text reel: {reel_path}")
-            except Exception as e:
-                print(f"❌ Error deleting text reel {reel_path}: {e}")
+def generate_renditions(reel_id, config, progress=None):
+    """Encode every rendition of a rendered reel in a single FFmpeg run.
 
+    The images are composited onto the reel's frame once (shared image
+    cache), the timeline is built once and split inside the filter graph
+    into one scaled encode per rendition, each written as an MP4 and as an
+    HLS variant; the audio track of the final render is stream-copied into
+    all of them. Everything lands in RENDITION_FOLDER/<reel_id>, replaced as
+    a whole when the run succeeds.
+    """
+    import ffmpeg
+    from imaging import preprocess_images
+    from render import (avc_codec_string, build_concat_video, build_rendition_outputs, rendition_ladder,
+                        write_master_playlist)
+    profile_name = config.get('profile') or app.config['DEFAULT_RENDER_PROFILE']
+    profile = reel_profile(config)
+    resolution = (profile['width'], profile['height'])
+    audio_stage_path = os.path.join(app.config['STAGE_FOLDER'], reel_id, profile_name, 'audio.m4a')
+    if not os.path.exists(audio_stage_path):
+        raise RuntimeError("Render the reel before its renditions")
+    ladder = rendition_ladder(profile, app.config['RENDITIONS'])
+    if not ladder:
+        raise RuntimeError(f"No rendition fits the {profile_name} profile")
+
+    folder = os.path.join(app.config['RENDITION_FOLDER'], reel_id)
+    run_id = uuid.uuid4().hex
+    tmp_folder = f"{folder}.{run_id}.tmp"
+    work_folder = os.path.join(app.config['OUTPUT_FOLDER'], "work", f"{reel_id}_renditions_{run_id}")
+    progress = progress or RenderProgress(sum(config['durations']))
+    names = ', '.join(rung['name'] for rung in ladder)
+    print(f"\n🎞️ Rendering {len(ladder)} renditions of {reel_id}: {names}")
+    try:
+        progress.set_phase('preprocessing')
+        processed = preprocess_images(config['image_paths'], work_folder,
+                                      cache=image_cache,
+                                      digests=config.get('image_sha256'),
+                                      workers=app.config['PREPROCESS_WORKERS'],
+                                      canvas=resolution,
+                                      bounds=resolution,
+                                      max_pixels=app.config['MAX_IMAGE_PIXELS'],
+                                      memory_limit=app.config['PREPROCESS_MEMORY_BYTES'])
+        video = build_concat_video([item['cleaned_path'] for item in processed], config['durations'],
+                                   os.path.join(work_folder, 'stills.ffconcat'), profile['fps'])
+        # The renditions' encoders share the threads of one encode slot
+        encoder = {'vcodec': 'libx264', 'preset': profile['preset'], 'pix_fmt': 'yuv420p',
+                   'tune': 'stillimage', 'threads': max(1, governor.threads // len(ladder))}
+        os.makedirs(tmp_folder)
+        cmd = (
+            build_rendition_outputs(video, ffmpeg.input(audio_stage_path).audio, ladder, tmp_folder, encoder,
+                                    profile['fps'], app.config['HLS_SEGMENT_SECONDS'], run_id)
+            .global_args('-loglevel', 'error')
+            .overwrite_output()
+        )
+        print("\n=== FFmpeg Command (renditions) ===")
+        print(" ".join(cmd.compile()))
+        progress.set_phase('renditions')
+        run_with_progress(cmd, lambda report: progress.update('renditions', report), step='renditions')
+        # Each rung's profile and level depend on its size and the preset: read them from its encode
+        video_codecs = {rung['name']: avc_codec_string(os.path.join(tmp_folder, f"{rung['name']}.mp4"))
+                        for rung in ladder}
+        write_master_playlist(os.path.join(tmp_folder, 'hls', 'master.m3u8'), ladder, profile['audio_bitrate'],
+                              video_codecs)
+
+        # Swap the finished set in; the old one (if any) is renamed away first
+        old_folder = f"{folder}.{uuid.uuid4().hex}.tmp"
+        if os.path.exists(folder):
+            os.rename(folder, old_folder)
+        os.rename(tmp_folder, folder)
+        shutil.rmtree(old_folder, ignore_errors=True)
+        progress.set_phase('done')
+        print(f"\n🎉 Renditions ready in {folder}")
+        return folder
+
+    except ffmpeg.Error as e:
+        print("❌ FFmpeg stderr:\n", e.stderr.decode('utf8', errors='ignore') if e.stderr else "No stderr")
+        raise RuntimeError("FFmpeg processing failed.")
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+        shutil.rmtree(tmp_folder, ignore_errors=True)
 
-print("🚀 Starting cleanup...")
-cleanup_old_files(hours=1)  # Change number to adjust retention time
-print("✅ Cleanup complete")
-    
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
@@ -0,0 +1,315 @@
+"""Render many reels from a JSON manifest, without going through the upload forms.
+
+Manifest:
+
+    {
+        "defaults": {"profile": "vertical"},
+        "reels": [
+            {"name": "sku-123", "images": ["a.jpg", "b.png"], "durations": [3, 4], "audio": "track.mp3"},
+            {"name": "sku-456", "images": ["c.jpg"], "durations": [5], "text": "Now on sale."},
+            {"name": "sku-789", "images": ["d.jpg", "e.jpg"], "durations": "auto", "audio": "beat.mp3"}
+        ]
+    }
+
+Each reel needs images, one duration per image (or "auto": equal shares of
+the audio, cut on its beats), and either audio or text; profile is optional. Values in "defaults" apply to every reel that does not
+set them. Relative paths are resolved against the manifest's folder.
+
+CLI: python batch.py manifest.json [--parallel N] [--report results.json]
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+REEL_FIELDS = {'name', 'images', 'durations', 'audio', 'text', 'profile'}
+
+REEL_ID_PREFIX = 'batch-'  # Batch reels are kept for BATCH_REEL_MAX_AGE_HOURS, not REEL_MAX_AGE_HOURS
+MARKER_HEARTBEAT_SECONDS = 60  # Markers of reels being rendered are touched this often...
+MARKER_STALE_SECONDS = 300  # ...and ignored once this old: the process rendering them died
+
+_active = set()
+_active_lock = threading.Lock()
+
+
+class ManifestError(Exception):
+    """The manifest is not a list of renderable reels"""
+
+
+def active_reels(marker_folder=None):
+    """Reel IDs that a batch is currently rendering: in this process, and with
+    marker_folder in any process (CLI batches next to the web app, other hosts)"""
+    with _active_lock:
+        active = set(_active)
+    if marker_folder:
+        now = time.time()
+        try:
+            entries = list(os.scandir(marker_folder))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            try:
+                if now - entry.stat().st_mtime < MARKER_STALE_SECONDS:
+                    active.add(entry.name)
+                else:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+    return active
+
+
+def load_manifest(data, base_dir='.', input_root=None, profiles=None):
+    """Validate a manifest (already parsed from JSON) and return one normalized spec per reel.
+
+    With input_root, every path must resolve inside that folder.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get('reels'), list) or not data['reels']:
+        raise ManifestError("Manifest needs a non-empty 'reels' list")
+    defaults = data.get('defaults') or {}
+    if not isinstance(defaults, dict):
+        raise ManifestError("'defaults' must be an object")
+
+    def resolve(path, where):
+        if not isinstance(path, str) or not path:
+            raise ManifestError(f"{where}: paths must be non-empty strings")
+        resolved = os.path.realpath(os.path.join(base_dir, path))
+        if input_root is not None:
+            root = os.path.realpath(input_root)
+            if os.path.commonpath([root, resolved]) != root:
+                raise ManifestError(f"{where}: {path} is outside the batch input folder")
+        return resolved
+
+    specs = []
+    for idx, entry in enumerate(data['reels']):
+        if not isinstance(entry, dict):
+            raise ManifestError(f"reels[{idx}] must be an object")
+        reel = dict(defaults, **entry)
+        where = f"reels[{idx}]"
+        unknown = set(reel) - REEL_FIELDS
+        if unknown:
+            raise ManifestError(f"{where}: unknown fields {sorted(unknown)}")
+
+        images = reel.get('images')
+        if not isinstance(images, list) or not images:
+            raise ManifestError(f"{where}: 'images' must be a non-empty list")
+        durations = reel.get('durations')
+        duration_mode = 'manual'
+        if durations == 'auto':
+            durations, duration_mode = [1.0] * len(images), 'auto'
+        elif isinstance(durations, str):
+            raise ManifestError(f"{where}: 'durations' must be a list or \"auto\"")
+        if not isinstance(durations, list) or len(durations) != len(images):
+            raise ManifestError(f"{where}: number of durations does not match number of images")
+        try:
+            durations = [float(d) for d in durations]
+        except (TypeError, ValueError):
+            raise ManifestError(f"{where}: invalid duration values")
+        if any(d <= 0 for d in durations):
+            raise ManifestError(f"{where}: durations must be positive")
+
+        if ('audio' in reel) == ('text' in reel):
+            raise ManifestError(f"{where}: give either 'audio' or 'text'")
+        text = reel.get('text')
+        if text is not None and (not isinstance(text, str) or not text.strip()):
+            raise ManifestError(f"{where}: 'text' must be a non-empty string")
+
+        profile = reel.get('profile')
+        if profile is not None and profiles is not None and profile not in profiles:
+            raise ManifestError(f"{where}: unknown render profile '{profile}'")
+
+        specs.append({
+            'name': str(reel.get('name', idx)),
+            'images': [resolve(path, where) for path in images],
+            'durations': durations,
+            'duration_mode': duration_mode,
+            'audio': resolve(reel['audio'], where) if 'audio' in reel else None,
+            'text': text.strip() if text is not None else None,
+            'profile': profile,
+        })
+    return specs
+
+
+class BatchRun:
+    """One batch: renders its reels on a bounded thread pool and keeps the results report.
+
+    render_reel(spec, on_reel_id) renders one reel and returns its output
+    path; it calls on_reel_id(reel_id) as soon as the reel has an ID.
+    warm(specs), if given, runs once before any reel starts, to prepare
+    assets that reels share. With marker_folder, every reel being rendered
+    has a marker file there (touched every MARKER_HEARTBEAT_SECONDS), so
+    janitors in other processes see it as in flight.
+    """
+
+    def __init__(self, specs, parallelism, render_reel, warm=None, report_path=None, marker_folder=None):
+        self.batch_id = uuid.uuid4().hex
+        self.specs = specs
+        self.parallelism = max(1, parallelism)
+        self.render_reel = render_reel
+        self.warm = warm
+        self.report_path = report_path
+        self.marker_folder = marker_folder
+        self._markers = set()
+        self._markers_lock = threading.Lock()
+        self.results = [{'name': spec['name'], 'reel_id': None, 'state': 'queued', 'output_path': None,
+                         'error': None, 'seconds': None} for spec in specs]
+        self.started_at = None
+        self.finished_at = None
+        self.wall_seconds = None
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def start(self):
+        """Run in a background thread; the report can be polled with to_dict()"""
+        threading.Thread(target=self.run, name=f"batch-{self.batch_id[:8]}", daemon=True).start()
+        return self
+
+    def run(self):
+        self.started_at = datetime.now()
+        started = time.monotonic()
+        print(f"📚 Batch {self.batch_id}: {len(self.specs)} reels, {self.parallelism} at a time")
+        if self.warm is not None:
+            try:
+                self.warm(self.specs)
+            except Exception as e:
+                # Reels still render; each one reports its own failures
+                print(f"⚠️ Batch warm-up failed: {e}")
+
+        done = threading.Event()
+        if self.marker_folder:
+            threading.Thread(target=self._heartbeat, args=(done,), name='batch-markers', daemon=True).start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix='batch') as executor:
+                list(executor.map(self._render_one, range(len(self.specs))))
+        finally:
+            done.set()
+
+        self.wall_seconds = round(time.monotonic() - started, 2)
+        self.finished_at = datetime.now()
+        report = self.to_dict()
+        print(f"📚 Batch {self.batch_id} finished in {self.wall_seconds}s: "
+              f"{report['succeeded']} done, {report['failed']} failed")
+        if self.report_path:
+            write_report(report, self.report_path)
+        return report
+
+    def _render_one(self, idx):
+        result = self.results[idx]
+        reel_ids = []
+
+        def on_reel_id(reel_id):
+            reel_ids.append(reel_id)
+            with _active_lock:
+                _active.add(reel_id)
+            self._mark(reel_id)
+            result['reel_id'] = reel_id
+
+        result['state'] = 'running'
+        started = time.monotonic()
+        try:
+            result['output_path'] = self.render_reel(self.specs[idx], on_reel_id)
+            result['state'] = 'done'
+        except Exception as e:
+            result['state'] = 'failed'
+            result['error'] = str(e)
+            print(f"❌ Batch reel {result['name']} failed: {e}")
+        finally:
+            result['seconds'] = round(time.monotonic() - started, 2)
+            with _active_lock:
+                _active.difference_update(reel_ids)
+            for reel_id in reel_ids:
+                self._unmark(reel_id)
+
+    def _mark(self, reel_id):
+        if not self.marker_folder:
+            return
+        os.makedirs(self.marker_folder, exist_ok=True)
+        with open(os.path.join(self.marker_folder, reel_id), 'w') as f:
+            f.write(f"{socket.gethostname()}:{os.getpid()}")
+        with self._markers_lock:
+            self._markers.add(reel_id)
+
+    def _unmark(self, reel_id):
+        if not self.marker_folder:
+            return
+        with self._markers_lock:
+            self._markers.discard(reel_id)
+        try:
+            os.remove(os.path.join(self.marker_folder, reel_id))
+        except FileNotFoundError:
+            pass
+
+    def _heartbeat(self, done):
+        while not done.wait(MARKER_HEARTBEAT_SECONDS):
+            with self._markers_lock:
+                reel_ids = list(self._markers)
+            for reel_id in reel_ids:
+                try:
+                    os.utime(os.path.join(self.marker_folder, reel_id), None)
+                except FileNotFoundError:
+                    pass
+
+    def to_dict(self):
+        results = [dict(result) for result in self.results]
+        return {
+            'batch_id': self.batch_id,
+            'parallelism': self.parallelism,
+            'total': len(results),
+            'succeeded': sum(1 for result in results if result['state'] == 'done'),
+            'failed': sum(1 for result in results if result['state'] == 'failed'),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'wall_seconds': self.wall_seconds,
+            'reels': results,
+        }
+
+
+def write_report(report, path):
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, indent=4)
+    os.replace(tmp_path, path)
+    print(f"📝 Batch report written to {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the reels of a JSON manifest")
+    parser.add_argument('manifest', help="Path to the manifest file")
+    parser.add_argument('--parallel', type=int, default=None,
+                        help="Reels rendered at the same time (default: BATCH_PARALLELISM)")
+    parser.add_argument('--report', default=None,
+                        help="Where to write the results report (default: next to the manifest)")
+    args = parser.parse_args(argv)
+
+    # Imported here: the app imports this module. One janitor per deployment runs
+    # in the web app; it sees this run's reels through their marker files
+    import app as reel_app
+    reel_app.create_app(start_janitor=False)
+
+    with open(args.manifest) as f:
+        data = json.load(f)
+    try:
+        specs = load_manifest(data, base_dir=os.path.dirname(os.path.abspath(args.manifest)),
+                              profiles=reel_app.app.config['RENDER_PROFILES'])
+    except ManifestError as e:
+        print(f"❌ Invalid manifest: {e}")
+        return 2
+
+    report_path = args.report or f"{os.path.splitext(args.manifest)[0]}.results.json"
+    run = reel_app.new_batch_run(specs, parallelism=args.parallel, report_path=report_path)
+    report = run.run()
+    return 0 if report['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,212 @@
+import threading
+import time
+import numpy as np
+import metrics
+
+ANALYSIS_VERSION = 1  # Bump when the analysis changes, so cached results are recomputed
+FRAME = 1024  # STFT window in samples
+HOP = 512  # Samples between onset frames (~23ms at 22.05kHz)
+MIN_BPM = 60
+MAX_BPM = 200
+PREFERRED_BPM = 120  # Tempo estimates are weighted towards this, an octave either side
+TIGHTNESS = 100  # How strongly beat tracking sticks to the estimated tempo
+
+
+def pcm_blocks(audio_path, sample_rate, block_samples):
+    """Mono float32 samples of an audio file, block_samples at a time.
+
+    FFmpeg decodes straight into a pipe (no temporary WAV); only one block
+    is held in memory, whatever the length of the audio.
+    """
+    import ffmpeg
+    process = (
+        ffmpeg.input(audio_path)
+        .output('pipe:', format='f32le', ac=1, ar=sample_rate)
+        .global_args('-loglevel', 'error', '-nostdin')
+        .run_async(pipe_stdout=True, pipe_stderr=True)
+    )
+    stderr_chunks = []
+    drain = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    drain.start()
+    try:
+        while True:
+            data = process.stdout.read(block_samples * 4)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) - len(data) % 4], dtype='<f4')
+        process.wait()
+        drain.join()
+        if process.returncode != 0:
+            raise ffmpeg.Error('ffmpeg', b'', b''.join(stderr_chunks))
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def onset_envelope(blocks):
+    """Spectral flux per hop over a stream of PCM blocks, and the samples seen.
+
+    Each block is framed, windowed and transformed in one vectorized pass;
+    the tail that does not fill a frame and the last spectrum carry over to
+    the next block, so block boundaries do not show in the envelope.
+    """
+    window = np.hanning(FRAME).astype(np.float32)
+    carry = np.zeros(0, dtype=np.float32)
+    previous = None
+    envelope = []
+    samples_seen = 0
+    for block in blocks:
+        samples_seen += len(block)
+        samples = np.concatenate([carry, block])
+        count = (len(samples) - FRAME) // HOP + 1
+        if count <= 0:
+            carry = samples
+            continue
+        frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME)[::HOP][:count]
+        spectrum = np.log1p(100.0 * np.abs(np.fft.rfft(frames * window, axis=1))).astype(np.float32)
+        if previous is None:
+            previous = spectrum[0]
+        rise = np.diff(np.vstack([previous[np.newaxis], spectrum]), axis=0)
+        envelope.append(np.maximum(rise, 0.0).mean(axis=1))
+        previous = spectrum[-1]
+        carry = samples[count * HOP:]
+    if not envelope:
+        return np.zeros(0, dtype=np.float32), samples_seen
+    return np.concatenate(envelope), samples_seen
+
+
+def normalize_envelope(envelope, frame_rate):
+    """Onset strength above its local average (about half a second), scaled to unit peak"""
+    width = max(1, int(round(0.5 * frame_rate)))
+    local = np.convolve(envelope, np.ones(width) / width, mode='same')
+    strength = np.maximum(envelope - local, 0.0)
+    peak = strength.max() if len(strength) else 0.0
+    return strength / peak if peak > 0 else strength
+
+
+def estimate_period(strength, frame_rate):
+    """Beat period in (fractional) frames from the autocorrelation of the onset strength, or None"""
+    min_lag = int(np.floor(60.0 * frame_rate / MAX_BPM))
+    max_lag = int(np.ceil(60.0 * frame_rate / MIN_BPM))
+    if len(strength) < 2 * max_lag:
+        return None
+    size = 1 << int(np.ceil(np.log2(2 * len(strength))))
+    spectrum = np.fft.rfft(strength - strength.mean(), size)
+    autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum), size)[:max_lag + 2]
+    lags = np.arange(min_lag, max_lag + 1)
+    bpm = 60.0 * frame_rate / lags
+    weighted = autocorrelation[lags] * np.exp(-0.5 * np.log2(bpm / PREFERRED_BPM) ** 2)
+    best = int(np.argmax(weighted))
+    if autocorrelation[lags[best]] <= 0:
+        return None
+    lag = float(lags[best])
+    # Parabolic interpolation: an integer lag would drift over a long track
+    if 0 < best < len(lags) - 1:
+        left, mid, right = autocorrelation[lags[best] - 1:lags[best] + 2]
+        denominator = left - 2 * mid + right
+        if denominator < 0:
+            lag += 0.5 * (left - right) / denominator
+    return lag
+
+
+def track_beats(strength, period):
+    """Beat frames by dynamic programming: strong onsets, spaced close to period apart"""
+    count = len(strength)
+    score = strength.astype(np.float64).copy()
+    backlink = np.full(count, -1)
+    offsets = np.arange(-int(round(2 * period)), -int(round(period / 2)) + 1)
+    penalty = -TIGHTNESS * np.log(-offsets / period) ** 2
+    for frame in range(count):
+        previous = frame + offsets
+        valid = previous >= 0
+        if not valid.any():
+            continue
+        candidates = score[previous[valid]] + penalty[valid]
+        best = int(np.argmax(candidates))
+        if candidates[best] > 0:
+            score[frame] += candidates[best]
+            backlink[frame] = previous[valid][best]
+
+    # Start from the best-scoring frame within the last beat period
+    tail = max(0, count - int(round(period)))
+    frame = tail + int(np.argmax(score[tail:]))
+    beats = []
+    while frame >= 0:
+        beats.append(frame)
+        frame = backlink[frame]
+    return np.array(beats[::-1], dtype=np.int64)
+
+
+def analyze(audio_path, sample_rate=22050, block_seconds=10):
+    """Tempo, beat times and beat strengths of an audio file.
+
+    Memory stays bounded by block_seconds of PCM plus the onset envelope
+    (one float per hop); the envelope is what tempo and beats are read from.
+    """
+    started = time.perf_counter()
+    block_samples = max(FRAME, int(block_seconds * sample_rate) // HOP * HOP)
+    envelope, samples = onset_envelope(pcm_blocks(audio_path, sample_rate, block_samples))
+    frame_rate = sample_rate / HOP
+    duration = samples / sample_rate
+    strength = normalize_envelope(envelope, frame_rate)
+    period = estimate_period(strength, frame_rate)
+    beats = track_beats(strength, period) if period else np.zeros(0, dtype=np.int64)
+    # Frame i starts at sample i * HOP; report the centre of its window
+    times = (beats * HOP + FRAME / 2) / sample_rate
+    keep = times < duration
+    # An onset between two frames splits its flux across them: a beat's strength is that of its
+    # neighbourhood, or identical clicks would alternate between strong and weak
+    padded = np.pad(strength, 1)
+    beat_strength = padded[beats] + padded[beats + 1] + padded[beats + 2]
+    if len(beat_strength) and beat_strength.max() > 0:
+        beat_strength = beat_strength / beat_strength.max()
+    elapsed = time.perf_counter() - started
+    metrics.beat_seconds.observe(elapsed)
+    return {
+        'version': ANALYSIS_VERSION,
+        'duration': round(duration, 3),
+        'tempo': round(60.0 * frame_rate / period, 1) if period else None,
+        'beats': [round(float(t), 3) for t in times[keep]],
+        'strengths': [round(float(s), 3) for s in beat_strength[keep]],
+        'analysis_seconds': round(elapsed, 3),
+    }
+
+
+def beat_durations(analysis, weights, total_seconds, min_seconds=1.0):
+    """Image durations covering total_seconds exactly, with cuts on strong beats.
+
+    weights are the relative image lengths asked for (the typed durations);
+    every cut goes to the strongest beat near where those proportions put
+    it, and stays at the proportional position when no beat is close enough.
+    """
+    count = len(weights)
+    weights = np.asarray(weights, dtype=np.float64)
+    min_seconds = min(min_seconds, total_seconds / count)
+    targets = np.cumsum(weights)[:-1] / weights.sum() * total_seconds
+    beats = np.asarray(analysis.get('beats') or [], dtype=np.float64)
+    strengths = np.asarray(analysis.get('strengths') or [], dtype=np.float64)
+    # A cut may move up to a quarter of the average image, or one beat if images are short
+    spacing = float(np.median(np.diff(beats))) if len(beats) > 1 else 0.0
+    reach = max(spacing, 0.25 * total_seconds / count)
+
+    cuts = []
+    last = 0.0
+    for idx, target in enumerate(targets):
+        latest = total_seconds - (count - 1 - idx) * min_seconds  # Leave room for the images after this one
+        candidates = (beats >= last + min_seconds) & (beats <= latest) & (np.abs(beats - target) <= reach)
+        if candidates.any():
+            # Strength, discounted by distance: a beat at the edge of the reach
+            # has to be about 1.6x as strong as one right on the target
+            distance = (beats[candidates] - target) / reach
+            score = strengths[candidates] * np.exp(-0.5 * distance ** 2)
+            cut = beats[candidates][int(np.argmax(score))]
+        else:
+            cut = min(max(target, last + min_seconds), latest)
+        cuts.append(cut)
+        last = cut
+
+    edges = np.round([0.0] + cuts, 3)
+    durations = [round(float(d), 3) for d in np.diff(edges)]
+    durations.append(round(total_seconds - float(edges[-1]), 3))
+    return durations
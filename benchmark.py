@@ -0,0 +1,445 @@
+"""Offline benchmark of the render pipeline.
+
+Builds synthetic inputs in a scratch folder (PIL images in several sizes,
+modes and formats; FFmpeg sine/noise audio that hits the loop, trim and
+exact-match branches), renders a matrix of reels with cold caches and
+reports per-stage timings, throughput (output seconds per wall second) and
+peak RSS. Every scenario runs in its own process, so its peak RSS is its own. Text reels use a stubbed TTS, so nothing touches the network.
+
+    python benchmark.py --quick                    # small matrix
+    python benchmark.py --save-baseline            # record benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json --tolerance 0.15
+    python benchmark.py --startup                  # app import and create_app() budget
+
+Exits with status 1 when a scenario regressed against the baseline, or
+when startup went over its budget.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import ffmpeg
+from PIL import Image
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(REPO_DIR, 'benchmark_baseline.json')
+
+# (size, mode, format) cycled over the images of every scenario
+IMAGE_VARIANTS = [
+    ((4000, 3000), 'RGB', 'JPEG'),
+    ((1200, 1600), 'RGBA', 'PNG'),
+    ((800, 800), 'L', 'JPEG'),
+    ((640, 480), 'P', 'GIF'),
+    ((2000, 2000), 'CMYK', 'JPEG'),
+    ((3000, 1000), 'LA', 'PNG'),
+    ((1920, 1080), 'RGB', 'PNG'),
+]
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif'}
+
+# (name, image count, seconds per image, audio: 'exact', 'loop', 'trim' or 'text')
+SCENARIOS = [
+    ('3x2s-exact', 3, 2.0, 'exact'),
+    ('3x2s-loop', 3, 2.0, 'loop'),
+    ('3x2s-trim', 3, 2.0, 'trim'),
+    ('4x3s-text', 4, 3.0, 'text'),
+    ('10x2s-exact', 10, 2.0, 'exact'),
+    ('5x8s-loop', 5, 8.0, 'loop'),
+    ('20x1.5s-trim', 20, 1.5, 'trim'),
+]
+QUICK_SCENARIOS = {'3x2s-exact', '3x2s-loop', '3x2s-trim', '4x3s-text'}
+
+TTS_SECONDS_PER_CHAR = 0.06
+MIN_REGRESSION_SECONDS = 0.05  # Smaller slowdowns are timer noise
+
+# Cold `import app` plus create_app() in a fresh interpreter; the web
+# process, every worker process and the CLI tools all pay it
+STARTUP_BUDGET_SECONDS = 0.5
+# Loaded on the first render or synthesis, never by importing the app
+DEFERRED_MODULES = ('ffmpeg', 'gtts', 'requests', 'PIL', 'mutagen', 'numpy', 'render', 'imaging', 'tts', 'beats')
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app(start_janitor=False)
+created = time.perf_counter()
+print(json.dumps({
+    'import_seconds': imported - started,
+    'create_app_seconds': created - imported,
+    'loaded': sorted(name for name in %r if name in sys.modules),
+}))
+"""
+
+
+def make_image(path, size, mode, fmt, seed):
+    """Deterministic test image with detail everywhere (so JPEG sizes are realistic)"""
+    width, height = size
+    small = (max(1, width // 4), max(1, height // 4))
+    detail = Image.effect_mandelbrot(small, (-2.0 + seed * 0.05, -1.2, 0.8, 1.2), 64).resize(size)
+    horizontal = Image.linear_gradient('L').rotate(90).resize(size)
+    radial = Image.radial_gradient('L').resize(size)
+    img = Image.merge('RGB', (detail, horizontal, radial))
+    if mode == 'RGBA':
+        img = img.convert('RGBA')
+        img.putalpha(radial)
+    elif mode == 'LA':
+        img = img.convert('LA')
+        img.putalpha(horizontal)
+    elif mode == 'P':
+        img = img.convert('P', palette=Image.ADAPTIVE)
+    else:
+        img = img.convert(mode)
+    img.save(path, fmt)
+    return path
+
+
+def make_audio(path, seconds, kind='sine'):
+    """MP3 of a sine tone or seeded pink noise, generated by FFmpeg"""
+    if kind == 'noise':
+        source = f"anoisesrc=color=pink:seed=7:amplitude=0.3:duration={seconds}"
+    else:
+        source = f"sine=frequency=440:sample_rate=44100:duration={seconds}"
+    (
+        ffmpeg.input(source, f='lavfi')
+        .output(path, acodec='libmp3lame', **{'b:a': '128k'})
+        .global_args('-loglevel', 'error')
+        .overwrite_output()
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return path
+
+
+class StubTTS:
+    """Drop-in for gTTS: a tone whose length follows the text, no network"""
+
+    def __init__(self, text, lang='en', **kwargs):
+        self.text = text
+
+    def save(self, path):
+        make_audio(path, max(1.0, round(len(self.text) * TTS_SECONDS_PER_CHAR, 2)))
+
+
+def build_inputs(scenario, folder):
+    name, count, seconds, audio = scenario
+    os.makedirs(folder, exist_ok=True)
+    images = []
+    for idx in range(count):
+        size, mode, fmt = IMAGE_VARIANTS[idx % len(IMAGE_VARIANTS)]
+        path = os.path.join(folder, f"image_{idx}.{EXTENSIONS[fmt]}")
+        images.append(make_image(path, size, mode, fmt, seed=idx))
+    total = count * seconds
+    inputs = {'images': images, 'durations': [seconds] * count, 'total': total}
+    if audio == 'text':
+        inputs['text'] = ("Benchmark narration. " * 200)[:int(total / TTS_SECONDS_PER_CHAR)]
+    else:
+        audio_seconds = {'exact': total, 'loop': total * 0.4, 'trim': total * 1.8 + 2}[audio]
+        kind = 'noise' if audio == 'trim' else 'sine'
+        inputs['audio'] = make_audio(os.path.join(folder, 'audio.mp3'), round(audio_seconds, 2), kind)
+    return inputs
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of the largest finished child (FFmpeg), in MB.
+
+    Both are lifetime peaks, so every scenario runs in a fresh process (run_isolated).
+    """
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(self_kb / 1024, 1), round(children_kb / 1024, 1)
+
+
+def time_probes(inputs):
+    import probe
+    with probe._memo_lock:
+        probe._memo.clear()  # Measure real header reads, not memo hits
+    started = time.perf_counter()
+    for path in inputs['images']:
+        probe.probe_image(path)
+    if 'audio' in inputs:
+        probe.probe_audio(inputs['audio'])
+    return time.perf_counter() - started
+
+
+def time_graph_build(reel_app, inputs, profile, folder):
+    """Time building the FFmpeg graph and command line for the configured render path"""
+    import render
+    render_path = reel_app.app.config['RENDER_PATH']
+    started = time.perf_counter()
+    if render_path == 'filtergraph':
+        video = render.build_filtergraph_video(inputs['images'], inputs['durations'],
+                                               profile['width'], profile['height'], profile['fps'])
+    elif render_path == 'concat':
+        video = render.build_concat_video(inputs['images'], inputs['durations'],
+                                          os.path.join(folder, 'graph.ffconcat'), profile['fps'])
+    else:
+        segments = render.plan_segments(inputs['images'], inputs['durations'], profile['fps'],
+                                        reel_app.app.config['SEGMENT_MAX_SECONDS'])
+        video = render.build_segment_video([os.path.join(folder, f"segment_{idx:04d}.mp4")
+                                            for idx in range(len(segments))],
+                                           os.path.join(folder, 'graph.ffconcat'))
+    ffmpeg.output(video, os.path.join(folder, 'graph.mp4')).compile()
+    return time.perf_counter() - started
+
+
+def measure_startup(runs=5):
+    """Median cold import and create_app() times over fresh interpreters, and the
+    deferred modules that importing the app loaded anyway"""
+    samples = []
+    root = tempfile.mkdtemp(prefix='reel-startup-')
+    try:
+        for _ in range(runs):
+            out = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT % (DEFERRED_MODULES,)],
+                                 cwd=root, env=dict(os.environ, PYTHONPATH=REPO_DIR, PYTHONDONTWRITEBYTECODE='1'),
+                                 capture_output=True, text=True, check=True).stdout
+            samples.append(json.loads(out.strip().splitlines()[-1]))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return {
+        'import_seconds': round(statistics.median(s['import_seconds'] for s in samples), 4),
+        'create_app_seconds': round(statistics.median(s['create_app_seconds'] for s in samples), 4),
+        'loaded': sorted({name for s in samples for name in s['loaded']}),
+    }
+
+
+def check_startup(budget):
+    startup = measure_startup()
+    total = startup['import_seconds'] + startup['create_app_seconds']
+    print(f"🚀 import app {startup['import_seconds'] * 1000:.0f}ms + create_app() "
+          f"{startup['create_app_seconds'] * 1000:.0f}ms = {total * 1000:.0f}ms (budget {budget * 1000:.0f}ms)")
+    ok = True
+    if startup['loaded']:
+        print(f"⚠️ Importing the app loaded {', '.join(startup['loaded'])}")
+        ok = False
+    if total > budget:
+        print("⚠️ Startup is over budget")
+        ok = False
+    if ok:
+        print("✅ Startup within budget")
+    return 0 if ok else 1
+
+
+def reset_render_state(reel_app):
+    """Cold start for every run: no cached images, segments, stages or speech"""
+    for key in ('IMAGE_CACHE_FOLDER', 'SEGMENT_CACHE_FOLDER', 'STAGE_FOLDER', 'TTS_CACHE_FOLDER'):
+        shutil.rmtree(reel_app.app.config[key], ignore_errors=True)
+
+
+def run_once(reel_app, scenario, inputs, profile_name, folder, run_idx, verbose):
+    from progress import RenderProgress
+    name = scenario[0]
+    reset_render_state(reel_app)
+    reel_id = f"bench_{name}_{run_idx}"
+    config = {
+        'image_paths': inputs['images'],
+        'durations': inputs['durations'],
+        'profile': profile_name,
+        'type': 'text_input' if 'text' in inputs else 'audio_input',
+        'audio_path': inputs.get('audio') or os.path.join(folder, f"speech_{run_idx}.mp3"),
+    }
+    stages = {}
+    progress = RenderProgress(inputs['total'])
+    output = io.StringIO()
+    with contextlib.redirect_stdout(sys.stdout if verbose else output):
+        started = time.perf_counter()
+        stages['probe'] = time_probes(inputs)
+        stages['graph_build'] = time_graph_build(reel_app, inputs, reel_app.reel_profile(config), folder)
+        if 'text' in inputs:
+            speech_started = time.perf_counter()
+            reel_app.generate_audio_from_text(inputs['text'], config['audio_path'])
+            stages['speech'] = time.perf_counter() - speech_started
+        output_path = reel_app.generate_reel(reel_id, config, progress=progress)
+        wall = time.perf_counter() - started
+    stages.update(progress.phase_seconds)
+    os.remove(output_path)
+    return wall, stages
+
+
+def run_scenario(reel_app, scenario, root, profile_name, repeat, verbose):
+    name = scenario[0]
+    folder = os.path.join(root, 'inputs', name)
+    inputs = build_inputs(scenario, folder)
+    walls, stage_runs = [], []
+    for run_idx in range(repeat):
+        wall, stages = run_once(reel_app, scenario, inputs, profile_name, folder, run_idx, verbose)
+        walls.append(wall)
+        stage_runs.append(stages)
+
+    stage_names = sorted({stage for stages in stage_runs for stage in stages})
+    wall = statistics.median(walls)
+    self_rss, child_rss = peak_rss_mb()
+    return {
+        'images': scenario[1],
+        'output_seconds': inputs['total'],
+        'audio': scenario[3],
+        'runs': repeat,
+        'wall_seconds': round(wall, 3),
+        'throughput': round(inputs['total'] / wall, 2),  # Output seconds per wall second
+        'stages': {stage: round(statistics.median(stages.get(stage, 0.0) for stages in stage_runs), 3)
+                   for stage in stage_names},
+        'peak_rss_mb': self_rss,
+        'peak_child_rss_mb': child_rss,
+    }
+
+
+def load_app(root):
+    """The app, working in root, with the TTS stubbed out"""
+    # The app keeps uploads, outputs and caches relative to the working directory
+    os.chdir(root)
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    import app as reel_app
+    if reel_app.app is None:
+        reel_app.create_app(start_janitor=False)
+        reel_app.app.config['ELEVENLABS_API_KEY'] = None  # Text reels go through gTTS...
+        reel_app.gTTS = StubTTS  # ...which is stubbed out
+    return reel_app
+
+
+def scenario_process(scenario, root, profile_name, repeat, verbose):
+    return run_scenario(load_app(root), scenario, root, profile_name, repeat, verbose)
+
+
+def run_isolated(scenario, root, profile_name, repeat, verbose):
+    """run_scenario in a freshly spawned interpreter, so its peak RSS is its own"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(scenario_process, scenario, root, profile_name, repeat, verbose).result()
+
+
+def compare(results, baseline, tolerance):
+    """Slower-than-baseline metrics, as (scenario, metric, baseline, current) tuples"""
+    regressions = []
+    for name, result in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        metrics = [('wall_seconds', base['wall_seconds'], result['wall_seconds'])]
+        metrics += [(f"stage:{stage}", base['stages'][stage], seconds)
+                    for stage, seconds in result['stages'].items() if stage in base['stages']]
+        for metric, before, now in metrics:
+            if now > before * (1 + tolerance) and now - before > MIN_REGRESSION_SECONDS:
+                regressions.append((name, metric, before, now))
+        if result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+            regressions.append((name, 'peak_rss_mb', base['peak_rss_mb'], result['peak_rss_mb']))
+    return regressions
+
+
+def environment(reel_app):
+    try:
+        ffmpeg_version = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout.split('\n')[0]
+    except OSError:
+        ffmpeg_version = None
+    try:
+        commit = subprocess.run(['git', '-C', REPO_DIR, 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'ffmpeg': ffmpeg_version,
+        'commit': commit,
+        'render_path': reel_app.app.config['RENDER_PATH'],
+    }
+
+
+def print_table(results):
+    print(f"\n{'scenario':<14} {'wall s':>8} {'x realtime':>10} {'rss MB':>8}  stages (s)")
+    for name, result in results['scenarios'].items():
+        stages = ', '.join(f"{stage} {seconds:.2f}" for stage, seconds in result['stages'].items())
+        print(f"{name:<14} {result['wall_seconds']:>8.2f} {result['throughput']:>10.2f} "
+              f"{result['peak_rss_mb']:>8.0f}  {stages}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the render pipeline on synthetic inputs")
+    parser.add_argument('--quick', action='store_true', help="Only the small scenarios")
+    parser.add_argument('--scenario', action='append', help="Run only this scenario (repeatable)")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per scenario; the median is reported")
+    parser.add_argument('--profile', default='landscape', help="Render profile to benchmark")
+    parser.add_argument('--render-path', choices=['segments', 'concat', 'filtergraph'],
+                        help="Override RENDER_PATH")
+    parser.add_argument('--baseline', default=None, help="Baseline JSON to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help=f"Write results to {DEFAULT_BASELINE}")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="Allowed slowdown before flagging (0.15 = 15%%)")
+    parser.add_argument('--output', default=None, help="Also write results JSON here")
+    parser.add_argument('--keep', action='store_true', help="Keep the scratch folder")
+    parser.add_argument('--verbose', action='store_true', help="Show the renderer's own output")
+    parser.add_argument('--startup', action='store_true', help="Only check app startup time against its budget")
+    parser.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET_SECONDS,
+                        help="Startup budget in seconds (default: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.startup:
+        return check_startup(args.startup_budget)
+
+    scenarios = [scenario for scenario in SCENARIOS
+                 if (not args.quick or scenario[0] in QUICK_SCENARIOS)
+                 and (not args.scenario or scenario[0] in args.scenario)]
+    if not scenarios:
+        parser.error("no scenario selected")
+    if args.tolerance < 0:
+        parser.error("--tolerance must not be negative")
+    baseline_path = args.baseline or (DEFAULT_BASELINE if os.path.exists(DEFAULT_BASELINE) and not args.save_baseline else None)
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    root = tempfile.mkdtemp(prefix='reel-bench-')
+    if args.render_path:
+        os.environ['RENDER_PATH'] = args.render_path
+    reel_app = load_app(root)
+    if args.profile not in reel_app.app.config['RENDER_PROFILES']:
+        parser.error(f"unknown profile {args.profile}")
+
+    results = {
+        'created_at': datetime.now().isoformat(),
+        'profile': args.profile,
+        'environment': environment(reel_app),
+        'scenarios': {},
+    }
+    try:
+        for scenario in scenarios:
+            print(f"⏱️ {scenario[0]} ...", flush=True)
+            results['scenarios'][scenario[0]] = run_isolated(scenario, root, args.profile,
+                                                             max(1, args.repeat), args.verbose)
+    finally:
+        if not args.keep:
+            shutil.rmtree(root, ignore_errors=True)
+        else:
+            print(f"Scratch folder kept at {root}")
+
+    print_table(results)
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump(results, f, indent=4)
+    if args.save_baseline:
+        with open(DEFAULT_BASELINE, 'w') as f:
+            json.dump(results, f, indent=4)
+        print(f"\n📝 Baseline saved to {DEFAULT_BASELINE}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        print(f"\nCompared with {baseline_path} (commit {baseline.get('environment', {}).get('commit')}, "
+              f"tolerance {args.tolerance:.0%})")
+        for name, metric, before, now in regressions:
+            print(f"⚠️ {name} {metric}: {before} -> {now} (+{(now / before - 1) * 100:.0f}%)")
+        if regressions:
+            return 1
+        print("✅ No regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -12,12 +12,108 @@ class Config:
     UPLOAD_TEXT_FOLDER = 'uploads/text_input_reels'
     OUTPUT_FOLDER = 'outputs'
     
-    # Upload Limits
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
+    # Upload Limits (uploads are streamed to disk and validated chunk by chunk)
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 512 * 1024 * 1024))  # 512MB per request
+    MAX_IMAGE_UPLOAD_BYTES = int(os.getenv('MAX_IMAGE_UPLOAD_BYTES', 40 * 1024 * 1024))  # 40MB per image
+    MAX_AUDIO_UPLOAD_BYTES = int(os.getenv('MAX_AUDIO_UPLOAD_BYTES', 100 * 1024 * 1024))  # 100MB per audio file
+
+    # Render Queue
+    RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', 8))  # Render jobs in progress; the governor decides how many encode at once
+    JOB_RETENTION_HOURS = 1  # How long finished job states stay queryable
+    PREVIEW_WAIT_SECONDS = 2  # How long preview() blocks on an in-flight job before showing progress
+    PROGRESS_INTERVAL_SECONDS = 0.5  # How often the progress stream checks for new FFmpeg reports
+
+    # Resource Governor (admission control for encodes)
+    ENCODE_THREADS = int(os.getenv('ENCODE_THREADS', 4))  # FFmpeg threads per encoding render, shared by its segment encodes
+    ENCODE_MEMORY_BYTES = int(os.getenv('ENCODE_MEMORY_BYTES', 1024 * 1024 * 1024))  # 1GB budgeted per encoding render
+    MAX_CONCURRENT_ENCODES = int(os.getenv('MAX_CONCURRENT_ENCODES', 0))  # 0: as many as cores and memory allow
+    MAX_QUEUE_WAIT_SECONDS = int(os.getenv('MAX_QUEUE_WAIT_SECONDS', 300))  # New reels that would wait longer get 503 + Retry-After
+    DEFAULT_RENDER_SECONDS = 60  # Render time assumed until renders have finished
+
+    # Distributed Workers (RENDER_MODE=spool; start python worker.py on any host)
+    RENDER_MODE = os.getenv('RENDER_MODE', 'local')  # 'local' (render threads in the web process) or 'spool' (worker processes)
+    SPOOL_FOLDER = os.getenv('SPOOL_FOLDER', 'spool')  # Shared by web and worker nodes, mounted like the upload and output folders
+    SPOOL_LEASE_SECONDS = int(os.getenv('SPOOL_LEASE_SECONDS', 30))  # A job whose worker stops heartbeating this long is re-queued
+    SPOOL_HEARTBEAT_SECONDS = 2  # Lease renewal, also how often workers publish render progress
+    SPOOL_MAX_ATTEMPTS = 3  # Expired leases before a job is marked failed
+    SPOOL_POLL_SECONDS = 1  # How often an idle worker looks for new jobs
+
+    # Batch Rendering (python batch.py manifest.json, or POST /batch)
+    BATCH_PARALLELISM = int(os.getenv('BATCH_PARALLELISM', 2))  # Reels a batch renders at once; API requests may ask for fewer
+    BATCH_REPORT_FOLDER = 'outputs/batches'  # Results report per batch, as JSON
+    BATCH_INPUT_ROOT = os.getenv('BATCH_INPUT_ROOT')  # Folder the batch API reads manifest files from; unset disables the API
+    BATCH_MARKER_FOLDER = 'outputs/batch_active'  # One file per reel a batch is rendering, seen by every process's janitor
+    BATCH_REEL_MAX_AGE_HOURS = float(os.getenv('BATCH_REEL_MAX_AGE_HOURS', 7 * 24))  # Batch reels are not previewed: kept this long instead of REEL_MAX_AGE_HOURS
+
+    # Disk Janitor (replaces the one-off cleanup at startup)
+    JANITOR_INTERVAL_SECONDS = int(os.getenv('JANITOR_INTERVAL_SECONDS', 300))  # Time between sweeps
+    JANITOR_ENABLED = os.getenv('JANITOR_ENABLED', 'true').lower() == 'true'  # One janitor per deployment: set false on every web node but one
+    REEL_MAX_AGE_HOURS = float(os.getenv('REEL_MAX_AGE_HOURS', 1))  # Reels not previewed or downloaded for this long are deleted
+    REEL_DISK_BUDGET_BYTES = int(os.getenv('REEL_DISK_BUDGET_BYTES', 20 * 1024 * 1024 * 1024))  # 20GB of outputs, uploads and stages; least recently accessed reels go first
+    JANITOR_GRACE_SECONDS = 600  # Reels and scratch folders touched this recently are never deleted
+
+    # Render Profiles (output size, frame rate, x264 preset/CRF and AAC bitrate)
+    RENDER_PROFILES = {
+        'vertical': {'width': 1080, 'height': 1920, 'fps': 30, 'preset': 'fast', 'crf': 23, 'audio_bitrate': '192k'},
+        'square': {'width': 1080, 'height': 1080, 'fps': 30, 'preset': 'fast', 'crf': 23, 'audio_bitrate': '192k'},
+        'landscape': {'width': 1920, 'height': 1080, 'fps': 24, 'preset': 'fast', 'crf': 23, 'audio_bitrate': '192k'},
+        'draft': {'width': 854, 'height': 480, 'fps': 15, 'preset': 'ultrafast', 'crf': 30, 'audio_bitrate': '96k'},
+    }
+    DEFAULT_RENDER_PROFILE = os.getenv('DEFAULT_RENDER_PROFILE', 'landscape')
+    DRAFT_PROFILE = 'draft'  # Drafts use these settings at the aspect ratio of the final profile
+    DRAFT_FIRST = os.getenv('DRAFT_FIRST', 'false').lower() == 'true'  # Default when a request does not say
+
+    # Rendering
+    STAGE_FOLDER = 'outputs/stages'  # Per-reel video-only and audio-only streams, reused by re-renders
+    RENDER_PATH = os.getenv('RENDER_PATH', 'segments')  # 'concat' (pre-composited stills), 'segments' (parallel segment encodes) or 'filtergraph' (per-frame scale/pad)
+    SEGMENT_WORKERS = int(os.getenv('SEGMENT_WORKERS', os.cpu_count() or 1))  # Concurrent segment encodes
+    SEGMENT_MAX_SECONDS = 10  # Longer images are split into several segments
+    SEGMENT_CACHE_FOLDER = 'outputs/segment_cache'
+    SEGMENT_CACHE_MAX_BYTES = int(os.getenv('SEGMENT_CACHE_MAX_BYTES', 5 * 1024 * 1024 * 1024))  # 5GB, LRU-evicted
+
+    # Image Preprocessing
+    PREPROCESS_WORKERS = int(os.getenv('PREPROCESS_WORKERS', os.cpu_count() or 1))  # Process pool size
+    IMAGE_CACHE_FOLDER = 'outputs/image_cache'
+    IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))  # 2GB, LRU-evicted
+    MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', 100_000_000))  # Decompression bomb guard, checked from the header
+    PREPROCESS_MEMORY_BYTES = int(os.getenv('PREPROCESS_MEMORY_BYTES', 1024 * 1024 * 1024))  # 1GB of decoded pixels in flight per render job
+
+    # Renditions (POST /reels/<reel_id>/renditions: every size in one FFmpeg run, as MP4 and HLS)
+    RENDITIONS = {  # Sized by short side at the reel's aspect ratio; sizes above the reel's profile are skipped
+        '1080p': {'short_side': 1080, 'crf': 23, 'maxrate': '5000k'},
+        '720p': {'short_side': 720, 'crf': 23, 'maxrate': '2800k'},
+        '480p': {'short_side': 480, 'crf': 25, 'maxrate': '1200k'},
+        '360p': {'short_side': 360, 'crf': 26, 'maxrate': '700k'},
+    }
+    RENDITION_FOLDER = 'outputs/renditions'  # <reel_id>/<name>.mp4 and <reel_id>/hls/master.m3u8
+    HLS_SEGMENT_SECONDS = 4  # Also the keyframe interval of every rendition
+
+    # Beat-Synced Durations (duration mode 'auto': cuts move onto the beats of the audio)
+    BEAT_CACHE_FOLDER = 'outputs/beat_cache'  # One JSON analysis per audio content hash
+    BEAT_CACHE_MAX_BYTES = int(os.getenv('BEAT_CACHE_MAX_BYTES', 50 * 1024 * 1024))  # 50MB, LRU-evicted
+    BEAT_SAMPLE_RATE = 22050  # Audio is decoded to mono PCM at this rate for analysis
+    BEAT_BLOCK_SECONDS = 10  # PCM analysed per vectorized block; bounds analysis memory
+    BEAT_MIN_SHOT_SECONDS = 1.0  # No image is cut shorter than this
+
+    # Media Delivery
+    MEDIA_MAX_AGE = 365 * 24 * 3600  # Cache lifetime of versioned /media URLs (immutable)
+    USE_X_SENDFILE = os.getenv('USE_X_SENDFILE', 'false').lower() == 'true'  # Let nginx/Apache send the file
+
+    # Text-to-Speech Cache
+    TTS_CACHE_FOLDER = 'outputs/tts_cache'
+    TTS_CACHE_MAX_BYTES = int(os.getenv('TTS_CACHE_MAX_BYTES', 500 * 1024 * 1024))  # 500MB, LRU-evicted
+    TTS_CACHE_MAX_AGE_DAYS = int(os.getenv('TTS_CACHE_MAX_AGE_DAYS', 30))  # Entries unused this long expire
     
     # ElevenLabs Configuration (from environment variables)
     ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
-    ELEVENLABS_VOICE_ID = os.getenv('ELEVENLABS_VOICE_ID')    
+    ELEVENLABS_VOICE_ID = os.getenv('ELEVENLABS_VOICE_ID')
+    ELEVENLABS_API_URL = os.getenv('ELEVENLABS_API_URL', 'https://api.elevenlabs.io')  # Point at a stand-in server for testing
+    ELEVENLABS_TIMEOUT = 30  # Seconds per request
+
+    # Text-to-Speech Synthesis
+    TTS_MODE = os.getenv('TTS_MODE', 'chunked')  # 'chunked' (sentence chunks in parallel) or 'single'
+    TTS_CHUNK_CHARS = 400  # Upper bound per chunk; chunks end on sentence boundaries
+    TTS_CONCURRENCY = int(os.getenv('TTS_CONCURRENCY', 4))  # Parallel chunk requests / pooled connections
     
     # Ensure directories exist
     @staticmethod
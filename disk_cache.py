@@ -0,0 +1,166 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+
+_evict_lock = threading.Lock()
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's contents, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(src, dest):
+    """Hardlink src to dest (copy across filesystems); dest survives later eviction of src"""
+    if os.path.exists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+
+class DiskCache:
+    """Content-addressed files on disk with LRU eviction under a size budget.
+
+    Entries are written atomically (temp file + os.replace), so concurrent
+    writers of the same key never see partial files. File mtimes double as
+    the LRU clock: every hit touches the entry, and entries left unused for
+    longer than max_age_seconds expire.
+    """
+
+    def __init__(self, folder, max_bytes, max_age_seconds=None, suffix=''):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, key):
+        return os.path.join(self.folder, key[:2], key + self.suffix)
+
+    def lookup(self, key):
+        """Path of a cached entry (touched for LRU), or None on a miss"""
+        path = self.path_for(key)
+        try:
+            if self._expired(os.stat(path)):
+                raise FileNotFoundError(path)
+            os.utime(path, None)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def materialize(self, key, dest):
+        """Link a cached entry to dest; False if it is missing or was evicted meanwhile"""
+        path = self.lookup(key)
+        if path is None:
+            return False
+        try:
+            link_or_copy(path, dest)
+        except FileNotFoundError:
+            self.hits -= 1
+            self.misses += 1
+            return False
+        return True
+
+    def store(self, key, write_fn):
+        """Create an entry by calling write_fn(temp_path), then publish it atomically"""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Keep the suffix last so tools that pick a format by extension still work
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp{self.suffix}"
+        try:
+            write_fn(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
+
+    def store_file(self, key, src_path):
+        """Copy an existing file into the cache"""
+        return self.store(key, lambda tmp_path: shutil.copyfile(src_path, tmp_path))
+
+    def record(self, hits=0, misses=0):
+        """Count lookups made on a copy of this cache, e.g. one pickled into a worker process"""
+        self.hits += hits
+        self.misses += misses
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+    def _expired(self, st):
+        return bool(self.max_age_seconds) and time.time() - st.st_mtime > self.max_age_seconds
+
+    def _entries(self):
+        entries = []
+        if not os.path.exists(self.folder):
+            return entries
+        for shard in os.scandir(self.folder):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, st))
+        return entries
+
+    def evict(self):
+        """Drop expired entries and stale temp files, then least-recently-used ones over budget.
+
+        Returns the number of bytes reclaimed.
+        """
+        reclaimed = 0
+        now = time.time()
+        with _evict_lock:
+            live = []
+            for path, st in self._entries():
+                if self._is_temp(path):
+                    if now - st.st_mtime > 3600:
+                        reclaimed += self._remove(path, st)
+                elif self._expired(st):
+                    reclaimed += self._remove(path, st)
+                else:
+                    live.append((path, st))
+
+            total = sum(st.st_size for _, st in live)
+            if total > self.max_bytes:
+                for path, st in sorted(live, key=lambda item: item[1].st_mtime):
+                    if total <= self.max_bytes:
+                        break
+                    freed = self._remove(path, st)
+                    reclaimed += freed
+                    total -= freed
+
+        if reclaimed:
+            print(f"🧹 Evicted {reclaimed / (1024 * 1024):.1f}MB from {self.folder}")
+        return reclaimed
+
+    @staticmethod
+    def _is_temp(path):
+        return '.tmp' in os.path.basename(path)
+
+    @staticmethod
+    def _remove(path, st):
+        try:
+            os.remove(path)
+            return st.st_size
+        except FileNotFoundError:
+            return 0
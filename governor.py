@@ -0,0 +1,100 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Lower runs first: someone is watching a draft, a final render was asked
+# for interactively, a batch reel can wait
+DRAFT = 0
+FINAL = 1
+BATCH = 2
+PRIORITY_NAMES = {DRAFT: 'draft', FINAL: 'final', BATCH: 'batch'}
+
+
+def physical_memory():
+    """Total RAM in bytes, or None where the OS does not report it"""
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def encode_slots(cores, threads_per_encode, memory_bytes=None, memory_per_encode=None):
+    """Encodes that fit at once: every encode gets its threads, and their memory fits in RAM"""
+    slots = max(1, cores // threads_per_encode)
+    if memory_bytes and memory_per_encode:
+        slots = min(slots, max(1, memory_bytes // memory_per_encode))
+    return slots
+
+
+class ResourceGovernor:
+    """Caps how many renders encode at once and hands free slots out by priority.
+
+    Each slot stands for threads_per_encode cores; FFmpeg processes started
+    while holding a slot are limited to that many threads between them.
+    Waiters are served lowest priority value first, then in arrival order.
+    """
+
+    def __init__(self, slots, threads_per_encode):
+        self.slots = slots
+        self.threads = threads_per_encode
+        self.active = 0
+        self._waiting = []  # heap of (priority, seq, event)
+        self._recent = deque(maxlen=20)  # How long recent renders held their slot
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, priority=FINAL):
+        """Hold an encode slot for the with-block, waiting for one if all are taken"""
+        waited = self._acquire(priority)
+        if waited >= 1:
+            print(f"🚦 Waited {waited:.1f}s for an encode slot ({PRIORITY_NAMES.get(priority, priority)})")
+        started = time.monotonic()
+        try:
+            yield self.threads
+        finally:
+            self._recent.append(time.monotonic() - started)
+            self._release()
+
+    def _acquire(self, priority):
+        started = time.monotonic()
+        with self._lock:
+            if self.active < self.slots and not self._waiting:
+                self.active += 1
+                return 0.0
+            ready = threading.Event()
+            heapq.heappush(self._waiting, (priority, next(self._seq), ready))
+        ready.wait()  # _release hands the slot over: active already counts it
+        return time.monotonic() - started
+
+    def _release(self):
+        with self._lock:
+            if self._waiting:
+                _, _, ready = heapq.heappop(self._waiting)
+                ready.set()
+            else:
+                self.active -= 1
+
+    def recent_seconds(self):
+        return list(self._recent)
+
+    def stats(self):
+        with self._lock:
+            waiting = {}
+            for priority, _, _ in self._waiting:
+                name = PRIORITY_NAMES.get(priority, str(priority))
+                waiting[name] = waiting.get(name, 0) + 1
+            return {'slots': self.slots, 'threads_per_encode': self.threads, 'active': self.active,
+                    'waiting': waiting}
+
+
+def estimate_wait(jobs_ahead, capacity, recent_seconds, default_seconds):
+    """Seconds until a newly queued render would start, from queue depth and recent render times"""
+    if jobs_ahead < capacity:
+        return 0.0
+    per_job = sum(recent_seconds) / len(recent_seconds) if recent_seconds else default_seconds
+    return (jobs_ahead - capacity + 1) * per_job / capacity
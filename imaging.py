@@ -0,0 +1,309 @@
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+from disk_cache import file_digest, link_or_copy
+import metrics
+
+# Part of every cache key: changes to how cleaned images are produced must change this
+CLEAN_VARIANT = 'q95-444-draft'
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    """Process pool shared by all render jobs so concurrent reels stay within one CPU budget"""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers)
+            _pool_workers = workers
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+def fit_within(width, height, target_width, target_height):
+    """Largest even size with the image's aspect ratio that fits the target box"""
+    scale = min(target_width / width, target_height / height)
+    fit_w = max(2, min(target_width, int(round(width * scale))) // 2 * 2)
+    fit_h = max(2, min(target_height, int(round(height * scale))) // 2 * 2)
+    return fit_w, fit_h
+
+
+def _variant(canvas, bounds=None):
+    if canvas is not None:
+        geometry = f"canvas{canvas[0]}x{canvas[1]}"
+    elif bounds is not None:
+        geometry = f"fit{bounds[0]}x{bounds[1]}"
+    else:
+        geometry = 'even'
+    return f"{geometry}-{CLEAN_VARIANT}"
+
+
+class ImageTooLarge(Exception):
+    """An image exceeds the pixel guard or cannot be decoded within the memory ceiling"""
+
+
+def decode_size(img, bounds=None):
+    """Size an opened (not yet loaded) image will decode at, after JPEG draft mode for bounds.
+
+    draft() only switches the decoder to a DCT scale (1/2, 1/4, 1/8) that
+    still covers the size the image is fitted to, so quality is unaffected.
+    """
+    if bounds is not None and img.format == 'JPEG':
+        fit_w, fit_h = fit_within(img.width, img.height, *bounds)
+        img.draft('RGB', (fit_w, fit_h))
+    return img.size
+
+
+def decode_bytes(path, bounds=None):
+    """Estimated peak memory of preprocessing one image, from its header alone"""
+    with Image.open(path) as img:
+        w, h = decode_size(img, bounds)
+    # Decoded RGB(A) pixels plus the resized copy, which is never larger than bounds
+    out_w, out_h = bounds or (w, h)
+    return w * h * 4 + out_w * out_h * 3
+
+
+def open_bounded(img_path, bounds=None, max_pixels=None):
+    """Decode an image as RGB, as close to bounds as the format allows.
+
+    The pixel count is checked from the header before anything is decoded.
+    JPEGs decode straight to a reduced size in draft mode; other formats
+    are decoded in full and reduced by an integer factor right away, so the
+    RGB conversion and resize work on the smaller image.
+    """
+    img = Image.open(img_path)
+    try:
+        if max_pixels and img.width * img.height > max_pixels:
+            raise ImageTooLarge(f"{img.width}x{img.height} is over the {max_pixels / 1e6:.0f}MP limit")
+        decode_size(img, bounds)
+        img.load()  # Raises on truncated or corrupt data
+        if bounds is not None:
+            fit_w, fit_h = fit_within(img.width, img.height, *bounds)
+            factor = min(img.width // fit_w, img.height // fit_h)
+            if factor >= 2:
+                if img.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                    img = _replace(img, img.convert('RGB'))  # reduce() has no palette modes
+                img = _replace(img, img.reduce(factor))
+        if img.mode != 'RGB':
+            img = _replace(img, img.convert('RGB'))
+        return img
+    except Exception:
+        img.close()
+        raise
+
+
+def composite_on_canvas(img, canvas):
+    """Scale an RGB image to fit canvas=(width, height) and center it on black, like scale+pad in FFmpeg"""
+    canvas_w, canvas_h = canvas
+    fit_w, fit_h = fit_within(img.width, img.height, canvas_w, canvas_h)
+    if (fit_w, fit_h) != img.size:
+        img = img.resize((fit_w, fit_h), Image.BICUBIC)
+    if (fit_w, fit_h) == (canvas_w, canvas_h):
+        return img
+    frame = Image.new('RGB', (canvas_w, canvas_h))
+    frame.paste(img, ((canvas_w - fit_w) // 2, (canvas_h - fit_h) // 2))
+    return frame
+
+
+def _replace(old, new):
+    """Free the pixels of old as soon as new exists, so two full-size copies never pile up"""
+    old.close()
+    return new
+
+
+def preprocess_image(idx, img_path, cleaned_path, cache=None, digest=None, canvas=None, bounds=None,
+                     max_pixels=None):
+    """Produce the cleaned JPEG for one image at cleaned_path.
+
+    Without a canvas the image keeps its own size, rounded up to even
+    dimensions, or is scaled down to fit bounds=(width, height) if it is
+    larger; with canvas=(width, height) it is scaled to fit and centered on
+    a black frame of exactly that size. Either way it is decoded close to
+    the output size (see open_bounded), and images over max_pixels are
+    rejected before decoding.
+
+    With a cache, the source is hashed first (unless its digest is already
+    known from the upload) and a hit is linked into place without decoding;
+    a miss is processed once and published to the cache.
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    cache_key = None
+    if cache is not None:
+        try:
+            cache_key = f"{digest or file_digest(img_path)}-{_variant(canvas, bounds)}"
+        except Exception as verify_error:
+            raise RuntimeError(f"Image verification failed: {verify_error}")
+        timings['hash_ms'] = (time.perf_counter() - start) * 1000
+        if cache.materialize(cache_key, cleaned_path):
+            with Image.open(cleaned_path) as cached:  # header only
+                w, h = cached.size
+            timings['decode_ms'] = timings['resize_ms'] = timings['encode_ms'] = 0.0
+            timings['total_ms'] = (time.perf_counter() - start) * 1000
+            return _result(idx, img_path, cleaned_path, w, h, timings, cache_hit=True, cache_key=cache_key)
+
+    # A single bounded decode replaces the old verify() pass: load() raises on
+    # truncated or corrupt data, which is what verify() was there to catch
+    step = time.perf_counter()
+    try:
+        img = open_bounded(img_path, canvas or bounds, max_pixels)
+    except ImageTooLarge:
+        raise
+    except Exception as verify_error:
+        raise RuntimeError(f"Image verification failed: {verify_error}")
+    timings['decode_ms'] = (time.perf_counter() - step) * 1000
+
+    try:
+        step = time.perf_counter()
+        if canvas is None:
+            if bounds is not None and (img.width > bounds[0] or img.height > bounds[1]):
+                w, h = fit_within(img.width, img.height, *bounds)
+                img = img.resize((w, h), Image.BICUBIC)
+            w, h = img.size
+            w = (w + 1) // 2 * 2
+            h = (h + 1) // 2 * 2
+            if (w, h) != img.size:
+                img = img.resize((w, h))
+        else:
+            img = composite_on_canvas(img, canvas)
+            w, h = canvas
+        timings['resize_ms'] = (time.perf_counter() - step) * 1000
+
+        step = time.perf_counter()
+
+        def save(path):
+            img.save(path, 'JPEG', quality=95, subsampling=0)
+
+        if cache_key is None:
+            save(cleaned_path)
+        else:
+            link_or_copy(cache.store(cache_key, save), cleaned_path)
+        timings['encode_ms'] = (time.perf_counter() - step) * 1000
+    except Exception as img_error:
+        raise RuntimeError(f"Image processing failed: {img_error}")
+
+    timings['total_ms'] = (time.perf_counter() - start) * 1000
+    return _result(idx, img_path, cleaned_path, w, h, timings, cache_hit=False, cache_key=cache_key)
+
+
+def _result(idx, img_path, cleaned_path, w, h, timings, cache_hit, cache_key):
+    return {
+        'index': idx,
+        'source_path': img_path,
+        'cleaned_path': cleaned_path,
+        'width': w,
+        'height': h,
+        'cache_hit': cache_hit,
+        'cache_key': cache_key,
+        'timings': timings,
+    }
+
+
+def preprocess_images(image_paths, work_folder, cache=None, workers=None, digests=None, canvas=None,
+                      bounds=None, max_pixels=None, memory_limit=None):
+    """Preprocess all images of a reel across the process pool; results keep input order.
+
+    Cleaned files land in the reel's own work_folder, so concurrent renders
+    never share paths; the cache (a DiskCache) is shared between them.
+    digests optionally carries the SHA-256 of each image, as computed on upload.
+    With memory_limit, images of this reel are only decoded in parallel while
+    their estimated decode memory (decode_bytes) fits in that many bytes.
+    """
+    for img_path in image_paths:
+        if not os.path.exists(img_path):
+            raise FileNotFoundError(f"Image not found: {img_path}")
+
+    os.makedirs(work_folder, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    digests = digests or [None] * len(image_paths)
+    tasks = [(idx, img_path, os.path.join(work_folder, f"img_{idx}.jpg"), cache, digest, canvas, bounds, max_pixels)
+             for idx, (img_path, digest) in enumerate(zip(image_paths, digests))]
+    costs = [0] * len(tasks)
+    if memory_limit:
+        costs = [_decode_cost(img_path, canvas or bounds, memory_limit) for img_path in image_paths]
+
+    if workers == 1 or len(tasks) == 1:
+        # Not worth a round trip through the pool
+        return [_checked(task[1], preprocess_image, *task) for task in tasks]
+
+    try:
+        pool = _get_pool(workers)
+        futures = _submit_within(pool, tasks, costs, memory_limit)
+        results = [_checked(task[1], future.result) for task, future in zip(tasks, futures)]
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM-killed); rebuild the pool next time and finish inline
+        _reset_pool()
+        print("⚠️ Image pool broke, preprocessing inline")
+        return [_checked(task[1], preprocess_image, *task) for task in tasks]
+    if cache is not None:
+        # The lookups ran on the workers' copies of the cache: count them here
+        hits = sum(1 for result in results if result['cache_hit'])
+        cache.record(hits=hits, misses=len(results) - hits)
+    return results
+
+
+def _decode_cost(img_path, bounds, memory_limit):
+    try:
+        cost = decode_bytes(img_path, bounds)
+    except Exception:
+        return 0  # Unreadable: preprocess_image reports it properly
+    if cost > memory_limit:
+        raise RuntimeError(f"Image processing error: {os.path.basename(img_path)} needs about "
+                           f"{cost / (1024 * 1024):.0f}MB to decode, over the "
+                           f"{memory_limit / (1024 * 1024):.0f}MB per-job limit")
+    return cost
+
+
+def _submit_within(pool, tasks, costs, memory_limit):
+    """Submit tasks in order, holding each back until the decodes still running leave room for it"""
+    futures = []
+    running = {}  # future -> estimated bytes
+    for task, cost in zip(tasks, costs):
+        while memory_limit and running and sum(running.values()) + cost > memory_limit:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+        future = pool.submit(preprocess_image, *task)
+        running[future] = cost
+        futures.append(future)
+    return futures
+
+
+def _checked(img_path, fn, *args):
+    """Run one preprocessing step, reporting failures the way generate_reel() always has"""
+    try:
+        result = fn(*args)
+    except BrokenProcessPool:
+        raise
+    except Exception as e:
+        print(f"❌ Failed to process image {img_path}: {str(e)}")
+        if 'NoneType' in str(e):
+            print("ℹ️ Tip: This usually indicates a corrupt image file or unsupported format")
+        raise RuntimeError(f"Image processing error: {str(e)}")
+
+    t = result['timings']
+    metrics.preprocess_seconds.observe(t['total_ms'] / 1000, cache='hit' if result['cache_hit'] else 'miss')
+    if result['cache_hit']:
+        print(f"♻️ Cached image {result['index']+1}: {result['width']}x{result['height']} "
+              f"({t['total_ms']:.0f}ms)")
+    else:
+        print(f"✅ Processed image {result['index']+1}: {result['width']}x{result['height']} "
+              f"(decode {t['decode_ms']:.0f}ms, resize {t['resize_ms']:.0f}ms, "
+              f"encode {t['encode_ms']:.0f}ms)")
+    return result
@@ -0,0 +1,221 @@
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+DRAFT_SUFFIX = '_draft'
+TEMP_MAX_AGE_SECONDS = 3600  # Half-written outputs older than this were abandoned by a crashed job
+
+
+def _tree_size(path):
+    """Bytes used by a file, or by every file under a directory"""
+    try:
+        if not os.path.isdir(path):
+            return os.stat(path).st_size
+    except FileNotFoundError:
+        return 0
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                else:
+                    total += entry.stat(follow_symlinks=False).st_size
+            except FileNotFoundError:
+                continue
+    return total
+
+
+def _remove(path):
+    """Delete a file or directory tree; returns the bytes it held"""
+    size = _tree_size(path)
+    try:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    except FileNotFoundError:
+        return 0
+    except OSError as e:
+        print(f"❌ Error deleting {path}: {e}")
+        return 0
+    return size
+
+
+def _scan(folder):
+    try:
+        return list(os.scandir(folder))
+    except FileNotFoundError:
+        return []
+
+
+class DiskJanitor:
+    """Background thread that keeps reel files within a disk budget and an age limit.
+
+    A reel is everything stored under its ID: the rendered MP4 (and draft),
+    its upload folder and its render stages. The last access time of a reel
+    is the newest mtime among those, which preview() and download() bump
+    with os.utime. Each sweep deletes reels not accessed for max_age_seconds,
+    then the least recently accessed ones while the total is over max_bytes.
+    Reels whose ID starts with a prefix in max_age_by_prefix get that age
+    limit instead. Reels with in-flight jobs (in_flight_fn) and reels
+    touched within grace_seconds (e.g. an upload still streaming in) are
+    never deleted.
+    Abandoned scratch folders and temp files are removed, and the shared
+    caches are asked to evict against their own budgets.
+    """
+
+    def __init__(self, output_folder, upload_folders, stage_folder, scratch_folders, max_bytes,
+                 max_age_seconds, interval_seconds, in_flight_fn, caches=(), grace_seconds=600,
+                 max_age_by_prefix=None):
+        self.output_folder = output_folder
+        self.upload_folders = list(upload_folders)
+        self.stage_folder = stage_folder
+        self.scratch_folders = list(scratch_folders)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.max_age_by_prefix = dict(max_age_by_prefix or {})
+        self.interval_seconds = interval_seconds
+        self.in_flight_fn = in_flight_fn
+        self.caches = list(caches)
+        self.grace_seconds = grace_seconds
+        self.runs = 0
+        self.reels_evicted = 0
+        self.bytes_reclaimed = 0
+        self.last_run = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Run sweeps every interval_seconds on a daemon thread, the first one right away"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='disk-janitor', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"❌ Janitor sweep failed: {e}")
+            self._stop.wait(self.interval_seconds)
+
+    def reels(self):
+        """reel_id -> paths holding its files"""
+        reels = {}
+        for entry in _scan(self.output_folder):
+            if entry.is_file() and entry.name.endswith('.mp4') and '.tmp' not in entry.name:
+                reel_id = entry.name[:-len('.mp4')]
+                if reel_id.endswith(DRAFT_SUFFIX):
+                    reel_id = reel_id[:-len(DRAFT_SUFFIX)]
+                reels.setdefault(reel_id, []).append(entry.path)
+        for folder in self.upload_folders + [self.stage_folder]:
+            for entry in _scan(folder):
+                if entry.is_dir() and '.tmp' not in entry.name:
+                    reels.setdefault(entry.name, []).append(entry.path)
+        return reels
+
+    def run_once(self):
+        """One sweep; returns the number of bytes reclaimed"""
+        with self._lock:
+            started = time.monotonic()
+            now = time.time()
+            in_flight = set(self.in_flight_fn())
+            reclaimed = self._sweep_scratch(now, in_flight)
+
+            candidates = []
+            total = 0
+            for reel_id, paths in self.reels().items():
+                size = sum(_tree_size(path) for path in paths)
+                total += size
+                if reel_id in in_flight:
+                    continue
+                last_access = max((self._mtime(path) for path in paths), default=0)
+                if now - last_access < self.grace_seconds:
+                    continue
+                candidates.append((last_access, reel_id, paths, size))
+
+            evicted = 0
+            for last_access, reel_id, paths, size in sorted(candidates):
+                expired = now - last_access > self.max_age_for(reel_id)
+                if not expired and total <= self.max_bytes:
+                    continue  # Newer reels may still be expired: batch reels live longer
+                if reel_id in self.in_flight_fn():
+                    continue  # A job was queued for it since the sweep started
+                freed = sum(_remove(path) for path in paths)
+                total -= freed
+                reclaimed += freed
+                evicted += 1
+                reason = 'expired' if expired else 'over budget'
+                print(f"🧹 Evicted reel {reel_id} ({reason}, {freed / (1024 * 1024):.1f}MB)")
+
+            for cache in self.caches:
+                reclaimed += cache.evict()
+
+            self.runs += 1
+            self.reels_evicted += evicted
+            self.bytes_reclaimed += reclaimed
+            self.last_run = {
+                'finished_at': datetime.now().isoformat(),
+                'duration_ms': round((time.monotonic() - started) * 1000, 1),
+                'reels_evicted': evicted,
+                'bytes_reclaimed': reclaimed,
+                'reel_bytes': total,
+            }
+        if reclaimed:
+            print(f"🧹 Janitor reclaimed {reclaimed / (1024 * 1024):.1f}MB "
+                  f"({total / (1024 * 1024):.1f}MB of reels kept)")
+        return reclaimed
+
+    def max_age_for(self, reel_id):
+        for prefix, max_age_seconds in self.max_age_by_prefix.items():
+            if reel_id.startswith(prefix):
+                return max_age_seconds
+        return self.max_age_seconds
+
+    def _sweep_scratch(self, now, in_flight):
+        """Remove abandoned work folders and half-written outputs left by crashed jobs"""
+        reclaimed = 0
+        for folder in self.scratch_folders:
+            for entry in _scan(folder):
+                if any(entry.name == reel_id or entry.name.startswith(reel_id + '_') for reel_id in in_flight):
+                    continue
+                if now - self._mtime(entry.path) > self.grace_seconds:
+                    reclaimed += _remove(entry.path)
+        for entry in _scan(self.output_folder):
+            if entry.is_file() and '.tmp' in entry.name and now - self._mtime(entry.path) > TEMP_MAX_AGE_SECONDS:
+                reclaimed += _remove(entry.path)
+        for folder in self.upload_folders:
+            for entry in _scan(folder):
+                if entry.is_dir() and '.tmp' in entry.name and now - self._mtime(entry.path) > TEMP_MAX_AGE_SECONDS:
+                    reclaimed += _remove(entry.path)
+        return reclaimed
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime
+        except FileNotFoundError:
+            return 0
+
+    def stats(self):
+        return {
+            'runs': self.runs,
+            'reels_evicted': self.reels_evicted,
+            'bytes_reclaimed': self.bytes_reclaimed,
+            'max_bytes': self.max_bytes,
+            'max_age_seconds': self.max_age_seconds,
+            'last_run': self.last_run,
+        }
@@ -0,0 +1,133 @@
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_local = threading.local()
+
+
+def current_job():
+    """The job the calling worker thread is running, or None outside a job"""
+    return getattr(_local, 'job', None)
+
+
+@contextmanager
+def running_job(job):
+    """Make job the calling thread's current_job() for the with-block"""
+    _local.job = job
+    try:
+        yield job
+    finally:
+        _local.job = None
+
+
+class RenderJob:
+    """State of one queued render, shared between the web handlers and a worker thread"""
+
+    def __init__(self, reel_id, kind='render'):
+        self.job_id = uuid.uuid4().hex
+        self.reel_id = reel_id
+        self.kind = kind
+        self.state = QUEUED
+        self.error = None
+        self.result = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = None  # RenderProgress, set by the job body once rendering starts
+        self._done = threading.Event()
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED)
+
+    def wait(self, timeout=None):
+        """Block until the job is done or failed; returns False on timeout"""
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'reel_id': self.reel_id,
+            'kind': self.kind,
+            'state': self.state,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'progress': self.progress.snapshot() if self.progress else None,
+        }
+
+
+class JobQueue:
+    """Bounded worker pool that runs render jobs outside the request cycle"""
+
+    def __init__(self, max_workers=2, retention_hours=1):
+        self.max_workers = max_workers
+        self.retention = timedelta(hours=retention_hours)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='render')
+        self._jobs = {}
+        self._latest_by_reel = {}
+        self._lock = threading.Lock()
+
+    def submit(self, reel_id, fn, *args, kind='render', **kwargs):
+        """Register a job for reel_id and hand fn(*args, **kwargs) to the pool"""
+        job = RenderJob(reel_id, kind=kind)
+        with self._lock:
+            self._prune()
+            self._jobs[job.job_id] = job
+            self._latest_by_reel[reel_id] = job.job_id
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        print(f"📥 Queued {kind} job {job.job_id} for reel {reel_id}")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest_for_reel(self, reel_id):
+        with self._lock:
+            job_id = self._latest_by_reel.get(reel_id)
+            return self._jobs.get(job_id) if job_id else None
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def in_flight_reels(self):
+        """Reel IDs that still have a queued or running job"""
+        with self._lock:
+            return {job.reel_id for job in self._jobs.values() if not job.finished}
+
+    def _run(self, job, fn, args, kwargs):
+        job.state = RUNNING
+        job.started_at = datetime.now()
+        try:
+            with running_job(job):
+                job.result = fn(*args, **kwargs)
+            job.state = DONE
+            print(f"✅ Job {job.job_id} done")
+        except Exception as e:
+            job.error = str(e)
+            job.state = FAILED
+            print(f"❌ Job {job.job_id} failed: {e}")
+            print(traceback.format_exc())
+        finally:
+            job.finished_at = datetime.now()
+            job._done.set()
+
+    def _prune(self):
+        # Forget finished jobs past retention so the registry does not grow forever
+        cutoff = datetime.now() - self.retention
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished_at < cutoff:
+                del self._jobs[job_id]
+                if self._latest_by_reel.get(job.reel_id) == job_id:
+                    del self._latest_by_reel[job.reel_id]
@@ -0,0 +1,154 @@
+import bisect
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Seconds, from a fast probe to a long encode
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+SPEED_BUCKETS = (0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10, 20, 50)
+SIZE_BUCKETS = tuple(mb * 1024 * 1024 for mb in (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+
+_registry = []
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count, optionally split by labels"""
+
+    type = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets, with sum and count"""
+
+    type = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=TIME_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [per-bucket counts (+Inf last), sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the with-block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(counts), total) for key, (counts, total) in self._values.items())
+        samples = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", key, (('le', _format_value(bound)),), cumulative))
+            samples.append((f"{self.name}_sum", key, (), total))
+            samples.append((f"{self.name}_count", key, (), cumulative))
+        return samples
+
+
+class Callback:
+    """Value read when /metrics is scraped: fn() returns {label values tuple: value}"""
+
+    def __init__(self, name, help_text, metric_type, fn, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.type = metric_type
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        _registry.append(self)
+
+    def samples(self):
+        return [(self.name, key, (), value) for key, value in sorted(self.fn().items())]
+
+
+def render_latest():
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        try:
+            samples = metric.samples()
+        except Exception as e:
+            print(f"⚠️ Metric {metric.name} unavailable: {e}")
+            continue
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, key, extra, value in samples:
+            lines.append(f"{name}{_format_labels(metric.labelnames, key, extra)} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+def log_event(event, **fields):
+    """One JSON object per line on stdout, for log shippers"""
+    record = {'ts': datetime.now().isoformat(), 'event': event}
+    record.update(fields)
+    sys.stdout.write(json.dumps(record, default=str) + '\n')
+    sys.stdout.flush()
+
+
+upload_seconds = Histogram('reel_upload_seconds', 'Time to stream an upload to disk and validate it', ['kind'])
+upload_bytes = Counter('reel_upload_bytes_total', 'Request body bytes received by upload handlers', ['kind'])
+tts_seconds = Histogram('reel_tts_seconds', 'Text-to-speech synthesis latency on a cache miss', ['provider'])
+tts_requests = Counter('reel_tts_requests_total', 'Text-to-speech syntheses by provider and outcome (ok, error, cache_hit)',
+                       ['provider', 'outcome'])
+tts_fallbacks = Counter('reel_tts_fallbacks_total', 'Scripts or chunks that fell back from ElevenLabs to gTTS')
+probe_seconds = Histogram('reel_probe_seconds', 'Media probe time (memo misses only)', ['kind', 'source'])
+preprocess_seconds = Histogram('reel_preprocess_image_seconds', 'Preprocessing time per image', ['cache'])
+ffmpeg_seconds = Histogram('reel_ffmpeg_seconds', 'FFmpeg wall time per invocation', ['step'])
+ffmpeg_speed = Histogram('reel_ffmpeg_speed', 'FFmpeg speed factor (output seconds per wall second) at the end of an encode',
+                         ['step'], buckets=SPEED_BUCKETS)
+beat_seconds = Histogram('reel_beat_analysis_seconds', 'Beat analysis time per audio file (cache misses only)')
+render_seconds = Histogram('reel_render_seconds', 'Wall time of a render job', ['kind', 'profile'])
+phase_seconds = Histogram('reel_render_phase_seconds', 'Wall time per render phase', ['phase'])
+output_bytes = Histogram('reel_output_bytes', 'Size of rendered reels', ['profile'], buckets=SIZE_BUCKETS)
+renders = Counter('reel_renders_total', 'Finished render jobs by outcome', ['kind', 'outcome'])
+failures = Counter('reel_failures_total', 'Failures by the stage they happened in', ['stage'])
@@ -0,0 +1,121 @@
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+import mutagen
+from PIL import Image
+import metrics
+
+MEMO_SIZE = 1024
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+# mutagen file type -> codec name as ffprobe would report it
+MUTAGEN_CODECS = {
+    'MP3': 'mp3',
+    'WAVE': 'pcm',
+    'OggVorbis': 'vorbis',
+    'OggOpus': 'opus',
+    'OggFLAC': 'flac',
+    'OggSpeex': 'speex',
+}
+
+
+def _file_identity(path):
+    st = os.stat(path)
+    return (os.path.realpath(path), st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _memoized(kind, path, fn):
+    """Cache probe results per file identity; a rewritten file gets probed again"""
+    key = (kind,) + _file_identity(path)
+    with _memo_lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            return _memo[key]
+    started = time.perf_counter()
+    result = fn(path)
+    metrics.probe_seconds.observe(time.perf_counter() - started, kind=kind, source=result.get('source', 'header'))
+    with _memo_lock:
+        _memo[key] = result
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return result
+
+
+def _probe_audio_mutagen(path):
+    audio = mutagen.File(path)
+    if audio is None or not getattr(audio.info, 'length', 0):
+        return None
+    info = audio.info
+    kind = type(audio).__name__
+    codec = MUTAGEN_CODECS.get(kind) or getattr(info, 'codec', None) or kind.lower()
+    if codec.startswith('mp4a'):
+        codec = 'aac'
+    return {
+        'duration': float(info.length),
+        'codec': codec,
+        'sample_rate': getattr(info, 'sample_rate', None),
+        'channels': getattr(info, 'channels', None),
+        'source': 'mutagen',
+    }
+
+
+def _probe_audio_ffprobe(path):
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'a:0',
+        '-show_entries', 'format=duration:stream=codec_name,sample_rate,channels',
+        '-of', 'json',
+        path
+    ]
+    result = subprocess.run(cmd, check=True,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            text=True)
+    data = json.loads(result.stdout)
+    stream = (data.get('streams') or [{}])[0]
+    return {
+        'duration': float(data['format']['duration']),
+        'codec': stream.get('codec_name'),
+        'sample_rate': int(stream['sample_rate']) if stream.get('sample_rate') else None,
+        'channels': stream.get('channels'),
+        'source': 'ffprobe',
+    }
+
+
+def _probe_audio(path):
+    try:
+        info = _probe_audio_mutagen(path)
+        if info is not None:
+            return info
+    except Exception as e:
+        print(f"ℹ️ In-process probe failed for {path} ({e}), using ffprobe")
+    return _probe_audio_ffprobe(path)
+
+
+def probe_audio(path):
+    """Duration, codec, sample rate and channels of an audio file.
+
+    Read in-process with mutagen for mp3/wav/ogg/m4a; ffprobe is only
+    started when mutagen cannot make sense of the file.
+    """
+    return _memoized('audio', path, _probe_audio)
+
+
+def _probe_image(path):
+    with Image.open(path) as img:  # Parses the header only
+        return {
+            'width': img.width,
+            'height': img.height,
+            'format': img.format,
+            'mode': img.mode,
+        }
+
+
+def probe_image(path):
+    """Image dimensions, format and mode from the file header, without decoding pixels"""
+    return _memoized('image', path, _probe_image)
@@ -0,0 +1,139 @@
+import threading
+import time
+import metrics
+
+
+def parse_progress_block(lines):
+    """One FFmpeg -progress report (key=value lines up to progress=...) as a dict"""
+    values = dict(line.split('=', 1) for line in lines if '=' in line)
+    out_time_us = values.get('out_time_us') or values.get('out_time_ms')  # Both are microseconds
+    speed = values.get('speed', '').rstrip('x').strip()
+    return {
+        'frame': int(values['frame']) if values.get('frame', '').isdigit() else 0,
+        'fps': _to_float(values.get('fps')),
+        'out_time': max(0.0, int(out_time_us) / 1_000_000) if (out_time_us or '').lstrip('-').isdigit() else 0.0,
+        'speed': _to_float(speed),
+        'done': values.get('progress') == 'end',
+    }
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def run_with_progress(stream_spec, on_progress, step='encode'):
+    """Run an ffmpeg-python command, calling on_progress(report) for every progress report.
+
+    FFmpeg writes machine-readable progress to stdout (-progress pipe:1);
+    stderr is drained on a separate thread so a chatty encoder cannot block.
+    Wall time and final speed factor are recorded under step.
+    Raises ffmpeg.Error like .run() does; if on_progress raises (a cancelled
+    render), FFmpeg is killed before the exception propagates.
+    """
+    import ffmpeg
+    started = time.perf_counter()
+    process = (
+        stream_spec
+        .global_args('-progress', 'pipe:1', '-nostats')
+        .run_async(pipe_stdout=True, pipe_stderr=True)
+    )
+    stderr_chunks = []
+    drain = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    drain.start()
+
+    block = []
+    last = None
+    try:
+        for raw in process.stdout:
+            line = raw.decode('utf-8', errors='replace').strip()
+            block.append(line)
+            if line.startswith('progress='):
+                last = parse_progress_block(block)
+                on_progress(last)
+                block = []
+        process.wait()
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+    drain.join()
+    metrics.ffmpeg_seconds.observe(time.perf_counter() - started, step=step)
+    stderr = b''.join(stderr_chunks)
+    if process.returncode != 0:
+        raise ffmpeg.Error('ffmpeg', b'', stderr)
+    if last is not None and last['speed']:
+        metrics.ffmpeg_speed.observe(last['speed'], step=step)
+
+
+class RenderCancelled(Exception):
+    """Raised inside a render that was called off, at its next phase or progress report"""
+
+
+class RenderProgress:
+    """Live encode progress of one render, aggregated over its FFmpeg processes.
+
+    Parts are the independently encoded pieces of the video (one per segment,
+    or a single 'video' part); each reports the seconds of output it has
+    written, and percent/ETA are taken against the reel's total duration.
+    Wall time spent in each phase is kept in phase_seconds. cancel() stops
+    the render at its next phase change or FFmpeg progress report.
+    """
+
+    def __init__(self, total_seconds):
+        self.total_seconds = total_seconds
+        self.phase = 'queued'
+        self.phase_seconds = {}
+        self._parts = {}
+        self._lock = threading.Lock()
+        self._phase_started = time.monotonic()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def check(self):
+        """Raise RenderCancelled if the render was called off"""
+        if self._cancelled.is_set():
+            raise RenderCancelled("Render cancelled")
+
+    def set_phase(self, phase):
+        if phase != 'done':
+            self.check()
+        now = time.monotonic()
+        with self._lock:
+            if self.phase not in ('queued', 'done'):
+                self.phase_seconds[self.phase] = self.phase_seconds.get(self.phase, 0.0) + now - self._phase_started
+            self.phase = phase
+            self._phase_started = now
+        print(f"📊 {phase} ({self.snapshot()['percent']:.0f}%)")
+
+    def update(self, part, report):
+        self.check()
+        with self._lock:
+            self._parts[part] = report
+
+    def complete(self, part, seconds):
+        """Record a part that needed no encoding (cache hit, reused stage)"""
+        self.update(part, {'frame': 0, 'fps': None, 'out_time': seconds, 'speed': None, 'done': True})
+
+    def snapshot(self):
+        with self._lock:
+            reports = list(self._parts.values())
+            phase = self.phase
+        encoded = min(self.total_seconds, sum(report['out_time'] for report in reports))
+        running = [report for report in reports if not report['done']]
+        speed = sum(report['speed'] or 0 for report in running) or None
+        fps = sum(report['fps'] or 0 for report in running) or None
+        remaining = self.total_seconds - encoded
+        return {
+            'phase': phase,
+            'frame': sum(report['frame'] for report in reports),
+            'fps': fps,
+            'out_time': round(encoded, 3),
+            'speed': speed,
+            'percent': 100.0 if phase == 'done' else round(100.0 * encoded / self.total_seconds, 1),
+            'eta_seconds': round(remaining / speed, 1) if speed else None,
+        }
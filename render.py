@@ -0,0 +1,388 @@
+import hashlib
+import json
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+import ffmpeg
+from disk_cache import file_digest, link_or_copy
+from imaging import fit_within
+from probe import probe_image
+from progress import run_with_progress
+import metrics
+
+FADE_SECONDS = 0.5
+MIN_FADE_DURATION = 1.0  # Images shown for less than this get no fade
+
+
+def draft_profile(profile, draft):
+    """Draft settings scaled to the aspect ratio of profile, keeping the draft's short side"""
+    scale = min(draft['width'], draft['height']) / min(profile['width'], profile['height'])
+    width, height = (int(round(profile[side] * scale / 2)) * 2 for side in ('width', 'height'))
+    return dict(draft, width=width, height=height)
+
+
+def build_audio(audio_path, audio_duration, total_duration):
+    """Audio stream fitted to the reel: looped when short, trimmed and faded out when long"""
+    if audio_duration < total_duration:
+        loops = int(total_duration / audio_duration) + 1
+        audio_input = ffmpeg.input(audio_path, stream_loop=loops)
+        audio = audio_input.filter('atrim', duration=total_duration)
+        print(f"🔁 Looped audio {loops}x to match duration")
+    elif audio_duration > total_duration + 1.0:
+        audio_input = ffmpeg.input(audio_path)
+        audio = audio_input.filter('atrim', duration=total_duration).filter('afade', t='out', st=total_duration - 1, d=1)
+        print(f"✂️ Trimmed audio from {audio_duration:.2f}s to {total_duration:.2f}s")
+    else:
+        audio = ffmpeg.input(audio_path).audio
+        print("✅ Audio duration matches perfectly")
+    return audio
+
+
+def build_filtergraph_video(image_paths, durations, width, height, fps):
+    """One looped input per image, scaled/padded/faded per frame, joined with the concat filter"""
+    video_streams = []
+
+    for idx, (img_path, duration) in enumerate(zip(image_paths, durations)):
+        try:
+            print(f"\nProcessing cleaned image {idx+1}: {os.path.basename(img_path)} ({duration}s)")
+
+            # Modified input with explicit duration
+            stream = ffmpeg.input(img_path, framerate=fps, loop=1, t=duration)
+
+            # Scaling and padding planned from the header dimensions: exact
+            # even sizes up front, and no filter where nothing changes
+            info = probe_image(img_path)
+            fit_w, fit_h = fit_within(info['width'], info['height'], width, height)
+            if (fit_w, fit_h) != (info['width'], info['height']):
+                stream = stream.filter('scale', fit_w, fit_h)
+            if (fit_w, fit_h) != (width, height):
+                stream = stream.filter('pad',
+                                       width, height,
+                                       '(ow-iw)/2', '(oh-ih)/2',
+                                       color='black')
+            stream = stream.filter('setsar', '1')
+
+            # Fade effects
+            if duration >= MIN_FADE_DURATION:
+                if idx == 0:
+                    stream = stream.filter('fade', t='in', st=0, d=FADE_SECONDS)
+                if idx == len(image_paths) - 1:
+                    stream = stream.filter('fade', t='out', st=duration - FADE_SECONDS, d=FADE_SECONDS)
+            else:
+                print(f"⚠️ Skipping fade: duration too short ({duration}s)")
+
+            stream = stream.filter('format', 'yuv420p')
+            video_streams.append(stream)
+
+        except Exception as e:
+            print(f"❌ Error processing image {img_path}: {e}")
+            raise
+
+    return ffmpeg.concat(*video_streams, v=1, a=0)
+
+
+def _quoted(path):
+    return "'" + os.path.abspath(path).replace("'", "'\\''") + "'"
+
+
+def write_concat_list(list_path, image_paths, durations):
+    """ffconcat script showing each still for its duration"""
+    with open(list_path, 'w') as f:
+        f.write("ffconcat version 1.0\n")
+        for img_path, duration in zip(image_paths, durations):
+            f.write(f"file {_quoted(img_path)}\n")
+            f.write(f"duration {duration}\n")
+        # The demuxer only honours the last duration if the last file is listed again
+        f.write(f"file {_quoted(image_paths[-1])}\n")
+    return list_path
+
+
+def build_concat_video(image_paths, durations, list_path, fps):
+    """Stills already composited to the output frame, read once each through the concat demuxer.
+
+    Only the frame-rate conversion, the two reel-level fades and the pixel
+    format conversion run per frame.
+    """
+    write_concat_list(list_path, image_paths, durations)
+    total_duration = sum(durations)
+
+    stream = ffmpeg.input(list_path, f='concat', safe=0)
+    stream = stream.filter('fps', fps=fps)
+    stream = stream.filter('trim', duration=total_duration)
+    stream = stream.filter('setsar', '1')
+
+    if durations[0] >= MIN_FADE_DURATION:
+        stream = stream.filter('fade', t='in', st=0, d=FADE_SECONDS)
+    else:
+        print(f"⚠️ Skipping fade-in: duration too short ({durations[0]}s)")
+    if durations[-1] >= MIN_FADE_DURATION:
+        stream = stream.filter('fade', t='out', st=total_duration - FADE_SECONDS, d=FADE_SECONDS)
+    else:
+        print(f"⚠️ Skipping fade-out: duration too short ({durations[-1]}s)")
+
+    return stream.filter('format', 'yuv420p')
+
+
+def plan_segments(image_paths, durations, fps, max_segment_seconds, image_keys=None):
+    """Split the timeline into independently encodable segments.
+
+    Each image becomes one segment, or several when it is shown longer
+    than max_segment_seconds. Lengths are whole frames, so segment
+    boundaries fall exactly on frames (and on keyframes, since every
+    segment starts with one). The reel's fade-in lands on the first
+    segment and its fade-out on the last. image_keys, when given, identify
+    each image's content for the segment cache.
+    """
+    image_keys = image_keys or [None] * len(image_paths)
+    max_frames = max(1, int(max_segment_seconds * fps))
+    segments = []
+    for img_path, duration, image_key in zip(image_paths, durations, image_keys):
+        frames = max(1, int(round(duration * fps)))
+        chunks = [max_frames] * (frames // max_frames)
+        remainder = frames % max_frames
+        if remainder:
+            if chunks and remainder < fps:
+                chunks[-1] += remainder  # No sub-second tail segment
+            else:
+                chunks.append(remainder)
+        for chunk_frames in chunks:
+            segments.append({'still': img_path, 'image_key': image_key, 'frames': chunk_frames,
+                             'fade_in': False, 'fade_out': False})
+
+    if durations[0] >= MIN_FADE_DURATION:
+        segments[0]['fade_in'] = True
+    if durations[-1] >= MIN_FADE_DURATION:
+        segments[-1]['fade_out'] = True
+    return segments
+
+
+def encode_segment(segment, output_path, fps, encoder, on_progress=None):
+    """Encode one still-image segment to its own MP4 with the shared encoder settings"""
+    seconds = segment['frames'] / fps
+    stream = ffmpeg.input(segment['still'], framerate=fps, loop=1)
+    stream = stream.filter('setsar', '1')
+    if segment['fade_in']:
+        stream = stream.filter('fade', t='in', st=0, d=FADE_SECONDS)
+    if segment['fade_out']:
+        stream = stream.filter('fade', t='out', st=max(0, seconds - FADE_SECONDS), d=FADE_SECONDS)
+    stream = stream.filter('format', 'yuv420p')
+    cmd = (
+        ffmpeg.output(stream, output_path, an=None, **encoder, **{'frames:v': segment['frames']})
+        .global_args('-loglevel', 'error')
+        .overwrite_output()
+    )
+    if on_progress is None:
+        with metrics.ffmpeg_seconds.time(step='segment'):
+            cmd.run(capture_stdout=True, capture_stderr=True)
+    else:
+        run_with_progress(cmd, on_progress, step='segment')
+    return output_path
+
+
+def segment_cache_key(segment, resolution, fps, encoder):
+    """Identity of an encoded segment: source image, length, fade position and encoder settings"""
+    payload = json.dumps({
+        'image': segment['image_key'] or file_digest(segment['still']),
+        'frames': segment['frames'],
+        'fade_in': segment['fade_in'],
+        'fade_out': segment['fade_out'],
+        'resolution': list(resolution),
+        'fps': fps,
+        # Thread count changes how x264 parallelizes, not what the segment is
+        'encoder': {k: v for k, v in encoder.items() if k != 'threads'},
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def encode_segments(segments, work_folder, fps, encoder, workers, cache=None, resolution=None,
+                    progress=None):
+    """Encode all segments concurrently, one FFmpeg process each; returns paths in timeline order.
+
+    With a cache (a DiskCache), segments encoded by an earlier render are
+    linked in instead of encoded, so a re-render after changing one image
+    or duration only encodes the segments that changed. A RenderProgress,
+    if given, gets one part per segment.
+    """
+    def run(idx, segment, path):
+        on_progress = None
+        if progress is not None:
+            on_progress = lambda report: progress.update(idx, report)
+        if cache is None:
+            return encode_segment(segment, path, fps, encoder, on_progress), False
+        key = segment_cache_key(segment, resolution, fps, encoder)
+        if cache.materialize(key, path):
+            if progress is not None:
+                progress.complete(idx, segment['frames'] / fps)
+            return path, True
+        cached = cache.store(key, lambda tmp_path: encode_segment(segment, tmp_path, fps, encoder, on_progress))
+        link_or_copy(cached, path)
+        return path, False
+
+    tasks = [(idx, segment, os.path.join(work_folder, f"segment_{idx:04d}.mp4"))
+             for idx, segment in enumerate(segments)]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='segment') as executor:
+        futures = [executor.submit(run, *task) for task in tasks]
+        results = [future.result() for future in futures]
+
+    if cache is not None:
+        hits = sum(1 for _, hit in results if hit)
+        print(f"♻️ Segment cache: {hits}/{len(results)} hits ({hits / len(results):.0%})")
+        if hits < len(results):
+            cache.evict()
+    return [path for path, _ in results]
+
+
+def build_segment_video(segment_paths, list_path):
+    """Encoded segments joined by the concat demuxer, for stream copy"""
+    with open(list_path, 'w') as f:
+        f.write("ffconcat version 1.0\n")
+        for path in segment_paths:
+            f.write(f"file {_quoted(path)}\n")
+    return ffmpeg.input(list_path, f='concat', safe=0)
+
+
+def rendition_ladder(profile, renditions):
+    """Renditions that fit the profile, sized by short side at its aspect ratio, largest first.
+
+    renditions maps a name to {'short_side', 'crf', 'maxrate'}; entries
+    larger than the profile itself are left out, since upscaling adds nothing.
+    """
+    short_side = min(profile['width'], profile['height'])
+    ladder = []
+    for name, settings in renditions.items():
+        if settings['short_side'] > short_side:
+            continue
+        scale = settings['short_side'] / short_side
+        width, height = (int(round(profile[side] * scale / 2)) * 2 for side in ('width', 'height'))
+        ladder.append(dict(settings, name=name, width=width, height=height))
+    return sorted(ladder, key=lambda rung: -rung['short_side'])
+
+
+def build_rendition_outputs(video, audio, ladder, folder, encoder, fps, hls_seconds, run_id):
+    """One FFmpeg output per rendition, all fed by a single split of the composited video.
+
+    Each rendition is encoded once and written through the tee muxer to
+    both <name>.mp4 and an HLS variant in hls/<name>/. Keyframes fall on
+    every HLS segment boundary in every rendition, so players can switch
+    between them. The audio track is shared and stream-copied. Segment
+    names carry run_id, so a new run never reuses a cached segment URL.
+    """
+    gop = int(round(fps * hls_seconds))
+    branches = video.filter_multi_output('split', len(ladder))
+    outputs = []
+    for idx, rung in enumerate(ladder):
+        stream = branches[idx].filter('scale', rung['width'], rung['height']).filter('setsar', '1')
+        hls_folder = os.path.join(folder, 'hls', rung['name'])
+        os.makedirs(hls_folder, exist_ok=True)
+        targets = '|'.join([
+            f"[f=mp4:movflags=+faststart]{os.path.join(folder, rung['name'] + '.mp4')}",
+            f"[f=hls:hls_time={hls_seconds}:hls_playlist_type=vod:"
+            f"hls_segment_filename={os.path.join(hls_folder, f'segment_{run_id}_%04d.ts')}]{os.path.join(hls_folder, 'index.m3u8')}",
+        ])
+        outputs.append(ffmpeg.output(
+            stream, audio, targets, format='tee', acodec='copy',
+            **dict(encoder, crf=rung['crf'], maxrate=rung['maxrate'], bufsize=_double_rate(rung['maxrate']),
+                   g=gop, keyint_min=gop, sc_threshold=0)
+        ))
+    return ffmpeg.merge_outputs(*outputs)
+
+
+def _bits_per_second(rate):
+    """'2800k' or '5M' as an integer"""
+    rate = str(rate).strip().lower()
+    units = {'k': 1000, 'm': 1000 * 1000}
+    if rate and rate[-1] in units:
+        return int(float(rate[:-1]) * units[rate[-1]])
+    return int(float(rate))
+
+
+def _double_rate(rate):
+    return str(_bits_per_second(rate) * 2)
+
+
+def _boxes(data, start, end):
+    """(type, payload start, payload end) of the MP4 boxes laid out in data[start:end]"""
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        header = 8
+        if size == 1:
+            size, header = struct.unpack('>Q', data[pos + 8:pos + 16])[0], 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos + header, min(pos + size, end)
+        pos += size
+
+
+def _read_moov(path):
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            size, kind = struct.unpack('>I4s', header)
+            header_size = 8
+            if size == 1:
+                size, header_size = struct.unpack('>Q', f.read(8))[0], 16
+            if kind == b'moov':
+                return f.read(size - header_size)
+            if size < header_size:
+                return None
+            f.seek(size - header_size, os.SEEK_CUR)
+
+
+def _descend(data, start, end, path):
+    """Payload ranges of the boxes reached by following the box types in path"""
+    if not path:
+        yield start, end
+        return
+    for kind, child_start, child_end in _boxes(data, start, end):
+        if kind == path[0]:
+            yield from _descend(data, child_start, child_end, path[1:])
+
+
+def avc_codec_string(mp4_path):
+    """RFC 6381 codec of the H.264 track of an MP4 (e.g. avc1.64001f), or None.
+
+    Profile, constraint flags and level are copied from the track's avcC
+    box, so they are what the encoder actually wrote.
+    """
+    moov = _read_moov(mp4_path)
+    if moov is None:
+        return None
+    containers = (b'trak', b'mdia', b'minf', b'stbl')
+    for trak in _descend(moov, 0, len(moov), containers):
+        stsd = next(((start, end) for kind, start, end in _boxes(moov, *trak) if kind == b'stsd'), None)
+        if stsd is None:
+            continue
+        # Full box header and entry count, then the sample entries
+        for kind, start, end in _boxes(moov, stsd[0] + 8, stsd[1]):
+            if kind != b'avc1':
+                continue
+            # A visual sample entry has 78 bytes of fixed fields before its child boxes
+            for child, child_start, child_end in _boxes(moov, start + 78, end):
+                if child == b'avcC' and child_end - child_start >= 4:
+                    return 'avc1.' + moov[child_start + 1:child_start + 4].hex()
+    return None
+
+
+def write_master_playlist(path, ladder, audio_bitrate, video_codecs=None):
+    """HLS master playlist listing every rendition's variant playlist, highest bandwidth first.
+
+    video_codecs maps rendition names to the codec their encode produced
+    (see avc_codec_string); a rendition without one is listed without CODECS.
+    """
+    video_codecs = video_codecs or {}
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for rung in ladder:
+        bandwidth = _bits_per_second(rung['maxrate']) + _bits_per_second(audio_bitrate)
+        info = f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={rung['width']}x{rung['height']}"
+        if video_codecs.get(rung['name']):
+            info += f",CODECS=\"{video_codecs[rung['name']]},mp4a.40.2\""  # The audio stage is AAC-LC
+        lines.append(info)
+        lines.append(f"{rung['name']}/index.m3u8")
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return path
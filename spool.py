@@ -0,0 +1,388 @@
+"""Render job queue kept in a folder shared by web and worker nodes.
+
+Layout under the spool folder:
+
+    queue/<priority>-<created_ns>-<job_id>.json
+                                       spec of a queued or running job; claimed in name order
+    leases/<job_id>.lease              claim of the worker running it; mtime is its heartbeat
+    progress/<job_id>.json             latest progress snapshot published by that worker
+    done/<job_id>.json                 outcome of a finished job
+    reels/<reel_id>.json               latest job of a reel
+
+A worker claims a job by creating its lease file with O_CREAT | O_EXCL,
+which only one worker can win, and touches it every heartbeat. A lease not
+touched for lease_seconds is expired by whichever worker notices first
+(renaming it away is atomic, so only one does) and the job becomes
+claimable again; after max_attempts expiries it is failed instead. Every
+file is written to a temp name and renamed into place, so readers never
+see partial JSON.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from jobs import QUEUED, RUNNING, DONE, FAILED, running_job
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _listdir(folder):
+    try:
+        return sorted(name for name in os.listdir(folder) if not name.endswith('.tmp'))
+    except FileNotFoundError:
+        return []
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+class SpoolJob:
+    """Read-only view of a spooled job, with the same surface as jobs.RenderJob"""
+
+    def __init__(self, queue, spec, state, record=None, lease=None):
+        self._queue = queue
+        self.job_id = spec['job_id']
+        self.reel_id = spec['reel_id']
+        self.kind = spec['kind']
+        self.attempts = spec.get('attempts', 0)
+        self.state = state
+        record = record or {}
+        self.error = record.get('error')
+        self.result = record.get('result')
+        self.worker = record.get('worker') or (lease or {}).get('worker')
+        self.created_at = _parse_time(spec['created_at'])
+        self.started_at = _parse_time(record.get('started_at') or (lease or {}).get('started_at'))
+        self.finished_at = _parse_time(record.get('finished_at'))
+
+    @property
+    def finished(self):
+        return self.state in (DONE, FAILED)
+
+    def wait(self, timeout=None):
+        """Poll the spool until the job is done or failed; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        job = self
+        while not job.finished:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self._queue.poll_seconds)
+            job = self._queue.get(self.job_id) or job
+        self.state, self.error, self.finished_at = job.state, job.error, job.finished_at
+        return True
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'reel_id': self.reel_id,
+            'kind': self.kind,
+            'state': self.state,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'progress': None if self.finished else self._queue.progress(self.job_id),
+            'worker': self.worker,
+            'attempts': self.attempts,
+        }
+
+
+class SpoolQueue:
+    """Job queue in a shared folder; submitted by web nodes, drained by SpoolWorker processes"""
+
+    def __init__(self, folder, lease_seconds=30, max_attempts=3, retention_hours=1, poll_seconds=0.5):
+        self.folder = folder
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retention = timedelta(hours=retention_hours)
+        self.poll_seconds = poll_seconds
+        for name in ('queue', 'leases', 'progress', 'done', 'reels'):
+            os.makedirs(os.path.join(folder, name), exist_ok=True)
+
+    def _path(self, kind, name):
+        return os.path.join(self.folder, kind, name)
+
+    def submit(self, reel_id, payload, kind='render', priority=1):
+        """Spool a job for reel_id; payload is the JSON-serializable input of the job body.
+
+        Workers claim lower priority values first, then older jobs.
+        """
+        spec = {
+            'job_id': uuid.uuid4().hex,
+            'reel_id': reel_id,
+            'kind': kind,
+            'payload': payload,
+            'attempts': 0,
+            'created_at': datetime.now().isoformat(),
+        }
+        _write_json(self._path('queue', f"{priority}-{time.time_ns():020d}-{spec['job_id']}.json"), spec)
+        _write_json(self._path('reels', f"{reel_id}.json"), {'job_id': spec['job_id']})
+        print(f"📥 Spooled {kind} job {spec['job_id']} for reel {reel_id}")
+        return SpoolJob(self, spec, QUEUED)
+
+    def _queued(self):
+        """(queue file path, spec) of every queued or running job, in claim order"""
+        entries = []
+        for name in _listdir(os.path.join(self.folder, 'queue')):
+            path = self._path('queue', name)
+            spec = _read_json(path)
+            # A queue file next to a done record is a leftover reap() will delete
+            if spec is not None and not os.path.exists(self._path('done', f"{spec['job_id']}.json")):
+                entries.append((path, spec))
+        return entries
+
+    def _queue_path(self, job_id):
+        for name in _listdir(os.path.join(self.folder, 'queue')):
+            if name.endswith(f"-{job_id}.json"):
+                return self._path('queue', name)
+        return None
+
+    def get(self, job_id):
+        record = _read_json(self._path('done', f"{job_id}.json"))
+        if record is not None:
+            return SpoolJob(self, record['spec'], record['state'], record=record)
+        path = self._queue_path(job_id)
+        spec = _read_json(path) if path else None
+        if spec is None:
+            return None
+        return self._live_job(spec)
+
+    def _live_job(self, spec):
+        lease = _read_json(self._path('leases', f"{spec['job_id']}.lease"))
+        return SpoolJob(self, spec, RUNNING if lease else QUEUED, lease=lease)
+
+    def latest_for_reel(self, reel_id):
+        pointer = _read_json(self._path('reels', f"{reel_id}.json"))
+        return self.get(pointer['job_id']) if pointer else None
+
+    def jobs(self):
+        jobs = [self._live_job(spec) for _, spec in self._queued()]
+        for name in _listdir(os.path.join(self.folder, 'done')):
+            record = _read_json(self._path('done', name))
+            if record is not None:
+                jobs.append(SpoolJob(self, record['spec'], record['state'], record=record))
+        return jobs
+
+    def in_flight_reels(self):
+        """Reel IDs that still have a queued or running job"""
+        return {spec['reel_id'] for _, spec in self._queued()}
+
+    def progress(self, job_id):
+        return _read_json(self._path('progress', f"{job_id}.json"))
+
+    def claim(self, worker_id):
+        """Lease the oldest unclaimed job; returns its (queue path, spec) or None"""
+        for path, spec in self._queued():
+            lease_path = self._path('leases', f"{spec['job_id']}.lease")
+            if os.path.exists(lease_path):
+                continue
+            try:
+                fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue  # Another worker got there first
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'worker': worker_id, 'started_at': datetime.now().isoformat()}, f)
+            # The job may have finished between listing and leasing
+            if os.path.exists(self._path('done', f"{spec['job_id']}.json")) or not os.path.exists(path):
+                _remove(lease_path)
+                continue
+            return path, spec
+        return None
+
+    def heartbeat(self, job_id, worker_id, progress=None):
+        """Renew the lease; returns False if it expired and the job went to another worker"""
+        lease_path = self._path('leases', f"{job_id}.lease")
+        lease = _read_json(lease_path)
+        if lease is None or lease.get('worker') != worker_id:
+            return False
+        os.utime(lease_path, None)
+        if progress is not None:
+            _write_json(self._path('progress', f"{job_id}.json"), progress)
+        return True
+
+    def finish(self, path, spec, worker_id, started_at, result=None, error=None):
+        """Record the outcome; the done record is written before the lease goes, so no one re-claims it"""
+        job_id = spec['job_id']
+        _write_json(self._path('done', f"{job_id}.json"), {
+            'spec': spec,
+            'state': FAILED if error else DONE,
+            'result': result,
+            'error': error,
+            'worker': worker_id,
+            'started_at': started_at.isoformat() if started_at else None,
+            'finished_at': datetime.now().isoformat(),
+        })
+        _remove(path)
+        _remove(self._path('progress', f"{job_id}.json"))
+        _remove(self._path('leases', f"{job_id}.lease"))
+
+    def release(self, job_id):
+        """Give up a lease without finishing, so another worker can pick the job up right away"""
+        _remove(self._path('leases', f"{job_id}.lease"))
+
+    def reap(self):
+        """Re-queue jobs whose lease expired, fail those out of attempts, forget old outcomes"""
+        now = time.time()
+        for name in _listdir(os.path.join(self.folder, 'queue')):
+            job_id = name[:-len('.json')].rsplit('-', 1)[-1]
+            if os.path.exists(self._path('done', f"{job_id}.json")):
+                _remove(self._path('queue', name))  # Finished while being re-queued
+
+        for name in _listdir(os.path.join(self.folder, 'leases')):
+            if not name.endswith('.lease'):
+                continue
+            lease_path = self._path('leases', name)
+            try:
+                if now - os.stat(lease_path).st_mtime <= self.lease_seconds:
+                    continue
+                expired_path = f"{lease_path}.{uuid.uuid4().hex}.expired"
+                os.rename(lease_path, expired_path)  # Only one reaper wins this
+            except FileNotFoundError:
+                continue
+            lease = _read_json(expired_path) or {}
+            _remove(expired_path)
+
+            job_id = name[:-len('.lease')]
+            path = self._queue_path(job_id)
+            if path is None:
+                continue
+            # Move the queue file aside before touching it: if the old worker's finish()
+            # removed it meanwhile the rename fails, and nothing is written back
+            reaped_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            try:
+                os.rename(path, reaped_path)
+            except FileNotFoundError:
+                continue
+            spec = _read_json(reaped_path)
+            if spec is None or os.path.exists(self._path('done', f"{job_id}.json")):
+                _remove(reaped_path)
+                continue
+            spec['attempts'] = spec.get('attempts', 0) + 1
+            if spec['attempts'] >= self.max_attempts:
+                print(f"❌ Job {job_id} lost its worker {spec['attempts']} times, giving up")
+                self.finish(reaped_path, spec, lease.get('worker'), _parse_time(lease.get('started_at')),
+                            error=f"Worker stopped responding ({spec['attempts']} attempts)")
+            else:
+                _write_json(reaped_path, spec)
+                os.rename(reaped_path, path)
+                print(f"♻️ Lease of job {job_id} on {lease.get('worker')} expired, re-queued")
+
+        cutoff = datetime.now() - self.retention
+        for name in _listdir(os.path.join(self.folder, 'done')):
+            record = _read_json(self._path('done', name))
+            if record is not None and _parse_time(record['finished_at']) < cutoff:
+                _remove(self._path('done', name))
+                pointer_path = self._path('reels', f"{record['spec']['reel_id']}.json")
+                if (_read_json(pointer_path) or {}).get('job_id') == record['spec']['job_id']:
+                    _remove(pointer_path)
+
+
+class _WorkerJob:
+    """What current_job() returns inside a spooled job, so the job body can attach its progress"""
+
+    def __init__(self, job_id, reel_id, kind):
+        self.job_id = job_id
+        self.reel_id = reel_id
+        self.kind = kind
+        self.progress = None
+
+
+class SpoolWorker:
+    """Claims spooled jobs one at a time and runs handler(reel_id, kind, payload) for each"""
+
+    def __init__(self, queue, handler, heartbeat_seconds=2, poll_seconds=1, worker_id=None):
+        self.queue = queue
+        self.handler = handler
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_seconds = poll_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        print(f"👷 Worker {self.worker_id} polling {self.queue.folder}")
+        while not self._stop.is_set():
+            try:
+                self.queue.reap()
+                claimed = self.queue.claim(self.worker_id)
+            except Exception as e:
+                print(f"❌ Spool scan failed: {e}")
+                claimed = None
+            if claimed is None:
+                self._stop.wait(self.poll_seconds)
+                continue
+            self.run_job(*claimed)
+
+    def run_job(self, path, spec):
+        job = _WorkerJob(spec['job_id'], spec['reel_id'], spec['kind'])
+        started_at = datetime.now()
+        lost = threading.Event()
+        finished = threading.Event()
+
+        def beat():
+            while not finished.wait(self.heartbeat_seconds):
+                snapshot = job.progress.snapshot() if job.progress else None
+                try:
+                    if not self.queue.heartbeat(job.job_id, self.worker_id, snapshot):
+                        # Stop rendering at the next progress report: FFmpeg is killed
+                        # and nothing more is published over the new owner's files
+                        lost.set()
+                        if job.progress is not None:
+                            job.progress.cancel()
+                        return
+                except OSError as e:
+                    print(f"⚠️ Heartbeat for job {job.job_id} failed: {e}")
+
+        heartbeat = threading.Thread(target=beat, name=f"heartbeat-{job.job_id[:8]}", daemon=True)
+        heartbeat.start()
+        print(f"🏗️ {self.worker_id} running {job.kind} job {job.job_id} for reel {job.reel_id}")
+        result, error = None, None
+        try:
+            with running_job(job):
+                result = self.handler(job.reel_id, job.kind, spec['payload'])
+        except KeyboardInterrupt:
+            finished.set()
+            self.queue.release(job.job_id)
+            raise
+        except Exception as e:
+            error = str(e)
+            if not lost.is_set():  # A lost run was cancelled on purpose
+                print(f"❌ Job {job.job_id} failed: {e}")
+                print(traceback.format_exc())
+        finally:
+            finished.set()
+            heartbeat.join()
+
+        if lost.is_set():
+            # Another worker owns the job now; its outcome is the one that counts
+            print(f"⚠️ Lost the lease of job {job.job_id}, discarding this run")
+            return
+        self.queue.finish(path, spec, self.worker_id, started_at, result=result, error=error)
+        if error is None:
+            print(f"✅ Job {job.job_id} done")
@@ -0,0 +1,228 @@
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import ffmpeg
+import requests
+from requests.adapters import HTTPAdapter
+from mutagen.mp3 import MP3
+
+SENTENCE_END_RE = re.compile(r'(?<=[.!?…])\s+')
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class ElevenLabsError(Exception):
+    """ElevenLabs answered, but not with audio"""
+
+
+def get_session(pool_size=4):
+    """Process-wide keep-alive session so chunk requests reuse TLS connections"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+class ElevenLabsClient:
+    def __init__(self, api_key, voice_id, voice_settings, base_url='https://api.elevenlabs.io',
+                 timeout=30, session=None):
+        self.api_key = api_key
+        self.voice_id = voice_id
+        self.voice_settings = voice_settings
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = session or get_session()
+
+    def synthesize(self, text, output_path):
+        """POST one piece of text and stream the MP3 response to output_path"""
+        response = self.session.post(
+            f"{self.base_url}/v1/text-to-speech/{self.voice_id}",
+            headers={
+                "xi-api-key": self.api_key,
+                "Content-Type": "application/json"
+            },
+            json={
+                "text": text,
+                "voice_settings": self.voice_settings
+            },
+            timeout=self.timeout,
+            stream=True
+        )
+        with response:
+            if response.status_code != 200:
+                raise ElevenLabsError(f"ElevenLabs returned HTTP {response.status_code}")
+            with open(output_path, 'wb') as f:
+                for block in response.iter_content(chunk_size=64 * 1024):
+                    f.write(block)
+
+
+def split_text(text, max_chars=400):
+    """Split text into chunks of whole sentences, each at most max_chars where possible"""
+    chunks = []
+    current = ''
+    for sentence in SENTENCE_END_RE.split(text.strip()):
+        # A single over-long sentence is split at word boundaries
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                chunks.append(current)
+                current = ''
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return [chunk for chunk in chunks if chunk]
+
+
+def synthesize_chunks(chunks, output_path, synthesize, fallback=None, workers=4):
+    """Synthesize chunks concurrently and join them into output_path.
+
+    synthesize(text, path) produces one chunk; if it raises and a fallback
+    is given, only that chunk is redone with fallback(text, path). Returns
+    the provider used per chunk ('primary' or 'fallback').
+    """
+    chunk_folder = f"{output_path}.chunks"
+    os.makedirs(chunk_folder, exist_ok=True)
+
+    def run(item):
+        idx, text = item
+        path = os.path.join(chunk_folder, f"chunk_{idx:04d}.mp3")
+        try:
+            synthesize(text, path)
+            return path, 'primary'
+        except Exception as e:
+            if fallback is None:
+                raise
+            print(f"⚠️ TTS chunk {idx + 1}/{len(chunks)} failed ({e}), using fallback")
+            fallback(text, path)
+            return path, 'fallback'
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tts') as executor:
+            results = list(executor.map(run, enumerate(chunks)))
+        join_mp3([path for path, _ in results], output_path)
+    finally:
+        shutil.rmtree(chunk_folder, ignore_errors=True)
+
+    providers = [provider for _, provider in results]
+    print(f"🗣️ Synthesized {len(chunks)} chunks ({providers.count('fallback')} via fallback)")
+    return providers
+
+
+def _strip_id3(data):
+    """MPEG audio frames of an MP3 file, without ID3v2 header or ID3v1 trailer"""
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = ((data[6] & 0x7F) << 21) | ((data[7] & 0x7F) << 14) | ((data[8] & 0x7F) << 7) | (data[9] & 0x7F)
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+    if len(data) >= 128 and data[-128:-125] == b'TAG':
+        data = data[:-128]
+    return data
+
+
+# Layer III bitrates (kbps) by bitrate index, and sample rates by MPEG version
+_MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {
+    1: (44100, 48000, 32000),
+    2: (22050, 24000, 16000),
+    2.5: (11025, 12000, 8000),
+}
+
+
+def _strip_vbr_header(data):
+    """MPEG frames without the leading Xing/Info/VBRI frame, if there is one.
+
+    That frame holds the frame count of its own file only: left in a join,
+    it makes the whole file read as long as its first part.
+    """
+    if len(data) < 4 or data[0] != 0xFF or data[1] & 0xE0 != 0xE0 or (data[1] >> 1) & 3 != 1:
+        return data  # Not a Layer III frame
+    version = {3: 1, 2: 2, 0: 2.5}.get((data[1] >> 3) & 3)
+    bitrate_idx, rate_idx = data[2] >> 4, (data[2] >> 2) & 3
+    if version is None or not 0 < bitrate_idx < 15 or rate_idx == 3:
+        return data
+    mono = data[3] >> 6 == 3
+    side_info = (17 if mono else 32) if version == 1 else (9 if mono else 17)
+    crc = 0 if data[1] & 1 else 2
+    xing_at = 4 + crc + side_info
+    if data[xing_at:xing_at + 4] not in (b'Xing', b'Info') and data[36:40] != b'VBRI':
+        return data
+    bitrate = _MP3_BITRATES[1 if version == 1 else 2][bitrate_idx] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_idx]
+    frame_length = (144 if version == 1 else 72) * bitrate // sample_rate + ((data[2] >> 1) & 1)
+    return data[frame_length:]
+
+
+def _mp3_signature(path):
+    info = MP3(path).info
+    return info.sample_rate, info.channels
+
+
+def join_mp3(paths, output_path):
+    """Concatenate MP3 files.
+
+    When every part has the same sample rate and channel layout the MPEG
+    frames are copied byte for byte (lossless), less each part's tags and
+    Xing/Info/VBRI frame, and FFmpeg stream-copies the result to write one
+    header for the whole file. Parts from different providers can differ;
+    those are re-encoded together by FFmpeg. The joined duration is checked
+    against the sum of the parts.
+    """
+    tmp_path = f"{output_path}.joining.mp3"
+    signatures = [_mp3_signature(path) for path in paths]
+    if len(set(signatures)) <= 1:
+        frames_path = f"{output_path}.frames.mp3"
+        try:
+            with open(frames_path, 'wb') as out:
+                for path in paths:
+                    with open(path, 'rb') as f:
+                        out.write(_strip_vbr_header(_strip_id3(f.read())))
+            (
+                ffmpeg.input(frames_path)
+                .output(tmp_path, c='copy')
+                .global_args('-loglevel', 'error')
+                .overwrite_output()
+                .run(capture_stdout=True, capture_stderr=True)
+            )
+        finally:
+            if os.path.exists(frames_path):
+                os.remove(frames_path)
+    else:
+        print("ℹ️ TTS chunks differ in format, re-encoding the join")
+        rate = max(rate for rate, _ in signatures)
+        layout = 'stereo' if max(channels for _, channels in signatures) > 1 else 'mono'
+        streams = [
+            ffmpeg.input(path).audio
+            .filter('aresample', rate)
+            .filter('aformat', channel_layouts=layout)
+            for path in paths
+        ]
+        (
+            ffmpeg.concat(*streams, v=0, a=1)
+            .output(tmp_path, acodec='libmp3lame', **{'q:a': 2})
+            .global_args('-loglevel', 'error')
+            .overwrite_output()
+            .run(capture_stdout=True, capture_stderr=True)
+        )
+    expected = sum(MP3(path).info.length for path in paths)
+    joined = MP3(tmp_path).info.length
+    if abs(joined - expected) > 0.05 * len(paths):  # Encoder delay and padding: about a frame per part
+        os.remove(tmp_path)
+        raise RuntimeError(f"Joined speech is {joined:.2f}s long, its {len(paths)} parts add up to {expected:.2f}s")
+    os.replace(tmp_path, output_path)
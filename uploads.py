@@ -0,0 +1,248 @@
+import hashlib
+import io
+import os
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+
+CHUNK_SIZE = 64 * 1024
+IMAGE_HEADER_LIMIT = 256 * 1024  # An image header must parse within this many bytes (EXIF can be large)
+MAX_FIELD_BYTES = 1024 * 1024  # Plain form fields (text, durations)
+
+IMAGE_FORMATS = {'JPEG', 'PNG', 'GIF'}
+
+
+class UploadRejected(Exception):
+    """An uploaded part failed validation; nothing after the failing chunk was written"""
+
+
+class FilePolicy:
+    """How the parts of one multipart file field are validated and where they are stored"""
+
+    def __init__(self, kind, extensions, max_bytes, dest_fn, skip_invalid_extension=False, max_pixels=None):
+        self.kind = kind  # 'image' or 'audio'
+        self.extensions = {ext.lower() for ext in extensions}
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels  # Images only, checked from the header
+        self.dest_fn = dest_fn  # dest_fn(part_index, filename) -> path
+        self.skip_invalid_extension = skip_invalid_extension
+
+    def allows(self, filename):
+        return '.' in filename and filename.rsplit('.', 1)[1].lower() in self.extensions
+
+
+class SavedFile:
+    """A file part that passed validation and was written to disk"""
+
+    def __init__(self, field, filename, path, size, sha256, detected_format, width=None, height=None):
+        self.field = field
+        self.filename = filename
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.format = detected_format
+        self.width = width
+        self.height = height
+
+
+class UploadResult:
+    def __init__(self):
+        self.form = MultiDict()
+        self.files = MultiDict()  # field -> SavedFile
+        self.seen = {}  # field -> every filename sent, including '' for empty file inputs
+        self.skipped = []  # filenames dropped for having a disallowed extension
+        self.bytes_received = 0
+
+
+def _format_size(num_bytes):
+    if num_bytes >= 1024 * 1024:
+        return f"{num_bytes / (1024 * 1024):.0f}MB"
+    return f"{num_bytes / 1024:.0f}KB"
+
+
+def sniff_audio(head):
+    """Container format from the first bytes of an audio file, or None"""
+    if head[:3] == b'ID3' or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+        return 'mp3'
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return 'wav'
+    if head[:4] == b'OggS':
+        return 'ogg'
+    if head[4:8] == b'ftyp':
+        return 'm4a'
+    return None
+
+
+def sniff_image(head):
+    """Image format from the first bytes of a file, or None"""
+    if head[:3] == b'\xff\xd8\xff':
+        return 'JPEG'
+    if head[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'PNG'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'GIF'
+    return None
+
+
+class _PartWriter:
+    """Writes one file part to disk while hashing it and validating its header"""
+
+    SNIFF_BYTES = 12
+
+    def __init__(self, field, filename, policy, path):
+        self.field = field
+        self.filename = filename
+        self.policy = policy
+        self.path = path
+        self.size = 0
+        self.digest = hashlib.sha256()
+        self.head = bytearray()
+        self.format = None
+        self.dimensions = None
+        self.validated = False
+        self.file = open(path, 'wb')
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.policy.max_bytes:
+            raise UploadRejected(f"{self.filename} is larger than the "
+                                 f"{_format_size(self.policy.max_bytes)} limit")
+        if not self.validated:
+            self.head += data
+            self._validate(final=False)
+        self.digest.update(data)
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+        if self.size == 0:
+            raise UploadRejected(f"{self.filename} is empty")
+        if not self.validated:
+            self._validate(final=True)
+        return SavedFile(self.field, self.filename, self.path, self.size,
+                         self.digest.hexdigest(), self.format,
+                         *(self.dimensions or (None, None)))
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _validate(self, final):
+        if len(self.head) < self.SNIFF_BYTES and not final:
+            return
+
+        if self.policy.kind == 'audio':
+            self.format = sniff_audio(bytes(self.head[:self.SNIFF_BYTES]))
+            if self.format is None:
+                raise UploadRejected(f"{self.filename} is not a supported audio file")
+            self._done_validating()
+            return
+
+        if self.format is None:
+            self.format = sniff_image(bytes(self.head[:self.SNIFF_BYTES]))
+            if self.format is None:
+                raise UploadRejected(f"{self.filename} is not a JPG, PNG or GIF image")
+
+        from PIL import Image
+        # Header-only parse: Image.open does not decode pixel data
+        try:
+            with Image.open(io.BytesIO(self.head)) as img:
+                if img.format not in IMAGE_FORMATS:
+                    raise UploadRejected(f"{self.filename} is not a JPG, PNG or GIF image")
+                self.dimensions = img.size
+            if self.policy.max_pixels and img.width * img.height > self.policy.max_pixels:
+                raise UploadRejected(f"{self.filename} is {img.width}x{img.height}, over the "
+                                     f"{self.policy.max_pixels / 1e6:.0f} megapixel limit")
+        except UploadRejected:
+            raise
+        except Exception:
+            if final or len(self.head) >= IMAGE_HEADER_LIMIT:
+                raise UploadRejected(f"{self.filename} is not a valid image")
+            return
+        self._done_validating()
+
+    def _done_validating(self):
+        self.validated = True
+        self.head = bytearray()
+
+
+def receive_upload(stream, content_type, policies):
+    """Parse a multipart/form-data body chunk by chunk, streaming file parts to disk.
+
+    Each file part is hashed and its magic bytes and header are checked as
+    soon as enough of it has arrived; a bad part raises UploadRejected
+    right away, before the rest of the body is read. File fields without a
+    policy are ignored. On rejection, files already written are removed.
+    """
+    mimetype, options = parse_options_header(content_type or '')
+    if mimetype != 'multipart/form-data' or 'boundary' not in options:
+        raise UploadRejected('Expected a multipart/form-data upload')
+
+    decoder = MultipartDecoder(options['boundary'].encode('latin-1'))
+    result = UploadResult()
+    part_counts = {}
+    current = None  # _PartWriter, bytearray (form field) or None (ignored part)
+    current_name = None
+
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            result.bytes_received += len(chunk)
+            decoder.receive_data(chunk or None)
+
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, Field):
+                    current, current_name = bytearray(), event.name
+                elif isinstance(event, File):
+                    current, current_name = _open_part(event, policies, part_counts, result), event.name
+                elif isinstance(event, Data):
+                    if isinstance(current, _PartWriter):
+                        current.write(event.data)
+                    elif isinstance(current, bytearray):
+                        current += event.data
+                        if len(current) > MAX_FIELD_BYTES:
+                            raise UploadRejected(f"Form field '{current_name}' is too large")
+                    if not event.more_data:
+                        if isinstance(current, _PartWriter):
+                            result.files.add(current_name, current.close())
+                        elif isinstance(current, bytearray):
+                            result.form.add(current_name, current.decode('utf-8', errors='replace'))
+                        current = None
+                event = decoder.next_event()
+
+            if isinstance(event, Epilogue) or not chunk:
+                break
+    except Exception as e:
+        if isinstance(current, _PartWriter):
+            current.abort()
+        for _, saved in result.files.items(multi=True):
+            if os.path.exists(saved.path):
+                os.remove(saved.path)
+        if isinstance(e, ValueError):
+            # MultipartDecoder's complaint about a malformed or truncated body
+            raise UploadRejected(f"Malformed upload: {e}")
+        raise
+
+    if isinstance(current, _PartWriter):
+        current.abort()
+        raise UploadRejected('Upload ended before the last file was complete')
+    return result
+
+
+def _open_part(event, policies, part_counts, result):
+    index = part_counts.get(event.name, 0)
+    part_counts[event.name] = index + 1
+    result.seen.setdefault(event.name, []).append(event.filename)
+
+    policy = policies.get(event.name)
+    if policy is None or event.filename == '':
+        return None
+    if not policy.allows(event.filename):
+        if policy.skip_invalid_extension:
+            print(f"Skipping invalid file: {event.filename}")
+            result.skipped.append(event.filename)
+            return None
+        raise UploadRejected(f"Invalid {policy.kind} file type")
+    return _PartWriter(event.name, event.filename, policy, policy.dest_fn(index, event.filename))
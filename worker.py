@@ -0,0 +1,77 @@
+"""Render worker processes for RENDER_MODE=spool.
+
+Run on any host that mounts the spool, upload, stage and output folders at
+the same paths as the web nodes (start it from the app folder):
+
+    RENDER_MODE=spool python worker.py --processes 4
+
+Each process renders one job at a time; by default a host starts as many
+as it has encode slots (see governor.py), and workers claim drafts first. Stopping a worker (Ctrl+C or
+SIGTERM) releases its current job for another worker; a worker that dies
+outright loses its lease after SPOOL_LEASE_SECONDS and the job is re-queued.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+
+
+def work(index):
+    # Imported in the child, so every process has its own pools and caches
+    import app as reel_app
+    from spool import SpoolWorker
+
+    # The janitor runs once per deployment, in the web app, not in every worker
+    reel_app.create_app(start_janitor=False)
+
+    worker = SpoolWorker(reel_app.render_queue, reel_app.run_spooled_job,
+                         heartbeat_seconds=reel_app.app.config['SPOOL_HEARTBEAT_SECONDS'],
+                         poll_seconds=reel_app.app.config['SPOOL_POLL_SECONDS'])
+
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, interrupt)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        print(f"👋 Worker {worker.worker_id} stopped")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render jobs from the shared spool folder")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="Worker processes to start on this host (default: its encode slots)")
+    args = parser.parse_args(argv)
+    if args.processes is None:
+        from config import Config
+        from governor import encode_slots, physical_memory
+        args.processes = Config.MAX_CONCURRENT_ENCODES or encode_slots(
+            os.cpu_count() or 1, Config.ENCODE_THREADS, physical_memory(), Config.ENCODE_MEMORY_BYTES)
+
+    if os.getenv('RENDER_MODE', 'local') != 'spool':
+        print("❌ Workers only run with RENDER_MODE=spool (set it for the web nodes too)")
+        return 2
+    if args.processes == 1:
+        work(0)
+        return 0
+
+    processes = [multiprocessing.Process(target=work, args=(idx,), name=f"render-worker-{idx}")
+                 for idx in range(max(1, args.processes))]
+    for process in processes:
+        process.start()
+    # Pass a SIGTERM on, so each child releases its job before exiting
+    signal.signal(signal.SIGTERM, lambda signum, frame: [process.terminate() for process in processes])
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Children got the Ctrl+C too; wait for them to release their jobs
+        for process in processes:
+            process.join()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())